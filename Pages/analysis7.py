@@ -1,10 +1,8 @@
-from longsea import al
-from openpyxl import load_workbook
 import streamlit as st
 import pandas as pd
 import time
 import os
-from longsea import al2
+from longsea import al2, perf
 from longsea.al2 import wb_to_bytesIO, df_sort, validate_dataframe
 
 txt_A = '''
@@ -75,6 +73,9 @@ st.sidebar.write(txt_A)
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 创建一个上传文件的按钮
 uploaded_file = st.file_uploader("上传XLSX文件", type=["xlsx"])
+# 性能统计:勾选后记录计算、注入、保存等环节的用时,在页面底部显示统计表.
+profile = bool(uploaded_file) and st.sidebar.checkbox("显示用时统计")
+profile_memory = profile and st.sidebar.checkbox("统计内存峰值(较慢)")
 
 # 提示上传文件
 if not uploaded_file:
@@ -83,16 +84,17 @@ if not uploaded_file:
 elif uploaded_file:
     col_A, col_B = st.columns(2)
     with col_A:
-        dic_df = pd.read_excel(uploaded_file, engine='openpyxl', sheet_name=None)       # 读取所有工作表。
-        selected_sheet_name = st.selectbox("选择工作表", list(dic_df.keys()))
-        df = dic_df[selected_sheet_name]
+        # 按上传文件内容哈希缓存解析结果,拖动滑动条等操作重新运行页面时不会重新解析xlsx;
+        # 设置了环境变量LONGSEA_CACHE_DIR时,转换后的成绩表另存为Parquet缓存(有容量上限),再次上传同一文件时也不解析xlsx.
+        digest = al2.file_digest(uploaded_file)
+        selected_sheet_name = st.selectbox("选择工作表", al2.get_sheet_names(uploaded_file))
+        df = al2.load_sheet(uploaded_file, selected_sheet_name, digest=digest)
         # 添加一个滑动条,用于选择统计学科成绩时,计算的班级学生数.
         max_sbj_cls_rank = st.slider('两率一平参评人数', min_value=1, max_value=60, value=45)
     with  col_B:
         try:
-            dic_mb_df = pd.read_excel(mb_file_path, engine='openpyxl', sheet_name=None)
-            sht_MB_name = st.selectbox("选择模板", list(dic_mb_df.keys()))
-            mb_df = dic_mb_df[sht_MB_name]
+            # 只读取模板的工作表名称,不解析单元格数据.
+            sht_MB_name = st.selectbox("选择模板", al2.get_sheet_names(mb_file_path))
         except FileNotFoundError:
             st.error("找不到 test.xlsx 文件，请确保文件存在于当前目录中")
         except Exception as e:
@@ -103,12 +105,13 @@ elif uploaded_file:
 
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
     if st.checkbox("检查/显示数据"):
-        vdf = validate_dataframe( df, required_columns=['班级', '姓名', '学号'], allow_extra_columns=False)
+        # 检查原始数据(缺考等非数值成绩未转换).
+        vdf = validate_dataframe( al2.read_sheet(uploaded_file, selected_sheet_name, digest=digest), required_columns=['班级', '姓名', '学号'], allow_extra_columns=False)
         st.dataframe(vdf,use_container_width= True)
-        adf = al2.Andf(df)
+        adf = al2.get_andf(uploaded_file, selected_sheet_name, digest=digest)
     else:
         st.dataframe(df.head(2),use_container_width= True)
-        adf = al2.Andf(df)
+        adf = al2.get_andf(uploaded_file, selected_sheet_name, digest=digest)
 
 
 start = time.time()
@@ -122,8 +125,10 @@ dic_fsd = {(48, 60, 72, 84, 96, 108, 120): ["语文", "数学", "英语"],
 fsd_thresh_score = [1,2,6,7,8,9,10]
 
 # 获取分数段_达标报表
-fsd_dfs = adf.get_fsd(dic_thresh_sbj = dic_fsd,
-                      thresh_score = fsd_thresh_score,  )
+plan = [dict(name = "fsd_dfs",
+             report = "fsd",
+             dic_thresh_sbj = dic_fsd,
+             thresh_score = fsd_thresh_score,  )]
 
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   获取两率一平报表（lv_dfs）     ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -135,11 +140,12 @@ dic_lv = {120: ["语文", "数学", "英语"],
 # 班级参评人数由滑动条控制:max_sbj_cls_rank。
 
 # 获取两率一平报表
-lv_dfs = adf.get_lv(
-    dic_total_sbj = dic_lv,
-    max_class_rank=max_sbj_cls_rank,
-    include_count_valid=1,
-    add_rank_cols=[2,4,5],    )
+plan.append(dict(name = "lv_dfs",
+                 report = "lv",
+                 dic_total_sbj = dic_lv,
+                 max_class_rank=max_sbj_cls_rank,
+                 include_count_valid=1,
+                 add_rank_cols=[2,4,5],    ))
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   获取班级分析报表（bj_dfs）     ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -149,61 +155,79 @@ thresh_cls = [0, 10, 50, 100, 150, 200, 260, 300, 350, 400]      # 各个名次
 thresh_cls_score = [10, 10, 10, 10, 8, 6, 2, 1.5, 1, 1]          # 各个名次段的积分
 # 班级参评人数由滑动条控置:max_cls_rank。
 
-bj1_dfs = adf.get_cls(thresh=thresh_cls,
-                     thresh_score=thresh_cls_score,
-                     max_class_rank=max_cls_rank)
-bj0_dfs = adf.get_cls(thresh=thresh_cls,
-                     thresh_score=None,
-                     max_class_rank=max_cls_rank,
-                     cumu=1     )
-
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# B:选择模板文件ws,将分析报表注入工作表ws中.
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 打开模板文件。
-wb = load_workbook(mb_file_path)  # 模板文件.
-# 清洗工作簿wb,保存工作簿wb与模板工作表ws,
-wb,ws = al.trim_wb(wb,sht_MB_name)
-
-# 将各类报表数据注入工作表
-# 分数段报表
-al2.dfs_to_ws(ws, 5, 4, list(fsd_dfs.values()), 16, 0, False, idx=False)
-# 两率一平报表
-al2.dfs_to_ws(ws, 5, 14, list(lv_dfs.values()), 16, 0, False, idx=False)
-# 班级分析报表(积分版)
-al2.dfs_to_ws(ws, 149, 4, bj1_dfs, 16, 0, False, idx=False)
-# 班级分析报表(累计版)
-al2.dfs_to_ws(ws, 149, 17, bj0_dfs, 16, 0, False, idx=False)
-
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# C:选择模板,创建工作表,将成绩表、名次表注入工作薄中.
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 在模板文件中新建名次表ws1.
-ws1 = wb.create_sheet("名次表",1)
-# 获取名次表,并将数据注入ws1表中。
-df_MC0 = adf.get_mc(combine_ranks=0)
-df_MC0 = df_sort(df_MC0,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
-al2.dfs_to_ws(ws1,1,1,df_MC0,hd=True)
-
-# ==============================================================================================
-# 在模板文件中新建成绩表ws2.
-ws2 = wb.create_sheet("成绩表",1)
-# 获取名次表,并将数据注入ws1表中。
-df_all = adf.get_all()
-df_all = df_sort(df_all,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
-al2.dfs_to_ws(ws2,1,1,df_all,hd=True)
-
-
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# C:添加一个下载按钮
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 添加时间信息。
-st.success(f"运算己经完成，共用时：{round(time.time() - start, 2)}秒。")
+plan.append(dict(name="bj1_dfs",
+                 report="cls",
+                 thresh=thresh_cls,
+                 thresh_score=thresh_cls_score,
+                 max_class_rank=max_cls_rank))
+plan.append(dict(name="bj0_dfs",
+                 report="cls",
+                 thresh=thresh_cls,
+                 thresh_score=None,
+                 max_class_rank=max_cls_rank,
+                 cumu=1     ))
+
+# 计算、注入与保存在统计会话中运行:运行结束或被控件变化中断时都会关闭统计(及tracemalloc).
+with perf.session(profile, memory=profile_memory):
+    # 按报表计划一次生成全部报表,报表之间共用Andf缓存的全部学生表、班级分组与名次阶梯.
+    reports = adf.build_reports(plan)
+    fsd_dfs, lv_dfs = reports["fsd_dfs"], reports["lv_dfs"]
+    bj1_dfs, bj0_dfs = reports["bj1_dfs"], reports["bj0_dfs"]
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # B:选择模板文件ws,将分析报表注入工作表ws中.
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 打开模板文件。
+    # 从模板池获取只保留模板工作表的工作簿wb与模板工作表ws(模板只解析一次,每次运行得到新的副本).
+    with perf.stage("模板注入"):
+        wb,ws = al2.load_template(mb_file_path,sht_MB_name)
+
+        # 将各类报表数据注入工作表
+        # 分数段报表
+        al2.dfs_to_ws(ws, 5, 4, list(fsd_dfs.values()), 16, 0, False, idx=False)
+        # 两率一平报表
+        al2.dfs_to_ws(ws, 5, 14, list(lv_dfs.values()), 16, 0, False, idx=False)
+        # 班级分析报表(积分版)
+        al2.dfs_to_ws(ws, 149, 4, bj1_dfs, 16, 0, False, idx=False)
+        # 班级分析报表(累计版)
+        al2.dfs_to_ws(ws, 149, 17, bj0_dfs, 16, 0, False, idx=False)
+
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # C:选择模板,创建工作表,将成绩表、名次表注入工作薄中.
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    with perf.stage("名次表、成绩表"):
+        # 在模板文件中新建名次表,数据在保存工作簿时流式写入.
+        wb.create_sheet("名次表",1)
+        # 获取名次表。
+        df_MC0 = adf.get_mc(combine_ranks=0)
+        df_MC0 = df_sort(df_MC0,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
+
+        # ==============================================================================================
+        # 在模板文件中新建成绩表,数据在保存工作簿时流式写入.
+        wb.create_sheet("成绩表",1)
+        # 获取成绩表。
+        df_all = adf.get_all()
+        df_all = df_sort(df_all,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
+
+
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # C:添加一个下载按钮
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 保存工作簿,同时写入名次表、成绩表.
+    with perf.stage("保存工作簿"):
+        data = wb_to_bytesIO(wb, data_sheets={"名次表": df_MC0, "成绩表": df_all})
+    # 添加时间信息:开启用时统计时以折叠框显示各环节的用时统计,否则只显示总用时.
+    if perf.is_enabled():
+        perf.st_expander()
+    else:
+        st.success(f"运算己经完成，共用时：{round(time.time() - start, 2)}秒。")
 # 创建下载按钮,以便下载此工作簿
 st.download_button(
     label='📥下载分析结果',
     type= 'primary',
-    data=wb_to_bytesIO(wb),
+    data=data,
     file_name=os.path.splitext(uploaded_file.name)[0] + "_" + sht_MB_name + "_报表" + ".xlsx",
     mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
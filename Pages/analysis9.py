@@ -1,10 +1,8 @@
-from longsea import al
-from openpyxl import load_workbook
 import streamlit as st
 import pandas as pd
 import time
 import os
-from longsea import al2
+from longsea import al2, perf
 from longsea.al2 import wb_to_bytesIO, df_sort, validate_dataframe
 
 txt_A = '''
@@ -78,6 +76,9 @@ st.sidebar.write(txt_A)
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 创建一个上传文件的按钮
 uploaded_file = st.file_uploader("上传XLSX文件", type=["xlsx"])
+# 性能统计:勾选后记录计算、注入、保存等环节的用时,在页面底部显示统计表.
+profile = bool(uploaded_file) and st.sidebar.checkbox("显示用时统计")
+profile_memory = profile and st.sidebar.checkbox("统计内存峰值(较慢)")
 
 # 提示上传文件
 if not uploaded_file:
@@ -86,16 +87,17 @@ if not uploaded_file:
 elif uploaded_file:
     col_A, col_B = st.columns(2)
     with col_A:
-        dic_df = pd.read_excel(uploaded_file, engine='openpyxl', sheet_name=None)       # 读取所有工作表。
-        selected_sheet_name = st.selectbox("选择工作表", list(dic_df.keys()))
-        df = dic_df[selected_sheet_name]
+        # 按上传文件内容哈希缓存解析结果,拖动滑动条等操作重新运行页面时不会重新解析xlsx;
+        # 设置了环境变量LONGSEA_CACHE_DIR时,转换后的成绩表另存为Parquet缓存(有容量上限),再次上传同一文件时也不解析xlsx.
+        digest = al2.file_digest(uploaded_file)
+        selected_sheet_name = st.selectbox("选择工作表", al2.get_sheet_names(uploaded_file))
+        df = al2.load_sheet(uploaded_file, selected_sheet_name, digest=digest)
         # 添加一个滑动条,用于选择统计学科成绩时,计算的班级学生数.
         max_class_rank = st.slider('两率一平参评人数', min_value=1, max_value=60, value=45)
     with  col_B:
         try:
-            dic_mb_df = pd.read_excel(mb_file_path, engine='openpyxl', sheet_name=None)
-            sht_MB_name = st.selectbox("选择模板", list(dic_mb_df.keys()))
-            mb_df = dic_mb_df[sht_MB_name]
+            # 只读取模板的工作表名称,不解析单元格数据.
+            sht_MB_name = st.selectbox("选择模板", al2.get_sheet_names(mb_file_path))
         except FileNotFoundError:
             st.error("找不到 test.xlsx 文件，请确保文件存在于当前目录中")
         except Exception as e:
@@ -107,12 +109,13 @@ elif uploaded_file:
     # else:
     #     st.dataframe(df.head(2),use_container_width= True)
     if st.checkbox("检查/显示数据"):
-        vdf = validate_dataframe( df, required_columns=['班级', '姓名', '学号'], allow_extra_columns=False)
+        # 检查原始数据(缺考等非数值成绩未转换).
+        vdf = validate_dataframe( al2.read_sheet(uploaded_file, selected_sheet_name, digest=digest), required_columns=['班级', '姓名', '学号'], allow_extra_columns=False)
         st.dataframe(vdf,use_container_width= True)
-        adf = al2.Andf(df)
+        adf = al2.get_andf(uploaded_file, selected_sheet_name, digest=digest)
     else:
         st.dataframe(df.head(2),use_container_width= True)
-        adf = al2.Andf(df)
+        adf = al2.get_andf(uploaded_file, selected_sheet_name, digest=digest)
 
 start = time.time()
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   未启用报表(占位)  ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -133,10 +136,11 @@ max_total_rank = 240
 
 # -----------------------------------------------------------------------------------------
 
-sdb_dfs = adf.get_sdb(
-    thresh = mcd_thresh_ls,
-    thresh_score = mcd_thresh_score,
-    max_total_rank = max_total_rank )
+plan = [dict(name = "sdb_dfs",
+             report = "sdb",
+             thresh = mcd_thresh_ls,
+             thresh_score = mcd_thresh_score,
+             max_total_rank = max_total_rank )]
 
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■       获取两率一平报表(lv_dfs)        ■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -148,11 +152,12 @@ dic_lv = {120: ["语文", "数学", "英语"],
 # 班级参评人数由滑动条控制:max_class_rank。
 # -----------------------------------------------------------------------------------------
 
-lv_dfs = adf.get_lv(
-    dic_total_sbj = dic_lv,
-    thresh =[0.6,0.8],
-    include_count_valid=-1,
-    max_class_rank=max_class_rank )
+plan.append(dict(name = "lv_dfs",
+                 report = "lv",
+                 dic_total_sbj = dic_lv,
+                 thresh =[0.6,0.8],
+                 include_count_valid=-1,
+                 max_class_rank=max_class_rank ))
 
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■         获取班级报表(bj_dfs)         ■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -164,58 +169,77 @@ thresh_cls_score = [10, 10, 10, 10, 8, 6, 1, 1, 1, 1]          # 各个名次段
 # 班级参评人数由滑动条控置:max_cls_rank。
 # -----------------------------------------------------------------------------------------
 
-bj_dfs = adf.get_cls(thresh=thresh_cls,
-                     thresh_score=thresh_cls_score,
-                     max_class_rank=max_cls_rank)
+plan.append(dict(name="bj_dfs",
+                 report="cls",
+                 thresh=thresh_cls,
+                 thresh_score=thresh_cls_score,
+                 max_class_rank=max_cls_rank))
 
-bj1_dfs = adf.get_cls(thresh=thresh_cls,
-                      max_class_rank=max_cls_rank,
-                      cumu=1 )
+plan.append(dict(name="bj1_dfs",
+                 report="cls",
+                 thresh=thresh_cls,
+                 max_class_rank=max_cls_rank,
+                 cumu=1 ))
 
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# B:选择模板文件ws,将分析报表注入工作表ws中.
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 打开模板文件。
-wb = load_workbook(mb_file_path)  # 模板文件.
-# 清洗工作簿wb,保存工作簿wb与模板工作表ws,
-wb,ws = al.trim_wb(wb,sht_MB_name)
-
-# 将双达标报表注入ws表中.
-al2.dfs_to_ws(ws,5,4,sdb_dfs.values(),16,0,False,idx=False)
-# 将两率一平报表注入ws表中.
-al2.dfs_to_ws(ws,5,12,lv_dfs.values(),16,0,False,idx=False)
-# 将班级报表注入ws表中.
-al2.dfs_to_ws(ws,133,4,bj_dfs,16,0,False,idx=False)
-al2.dfs_to_ws(ws,143,7,bj1_dfs,16,0,False,idx=False)
-
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# C:选择模板,创建工作表,将成绩表、名次表注入工作薄中.
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 在模板文件中新建名次表ws1.
-ws1 = wb.create_sheet("名次表",1)
-# 获取名次表,并将数据注入ws1表中。
-df_MC0 = adf.get_mc(combine_ranks=0)
-df_MC0 = df_sort(df_MC0,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
-al2.dfs_to_ws(ws1,1,1,df_MC0,hd=True)
-
-# ==============================================================================================
-# 在模板文件中新建成绩表ws2.
-ws2 = wb.create_sheet("成绩表",1)
-# 获取名次表,并将数据注入ws1表中。
-df_all = adf.get_all()
-df_all = df_sort(df_all,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
-al2.dfs_to_ws(ws2,1,1,df_all,hd=True)
-
-
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# C:添加一个下载按钮
-# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
-# 添加时间信息。
-st.success(f"运算己经完成，共用时：{round(time.time() - start, 2)}秒。")
+# -----------------------------------------------------------------------------------------
+# 计算、注入与保存在统计会话中运行:运行结束或被控件变化中断时都会关闭统计(及tracemalloc).
+with perf.session(profile, memory=profile_memory):
+    # 按报表计划一次生成全部报表,报表之间共用Andf缓存的全部学生表、班级分组与名次阶梯.
+    reports = adf.build_reports(plan)
+    sdb_dfs, lv_dfs = reports["sdb_dfs"], reports["lv_dfs"]
+    bj_dfs, bj1_dfs = reports["bj_dfs"], reports["bj1_dfs"]
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # B:选择模板文件ws,将分析报表注入工作表ws中.
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 打开模板文件。
+    # 从模板池获取只保留模板工作表的工作簿wb与模板工作表ws(模板只解析一次,每次运行得到新的副本).
+    with perf.stage("模板注入"):
+        wb,ws = al2.load_template(mb_file_path,sht_MB_name)
+
+        # 将双达标报表注入ws表中.
+        al2.dfs_to_ws(ws,5,4,sdb_dfs.values(),16,0,False,idx=False)
+        # 将两率一平报表注入ws表中.
+        al2.dfs_to_ws(ws,5,12,lv_dfs.values(),16,0,False,idx=False)
+        # 将班级报表注入ws表中.
+        al2.dfs_to_ws(ws,133,4,bj_dfs,16,0,False,idx=False)
+        al2.dfs_to_ws(ws,143,7,bj1_dfs,16,0,False,idx=False)
+
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # C:选择模板,创建工作表,将成绩表、名次表注入工作薄中.
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    with perf.stage("名次表、成绩表"):
+        # 在模板文件中新建名次表,数据在保存工作簿时流式写入.
+        wb.create_sheet("名次表",1)
+        # 获取名次表。
+        df_MC0 = adf.get_mc(combine_ranks=0)
+        df_MC0 = df_sort(df_MC0,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
+
+        # ==============================================================================================
+        # 在模板文件中新建成绩表,数据在保存工作簿时流式写入.
+        wb.create_sheet("成绩表",1)
+        # 获取成绩表。
+        df_all = adf.get_all()
+        df_all = df_sort(df_all,cols=['班级','学号','姓名',"语文","数学","英语"],sort_by = ["班级","级次"])
+
+
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # C:添加一个下载按钮
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 保存工作簿,同时写入名次表、成绩表.
+    with perf.stage("保存工作簿"):
+        data = wb_to_bytesIO(wb, data_sheets={"名次表": df_MC0, "成绩表": df_all})
+    # 添加时间信息:开启用时统计时以折叠框显示各环节的用时统计,否则只显示总用时.
+    if perf.is_enabled():
+        perf.st_expander()
+    else:
+        st.success(f"运算己经完成，共用时：{round(time.time() - start, 2)}秒。")
 # 创建下载按钮,以便下载此工作簿
 st.download_button(
     label = '下载分析结果',
-    data = wb_to_bytesIO(wb),
+    data = data,
     file_name = os.path.splitext(uploaded_file.name)[0] + "_" + sht_MB_name + "_报表" + ".xlsx",
     mime = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
@@ -1,5 +1,5 @@
 import os
-from longsea import al
+from longsea import al, al2
 from openpyxl import load_workbook
 import streamlit as st
 import pandas as pd
@@ -28,7 +28,7 @@ elif up_mfile:
     dfs_dic = {file.name: pd.read_excel(file, engine='openpyxl') for file in up_mfile}
 
 # 合并多个df对象为一个df对象
-dfs_all = al.merge_multiple_dfs(dfs_dic.values(), on=['学号'], how='outer', keep_last=True)
+dfs_all = al2.merge_mult_dfs(list(dfs_dic.values()), on=['学号'], how='outer', keep_last=True)
 
 genre = st.radio(label='参照列',options=('依据《学号》列汇总', '依据《姓名》列汇总'),index=0, horizontal=True,label_visibility="collapsed")
 match genre:
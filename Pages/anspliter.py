@@ -1,5 +1,5 @@
 import os
-from longsea import al
+from longsea import al, al2
 from openpyxl import load_workbook
 import streamlit as st
 import pandas as pd
@@ -34,8 +34,8 @@ if st.checkbox(label='显示表',value= True):
 # 将年级总表按班级进行分组，生成班级数据
 gp = df.astype({'班级': 'str'}).groupby(by='班级')  # 强制转换班级列为字符串
 dfs_dic_cls = {name: ite for name, ite in gp}
-# 将分组数据保存为zip文件
-zp_cls = al.dfs_to_zip(dfs_dic_cls, format='excel')
+# 将分组数据保存为zip文件.是否并行由单元格数决定(见al2.ZIP_PARALLEL_CELLS),小表在当前进程中生成.
+zp_cls = al2.dfs_to_zip(dfs_dic_cls, format='excel', compression=zipfile.ZIP_STORED)
 
 # =================================================================================
 # 将每班数据按学科进行分组
@@ -45,13 +45,13 @@ for cls, ite in dfs_dic_cls.items():
     for sub,it in dfs.items():
         dfs_cls_sub[cls +'_'+ sub] = it
 # 将分班分学科数据保存为zip文件
-zp_cls_sub = al.dfs_to_zip(dfs_cls_sub, format='excel')
+zp_cls_sub = al2.dfs_to_zip(dfs_cls_sub, format='excel', compression=zipfile.ZIP_STORED)
 
 # ===================================================================================
 # 将年级总表按学科进行拆分，
 dfs_sub =al.df_split_column(df, ['语文', '数学', '英语','物理','化学','生物','政治','历史','地理'])
 # 将分学科数据保存为zip文件
-zp_sub = al.dfs_to_zip(dfs_sub, format='excel')
+zp_sub = al2.dfs_to_zip(dfs_sub, format='excel', compression=zipfile.ZIP_STORED)
 
 # ===================================================================================
 st.markdown("***")
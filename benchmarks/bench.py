@@ -0,0 +1,237 @@
+"""
+Andf各方法与导出环节的性能测试，结果输出为JSON，便于跟踪性能回退。
+
+在仓库根目录运行：
+    python -m benchmarks.bench                                   # 500、5千、5万、50万行，结果输出到屏幕
+    python -m benchmarks.bench --sizes 500 5000 --out bench.json
+    python -m benchmarks.bench --subjects 语文 数学 英语 物理 化学 --nan-rate 0.05 --absent-rate 0.01
+
+每个环节重复--repeat次，Andf方法每次都使用新建的Andf对象（不命中结果缓存）。
+导出环节（dfs_to_ws、wb_to_bytesIO、流式写入成绩表的wb_to_bytesIO、dfs_to_zip）只对不超过--max-export-rows行的数据运行，超过时记为跳过。
+报表参数取自longsea.batch中的内置方案（fsd取analysis7，其余取analysis9）。
+
+导入时间检查：在新的解释器中导入longsea.al2、longsea.perf，统计除numpy、pandas之外的导入用时，
+超过--import-budget秒、或加载了streamlit、openpyxl时记为不通过，命令返回1。--skip-import跳过检查。
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from benchmarks.synth import SUBJECTS, make_grades
+from longsea import al2, batch
+
+DEFAULT_SIZES = [500, 5000, 50000, 500000]
+
+# 导入时间检查：模块列表、导入预算（秒，不含numpy、pandas）与导入时不应加载的模块
+IMPORT_MODULES = ["longsea.al2", "longsea.perf"]
+IMPORT_BUDGET = 0.15
+LAZY_MODULES = ["streamlit", "openpyxl"]
+
+_IMPORT_SCRIPT = """import sys, time
+start = time.perf_counter()
+import numpy, pandas
+base = time.perf_counter() - start
+start = time.perf_counter()
+import {module}
+print(base, time.perf_counter() - start, *[name for name in {lazy!r} if name in sys.modules])
+"""
+
+
+def _plan_params(plan: List[Dict[str, Any]], name: str) -> Dict[str, Any]:
+    """从报表计划中取出一项的参数（去掉name、report）。"""
+    item = next(item for item in plan if item["name"] == name)
+    return {k: v for k, v in item.items() if k not in ("name", "report")}
+
+
+def _stages(df: pd.DataFrame, max_export_rows: int) -> Dict[str, Optional[Callable[[], Any]]]:
+    """
+    返回{环节名: 无参函数}，函数为None表示跳过。Andf方法每次调用都新建Andf对象。
+    """
+    plan7 = batch.preset_analysis7()["plan"]
+    plan9 = batch.preset_analysis9()["plan"]
+    fsd = _plan_params(plan7, "fsd_dfs")
+    sdb = _plan_params(plan9, "sdb_dfs")
+    lv = _plan_params(plan9, "lv_dfs")
+    cls = _plan_params(plan9, "bj_dfs")
+
+    stages = {
+        "Andf.__init__": lambda: al2.Andf(df),
+        "get_mc": lambda: al2.Andf(df).get_mc(combine_ranks=0),
+        "get_fsd": lambda: al2.Andf(df).get_fsd(**fsd),
+        "get_sdb": lambda: al2.Andf(df).get_sdb(**sdb),
+        "get_lv": lambda: al2.Andf(df).get_lv(**lv),
+        "get_cls": lambda: al2.Andf(df).get_cls(**cls),
+    }
+
+    if len(df) > max_export_rows:
+        stages.update({"dfs_to_ws": None, "wb_to_bytesIO": None, "wb_stream": None, "dfs_to_zip": None})
+        return stages
+
+    # 导出环节的输入在计时之外准备：成绩表（与页面的成绩表相同）、写好的工作簿、按班级拆分的df表
+    df_all = al2.Andf(df).get_all()
+    wb = openpyxl.Workbook()
+    al2.dfs_to_ws(wb.active, 1, 1, df_all, hd=True)
+    dfs_cls = {str(name): item for name, item in df_all.groupby("班级")}
+
+    def write_ws():
+        al2.dfs_to_ws(openpyxl.Workbook().active, 1, 1, df_all, hd=True)
+
+    def write_stream():
+        wb_stream = openpyxl.Workbook()
+        wb_stream.create_sheet("成绩表", 1)
+        al2.wb_to_bytesIO(wb_stream, data_sheets={"成绩表": df_all})
+
+    stages.update({
+        "dfs_to_ws": write_ws,
+        "wb_to_bytesIO": lambda: al2.wb_to_bytesIO(wb),
+        "wb_stream": write_stream,
+        "dfs_to_zip": lambda: al2.dfs_to_zip(dfs_cls, format="excel"),
+    })
+    return stages
+
+
+def run(
+        sizes: List[int],
+        n_classes: int = 20,
+        subjects: Optional[List[str]] = None,
+        nan_rate: float = 0.02,
+        absent_rate: float = 0.005,
+        repeat: int = 3,
+        max_export_rows: int = 50000,
+        seed: int = 0,
+        log: Callable[[str], None] = lambda msg: None
+        ) -> Dict[str, Any]:
+    """
+    运行性能测试。
+
+    :param sizes: 学生人数列表。
+    :param n_classes: 班级数。
+    :param subjects: 学科列表，默认None：全部学科。
+    :param nan_rate: 单科成绩缺失率。
+    :param absent_rate: 缺考率。
+    :param repeat: 每个环节的重复次数。
+    :param max_export_rows: 导出环节的最大行数，超过时跳过。
+    :param seed: 随机数种子。
+    :param log: 进度输出函数。
+    :return: 结果字典{"meta", "config", "results"}，results每项为
+             {"rows", "stage", "runs", "best", "median", "skipped"}，时间单位为秒。
+    """
+    config = dict(sizes=sizes, n_classes=n_classes, subjects=subjects or list(SUBJECTS), nan_rate=nan_rate,
+                  absent_rate=absent_rate, repeat=repeat, max_export_rows=max_export_rows, seed=seed)
+    results = []
+
+    for n in sizes:
+        df = make_grades(n, n_classes, subjects, nan_rate=nan_rate, absent_rate=absent_rate, seed=seed)
+        for stage, func in _stages(df, max_export_rows).items():
+            if func is None:
+                results.append(dict(rows=n, stage=stage, runs=[], best=None, median=None, skipped=True))
+                log(f"{n:>8} {stage:<15} 跳过")
+                continue
+
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                runs.append(time.perf_counter() - start)
+            results.append(dict(rows=n, stage=stage, runs=runs, best=min(runs),
+                                median=statistics.median(runs), skipped=False))
+            log(f"{n:>8} {stage:<15} {min(runs):10.4f}秒")
+
+    return dict(meta=_meta(), config=config, results=results)
+
+
+def import_times(
+        modules: Optional[List[str]] = None,
+        budget: float = IMPORT_BUDGET,
+        repeat: int = 5,
+        log: Callable[[str], None] = lambda msg: None
+        ) -> List[Dict[str, Any]]:
+    """
+    在新的解释器中测量模块的导入用时（先导入numpy、pandas，只计模块本身的用时），重复repeat次取最小值。
+
+    :param modules: 模块列表，默认IMPORT_MODULES。
+    :param budget: 导入预算（秒）。
+    :param repeat: 重复次数。
+    :param log: 进度输出函数。
+    :return: 列表，每项为{"module", "base", "best", "median", "budget", "loaded", "ok"}。
+             base为numpy、pandas的导入用时，loaded为导入后已加载的LAZY_MODULES。
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for module in modules or IMPORT_MODULES:
+        script = _IMPORT_SCRIPT.format(module=module, lazy=LAZY_MODULES)
+        runs, bases, loaded = [], [], []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=root, check=True)
+            fields = out.stdout.split()
+            bases.append(float(fields[0]))
+            runs.append(float(fields[1]))
+            loaded = fields[2:]
+        best = min(runs)
+        ok = best <= budget and not loaded
+        results.append(dict(module=module, base=min(bases), best=best, median=statistics.median(runs),
+                            budget=budget, loaded=loaded, ok=ok))
+        log(f"{'import':>8} {module:<15} {best:10.4f}秒 {'通过' if ok else '不通过'} {' '.join(loaded)}")
+    return results
+
+
+def _meta() -> Dict[str, Any]:
+    """运行环境信息。"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return dict(time=datetime.now().isoformat(timespec="seconds"), commit=commit,
+                python=platform.python_version(), platform=platform.platform(), cpu_count=os.cpu_count(),
+                numpy=np.__version__, pandas=pd.__version__, openpyxl=openpyxl.__version__,
+                excel_engine=al2.excel_engine())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description="Andf与导出环节性能测试。")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="学生人数列表，默认500 5000 50000 500000")
+    parser.add_argument("--classes", type=int, default=20, help="班级数，默认20")
+    parser.add_argument("--subjects", nargs="+", default=None, help="学科列表，默认全部学科")
+    parser.add_argument("--nan-rate", type=float, default=0.02, help="单科成绩缺失率，默认0.02")
+    parser.add_argument("--absent-rate", type=float, default=0.005, help="缺考率，默认0.005")
+    parser.add_argument("--repeat", type=int, default=3, help="每个环节的重复次数，默认3")
+    parser.add_argument("--max-export-rows", type=int, default=50000, help="导出环节的最大行数，默认50000")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子，默认0")
+    parser.add_argument("--out", default=None, help="JSON结果文件，默认输出到屏幕")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET,
+                        help=f"导入用时预算（秒，不含numpy、pandas），默认{IMPORT_BUDGET}")
+    parser.add_argument("--skip-import", action="store_true", help="跳过导入时间检查")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    log = lambda msg: print(msg, file=sys.stderr)
+    result = run(args.sizes, args.classes, args.subjects, args.nan_rate, args.absent_rate, args.repeat,
+                 args.max_export_rows, args.seed, log=log)
+    result["imports"] = [] if args.skip_import else import_times(budget=args.import_budget, log=log)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if all(item["ok"] for item in result["imports"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
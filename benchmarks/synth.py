@@ -0,0 +1,71 @@
+"""
+生成模拟的年级成绩表，供性能测试使用。
+
+成绩表的列与分析页面上传的成绩表一致：班级、学号、姓名与各学科成绩。
+每个学生有一个能力值，各学科成绩由能力值加学科噪声生成，按0.5分取整并截断在[0, 满分]内；
+班级人数大致相等，各班有不同的平均水平。可设置单科缺失率与缺考率（缺考学生全部学科为空或为缺考标记）。
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# {学科: 满分}
+SUBJECTS: Dict[str, int] = {"语文": 120, "数学": 120, "英语": 120,
+                            "物理": 70, "政治": 70,
+                            "化学": 50, "生物": 50, "历史": 50, "地理": 50}
+
+
+def make_grades(
+        n_students: int = 2000,
+        n_classes: int = 20,
+        subjects: Optional[List[str]] = None,
+        nan_rate: float = 0.02,
+        absent_rate: float = 0.005,
+        absent_marker: Optional[str] = None,
+        seed: int = 0
+        ) -> pd.DataFrame:
+    """
+    生成模拟成绩表。
+
+    :param n_students: 学生人数。
+    :param n_classes: 班级数，班级为1~n_classes的整数。
+    :param subjects: 学科列表，默认None：SUBJECTS中的全部学科。
+    :param nan_rate: 单科成绩缺失率，默认0.02。
+    :param absent_rate: 缺考率，缺考学生的全部学科成绩为空，默认0.005。
+    :param absent_marker: 缺考标记，如"缺考"。默认None：缺考成绩为空值；设置后学科列为object类型。
+    :param seed: 随机数种子。
+    :return: df表，列为['班级', '学号', '姓名'] + subjects。
+    """
+    subjects = list(SUBJECTS) if subjects is None else subjects
+    unknown = [s for s in subjects if s not in SUBJECTS]
+    if unknown:
+        raise ValueError(f"未知学科: {unknown}")
+    if n_students < 1 or n_classes < 1:
+        raise ValueError("n_students与n_classes必须大于等于1")
+
+    rng = np.random.default_rng(seed)
+
+    # 班级人数大致相等，学生顺序打乱
+    cls = rng.permutation(np.arange(n_students) % n_classes + 1)
+    # 能力值 = 班级水平 + 个人水平
+    ability = rng.normal(0, 0.3, n_classes + 1)[cls] + rng.normal(0, 1, n_students)
+
+    data = {"班级": cls,
+            "学号": np.arange(1, n_students + 1) + 20260000,
+            "姓名": [f"学生{i:06d}" for i in range(1, n_students + 1)]}
+
+    absent = rng.random(n_students) < absent_rate
+    for sbj in subjects:
+        full = SUBJECTS[sbj]
+        z = 0.8 * ability + 0.6 * rng.normal(0, 1, n_students)
+        score = np.clip(np.round(full * (0.68 + 0.14 * z) * 2) / 2, 0, full)
+        score[(rng.random(n_students) < nan_rate) | absent] = np.nan
+        data[sbj] = score
+
+    df = pd.DataFrame(data)
+    if absent_marker is not None:
+        df[subjects] = df[subjects].astype(object)
+        df.loc[absent, subjects] = absent_marker
+    return df
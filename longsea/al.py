@@ -4,7 +4,6 @@ from io import BytesIO
 import numpy as np
 import openpyxl
 import pandas as pd
-import streamlit
 from openpyxl.utils.dataframe import dataframe_to_rows
 import zipfile
 import re
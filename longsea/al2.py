@@ -1,17 +1,27 @@
+import datetime
 import functools
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import importlib.util
 import math
+from collections import OrderedDict
+import os
+import threading
 import warnings
+import weakref
 from io import BytesIO
 import numpy as np
-import openpyxl
 import pandas as pd
-import streamlit
-from openpyxl.utils.dataframe import dataframe_to_rows
 import zipfile
 import re
-from typing import Dict, Union, List, Any, Callable, Optional, Tuple, Literal
-from openpyxl.workbook import Workbook
-from openpyxl.worksheet.worksheet import Worksheet
+from typing import Dict, Union, List, Any, Callable, Optional, Tuple, Literal, TYPE_CHECKING
+from longsea import perf
+
+# openpyxl与xml解析只在读写xlsx的函数中导入：计算相关的函数只依赖numpy与pandas，
+# 命令行、进程池子进程导入本模块时不加载openpyxl与streamlit。
+if TYPE_CHECKING:
+    from openpyxl.workbook import Workbook
+    from openpyxl.worksheet.worksheet import Worksheet
 
 
 '''
@@ -20,6 +30,28 @@ from openpyxl.worksheet.worksheet import Worksheet
 # 2024.11.24更新：完成als重构，重命名为al模块。
 # 2025.02.01更新：添加了get_cls_score()方法，实现了班级分析-分数段功能；给funs_fd()添加rev参数。
 # 2025.09.15更新：修改添加了多个函数，是一次巨大的提升。
+# 2026.10.18更新：新增count_bins_by_group()分组分段计数引擎，get_fsd()、get_cls()改用该引擎。
+# 2026.10.18更新：新增count_dual_cond_by_group()双条件计数引擎，get_sdb()、get_db()不再组合名次元组。
+# 2026.10.18更新：Andf不再修改传入的df表，学科数值列、总分、班次、级次改为惰性计算并缓存。
+# 2026.10.18更新：get_df()、get_mc()的筛选、排名结果按参数缓存（LRU），新增clear_cache()。
+# 2026.10.18更新：新增build_reports()报表计划，一次生成多个报表，报表之间共用Andf的派生列与结果缓存。
+# 2026.10.18更新：新增rate_stats_by_group()成绩区间统计引擎，get_lv()改用该引擎，并添加cumu参数。
+# 2026.10.18更新：dfs_to_ws()预建合并单元格映射，无空值数值列批量写入。
+# 2026.10.18更新：新增模板池load_template()、template_bytes()与get_sheet_names()，模板每个进程只解析一次。
+# 2026.10.18更新：新增read_sheet()、get_andf()上传文件缓存，按内容哈希与工作表名缓存，按内存占用淘汰。
+# 2026.10.18更新：read_sheet()只解析所选工作表，安装了python-calamine时使用calamine引擎。
+# 2026.10.18更新：公共函数与Andf公共方法接入perf性能统计（默认关闭）。
+# 2026.10.18更新：wb_to_bytesIO()添加data_sheets参数，名次表、成绩表等大表在保存时流式写入。
+# 2026.10.18更新：dfs_to_zip()并行生成成员文件，可选择压缩方法与压缩级别，相同输入的ZIP字节相同。
+# 2026.10.18更新：新增load_sheet()与Parquet缓存，get_andf()改用load_sheet()，同一成绩表再次分析时不解析xlsx。
+# 2026.10.18更新：merge_mult_dfs()键不重复时一次拼接合并，不再逐个两两合并。
+# 2026.10.18更新：不再导入streamlit，openpyxl与xml解析改为在使用时导入，导入本模块只加载numpy与pandas。
+# 2026.10.18更新：新增班级名次阶梯，get_fsd()、get_lv()、get_cls()最大班次不超过60时只需下标取值，不再筛选。
+# 2026.10.18更新：新增score_histograms()与GlobalRanks，Andf添加ranks参数，多校联合分析时级次与名次表为全区名次。
+# 2026.10.18更新：新增rank_min()计数排名，班次、级次与df_rank_cols()的成绩为有界的整数或0.5分时不再排序。
+# 2026.10.18更新：新增双名次累计表，get_sdb()调整阈值时只需下标取值；新增get_sdb_grid()一次计算多组候选阈值。
+# 2026.10.18更新：新增ScoreCube成绩立方体与get_cube()，任意阈值的分段人数、比率与平均分由立方体得出，可保存为json。
+# 2026.10.18更新：新增df_add_rank_batch()，get_fsd()、get_sdb()、get_db_fsd()各学科表一次矩阵乘法添加积分排名；新增df_rank_schemes()比较多组积分方案。
 '''
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■      Andf类及其方法      ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -30,29 +62,204 @@ class Andf:
     # 标准学科名列表：self.__sbj，           包括成绩表没有的学科名。
     # 标准学科名字典：self.__sbj_dic，       标准学科名对应的字典。
     # 已用学科名列表：self.__sbj_lst，       所有已经使用的学科名列表。
-    # 总分班次级次成绩全表：self.__df         包括总分、班次、级次的成绩表。
-    def __init__(self, df: pd.DataFrame) -> None:
-
-        self.__df = df
+    # 原始成绩表：self.__src                 只读，不修改调用者传入的df表。
+    # 派生列缓存：self.__cols                学科数值列、总分、班次、级次，首次使用时计算。
+    # 总分班次级次成绩全表：self.__df         包括总分、班次、级次的成绩表，首次调用get_all()时生成。
+    # 结果缓存：self.__cache                  get_df/get_mc的筛选、排名结果，LRU淘汰，最多cache_size项。
+    # 全区名次：self.__ranks                  多分区联合分析时的GlobalRanks，级次与名次表使用全区名次。
+    # 内存占用：self.__nbytes                 派生列、全表与结果缓存各项的估算字节数，只在设置了占用回调后统计。
+    def __init__(self, df: pd.DataFrame, cache_size: int = 32, ranks: Optional["GlobalRanks"] = None) -> None:
+
+        self.__src = df
+        self.__ranks = ranks
         # 声明标准学科名列表
         self.__sbj: List[str] = ["语文", "数学", "英语", "物理", "化学", "生物", "政治", "历史", "地理"]
         # 确定df表对应的[学科名]列表:__sbj_lst.
-        self.__sbj_lst: List[str] = list(set(self.__sbj) & set(self.__df.columns))
+        self.__sbj_lst: List[str] = list(set(self.__sbj) & set(self.__src.columns))
         # 确定df表对应的{学科名：序号}字典：__sbj_dic。
         self.__sbj_dic: Dict[str, int] = {val: idx + 1 for idx, val in enumerate(self.__sbj)}
         # 对学科列表进行排序，排序规则为：字典中key对应的值。
         self.__sbj_lst.sort(key=lambda x: self.__sbj_dic[x])
 
-        # 确保学科成绩列都是数值类型，避免在计算总分时出现类型错误
-        for subject in self.__sbj_lst:
-            self.__df[subject] = pd.to_numeric(self.__df[subject], errors='coerce')
-        
-        # 增加总分列、班次、级次列，创建基础df对象
-        self.__df["总分"] = df.loc[:, self.__sbj_lst].sum(axis=1, min_count=1)
-        # 增加班次列
-        self.__df["班次"] = df.groupby("班级")["总分"].rank(ascending=False, method="min")
-        # 增加级次列
-        self.__df["级次"] = df["总分"].rank(axis=0, ascending=False, method="min")
+        # 学科数值列、总分、班次、级次均为惰性计算，不在此处生成。
+        self.__cols: Dict[str, pd.Series] = {}
+        self.__df: Optional[pd.DataFrame] = None
+
+        # get_df/get_mc 结果缓存，键为(方法, 列名, 最大班次, 是否合并名次)。
+        # get_andf()缓存的Andf由多个会话线程共用，缓存与内存占用统计的读写都在锁内进行。
+        self.__cache: OrderedDict = OrderedDict()
+        self.__cache_size: int = cache_size
+        self.__lock = threading.RLock()
+
+        # 内存占用统计，由上传文件缓存（get_andf）通过_track_nbytes()开启。
+        self.__nbytes: Dict[Any, int] = {}
+        self.__src_nbytes: int = 0
+        self.__on_resize: Optional[Callable[[int], None]] = None
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 惰性获取一列：学科列转换为数值，总分、班次、级次首次使用时计算，之后直接复用。
+    def _col(self, name: str) -> pd.Series:
+        """
+        返回值：列数据。学科列为数值类型，总分、班次、级次为派生列，其余列为原始列。
+        """
+        if name in self.__cols:
+            return self.__cols[name]
+
+        if name in self.__sbj_lst:
+            # 确保学科成绩列都是数值类型，避免在计算总分时出现类型错误
+            sr = pd.to_numeric(self.__src[name], errors='coerce')
+        elif name == "总分":
+            scores = pd.DataFrame({sbj: self._col(sbj) for sbj in self.__sbj_lst}, index=self.__src.index)
+            sr = scores.sum(axis=1, min_count=1)
+        elif name == "班次":
+            sr = rank_min(self._col("总分"), ascending=False, by=self.__src["班级"])
+        elif name == "级次":
+            if self.__ranks is None:
+                sr = rank_min(self._col("总分"), ascending=False)
+            else:
+                sr = pd.Series(self.__ranks.rank("总分", self._col("总分")), index=self.__src.index)
+        else:
+            # 原始列不需要缓存
+            return self.__src[name]
+
+        sr = sr.rename(name)
+        self.__cols[name] = sr
+        self._charge(("col", name), sr)
+        return sr
+
+    # 按列名列表组装df表（派生列惰性计算）。
+    def _frame(self, columns: List[str]) -> pd.DataFrame:
+        return pd.DataFrame({col: self._col(col) for col in columns}, index=self.__src.index)
+
+    # 从LRU缓存中取结果，未命中时调用func计算并写入缓存。
+    # 计算在锁外进行（func中可能再次调用_cached），多个线程同时未命中时各自计算，只保留一份结果。
+    def _cached(self, key: Tuple, func: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        with self.__lock:
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                return self.__cache[key]
+        result = func()
+        if self.__cache_size > 0:
+            with self.__lock:
+                if key in self.__cache:
+                    self.__cache.move_to_end(key)
+                    return self.__cache[key]
+                self.__cache[key] = result
+                while len(self.__cache) > self.__cache_size:
+                    self.__nbytes.pop(self.__cache.popitem(last=False)[0], None)
+                self._charge(key, result)
+        return result
+
+    # 开启内存占用统计：之后派生列、全表或结果缓存增加时，以当前占用（字节）调用on_resize。
+    def _track_nbytes(self, on_resize: Callable[[int], None]) -> None:
+        with self.__lock:
+            self.__src_nbytes = _df_nbytes(self.__src)
+            self.__nbytes = {("col", name): _estimate_nbytes(sr) for name, sr in list(self.__cols.items())}
+            if self.__df is not None:
+                self.__nbytes[("all",)] = _estimate_nbytes(self.__df)
+            self.__nbytes.update((key, _estimate_nbytes(value)) for key, value in self.__cache.items())
+            self.__on_resize = on_resize
+
+    # 估算的内存占用（字节）：源表、派生列、全表与结果缓存。未开启统计时只计源表。
+    def _nbytes(self) -> int:
+        with self.__lock:
+            return self.__src_nbytes + sum(self.__nbytes.values())
+
+    # 记录一项的内存占用并通知回调。
+    def _charge(self, key: Any, value: Any) -> None:
+        if self.__on_resize is None:
+            return
+        with self.__lock:
+            self.__nbytes[key] = _estimate_nbytes(value)
+            self.__on_resize(self._nbytes())
+
+    # 清空缓存。
+    def clear_cache(self) -> None:
+        """
+        清空get_df/get_mc的结果缓存，以及学科数值列、总分、班次、级次等派生列。
+        原始df表在外部被修改后，应调用此方法。
+        """
+        with self.__lock:
+            self.__cache.clear()
+            self.__cols.clear()
+            self.__df = None
+            self.__nbytes.clear()
+
+    # 获取最大班次筛选后的班级编码（与get_df/get_mc的行一一对应），同一最大班次只编码一次。
+    def _groups(self, max_class_rank: Optional[int]) -> Tuple[np.ndarray, pd.Index]:
+        def build() -> Tuple[np.ndarray, pd.Index]:
+            cls = self._col("班级")
+            if max_class_rank != None:
+                cls = cls[self._col("班次") <= max_class_rank]
+            return _group_codes(cls)
+        return self._cached(("groups", None, max_class_rank, None), build)
+
+    # 班级名次阶梯：各班班次<=_LADDER_MAX_CLASS_RANK的学生按班次排序，首次按最大班次统计时建立（见_RankLadder）。
+    def _ladder(self) -> "_RankLadder":
+        return self._cached(("ladder", None, _LADDER_MAX_CLASS_RANK, None),
+                            lambda: _RankLadder(self._col("班级"), _float_values(self._col("班次")),
+                                                max_class_rank=_LADDER_MAX_CLASS_RANK))
+
+    # 最大班次超过阶梯上限时（或不是有限的数值），按班次筛选后统计，不建立阶梯。
+    @staticmethod
+    def _on_ladder(max_class_rank: Any) -> bool:
+        return (isinstance(max_class_rank, (int, float, np.integer, np.floating))
+                and max_class_rank <= _LADDER_MAX_CLASS_RANK)
+
+    # 班次<=max_class_rank的班级列与统计列，只供阶梯以外的最大班次使用（不缓存）。
+    def _filtered(self, cols: List[str], max_class_rank: Union[int, float]) -> pd.DataFrame:
+        df = self._frame(["班级"] + cols)
+        return df[self._col("班次") <= max_class_rank]
+
+    # 按最大班次统计各分段人数，结果同 count_bins_by_group(get_df(...), ...)。
+    # 同一组阈值只沿阶梯累加一次，之后最大班次不超过阶梯上限时（如拖动滑动条）只需下标取值，不再筛选。
+    def _count_bins(self, dic_thresh: Dict[str, Any], cumu: int, mode: int, max_class_rank: Union[int, float]
+                    ) -> pd.DataFrame:
+        if not self._on_ladder(max_class_rank):
+            return count_bins_by_group(self._filtered(list(dic_thresh), max_class_rank), by="班级",
+                                       dic_thresh=dic_thresh, cumu=cumu, mode=mode,
+                                       groups=self._groups(max_class_rank))
+
+        def build() -> Callable[[Union[int, float]], pd.DataFrame]:
+            ladder = self._ladder()
+            arrays = {col: _float_values(self._col(col))[ladder.rows] for col in dic_thresh}
+            return _bin_ladder(ladder, arrays, dic_thresh, cumu=cumu, mode=mode)
+        key = ("bin_ladder", _thresh_key(dic_thresh), None, (cumu, mode))
+        return self._cached(key, build)(max_class_rank)
+
+    # 按最大班次统计成绩区间人数、比率与平均分，结果同 rate_stats_by_group(get_df(...), ...)（平均分的差异在浮点舍入范围内）。
+    def _rate_stats(self, dic_thresh: Dict[str, Any], cumu: bool, include_count_valid: int,
+                    max_class_rank: Union[int, float]) -> pd.DataFrame:
+        if not self._on_ladder(max_class_rank):
+            return rate_stats_by_group(self._filtered(list(dic_thresh), max_class_rank), by="班级",
+                                       dic_thresh=dic_thresh, cumu=cumu, include_mean=True,
+                                       include_count_valid=include_count_valid, groups=self._groups(max_class_rank))
+
+        def build() -> Callable[[Union[int, float]], pd.DataFrame]:
+            ladder = self._ladder()
+            arrays = {col: pd.to_numeric(self._col(col), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                      [ladder.rows] for col in dic_thresh}
+            return _rate_ladder(ladder, arrays, dic_thresh, cumu=cumu, include_mean=True,
+                                include_count_valid=include_count_valid)
+        key = ("rate_ladder", _thresh_key(dic_thresh), None, (cumu, include_count_valid))
+        return self._cached(key, build)(max_class_rank)
+
+    # 双名次累计表（见_DualRankTable），总分名次上限取整到100的倍数，拖动阈值时多次查询共用一张表。
+    # 表过大时返回None，由调用者改用count_dual_cond_by_group()。
+    def _dual_table(self, max_class_rank: Optional[int], max_total_rank: Union[int, float]
+                    ) -> Optional["_DualRankTable"]:
+        if (not isinstance(max_total_rank, (int, float)) or math.isnan(max_total_rank) or math.isinf(max_total_rank)
+                or max_total_rank < 0):
+            return None
+        limit = max(100, int(math.ceil(max_total_rank / 100)) * 100)
+
+        def build() -> Optional[_DualRankTable]:
+            df_mc = self._mc(max_class_rank, combine_ranks=0)
+            groups = self._groups(max_class_rank)
+            if _DualRankTable.cells(df_mc, self.__sbj_lst, "总分", len(groups[1]), limit) > _DUAL_TABLE_MAX_CELLS:
+                return None
+            return _DualRankTable(df_mc, self.__sbj_lst, "总分", groups, limit)
+        return self._cached(("dual_table", None, max_class_rank, limit), build)
 
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   基本信息表（学科表，学科字典，全信息表） ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -79,6 +286,16 @@ class Andf:
         返回导入后，添加总分、班次、校次列后的DF表。
         :return: 添加总分、班次、校次列后的DF表。
         """
+        # 返回深拷贝，调用者修改结果（增删列或用loc、iloc改值）不影响缓存。
+        return self._all().copy()
+
+    # 缓存中的全表，只供内部只读使用。
+    def _all(self) -> pd.DataFrame:
+        if self.__df is None:
+            # 原有列保持原位置（学科列替换为数值列），总分、班次、级次列追加在最后。
+            derived = self.__sbj_lst + ["总分", "班次", "级次"]
+            self.__df = self.__src.assign(**{col: self._col(col) for col in derived})
+            self._charge(("all",), self.__df)
         return self.__df
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   基础报表（部分信息表，名次表，学科双达标表）  ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -88,15 +305,20 @@ class Andf:
                max_class_rank: int = 60               # 获取班级分析报表中时，最大计算人数。
                ) -> pd.DataFrame:
         """
-        返回值：df表。
+        返回值：df表。相同(columns, max_class_rank)的结果只筛选一次，之后从缓存中返回。
         :param columns: 列名，列表。
         :param max_class_rank: 班级数，整数。默认40。
         :return: df表。
         """
         if columns is None:
             columns = ["班级", "学号", "姓名"]
-        df = self.__df[self.__df["班次"] <= max_class_rank]
-        return df.loc[:, columns]
+
+        def build() -> pd.DataFrame:
+            df = self._frame(columns)
+            return df[self._col("班次") <= max_class_rank]
+
+        # 返回深拷贝，调用者修改结果（增删列或用loc、iloc改值）不影响缓存。
+        return self._cached(("df", tuple(columns), max_class_rank, None), build).copy()
 
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
     # 获取名次表（学科名次，总分名次）
@@ -109,17 +331,30 @@ class Andf:
         :param max_class_rank: 班级名次，整数。默认40,取班次<=40的数据。
         :param combine_ranks: 整数1或0。0,各科独立排名。默认1,学科排名与总分排名组合为元组.
         :return: df表。班次满足小于max_class_rank的df表.当combine_ranks=1合并班次与总分名次为一个元组
+        相同(max_class_rank, combine_ranks)的结果只筛选、排名一次，之后从缓存中返回。
+        创建Andf时传入了ranks（GlobalRanks）时，学科名次、总分名次为全区名次。
         """
-        if max_class_rank != None:
-            df = self.__df[self.__df["班次"] <= max_class_rank]
-        else:
-            df= self.__df.copy()
-        df_mc = df_rank_cols(df, self.__sbj_lst+["总分"], method='min', ascending=False)
+        # 返回深拷贝，调用者修改结果（增删列或用loc、iloc改值）不影响缓存。
+        return self._mc(max_class_rank, combine_ranks).copy()
+
+    # 缓存中的名次表，只供内部只读使用。
+    def _mc(self, max_class_rank: Optional[int] = None, combine_ranks: int = 1) -> pd.DataFrame:
+        def build() -> pd.DataFrame:
+            df = self._all()
+            if max_class_rank != None:
+                df = df[self._col("班次") <= max_class_rank]
+            if self.__ranks is None:
+                df_mc = df_rank_cols(df, self.__sbj_lst+["总分"], method='min', ascending=False)
+            else:
+                # 全区名次：排名范围为全区班次<=max_class_rank的学生
+                df_mc = df.assign(**{col: self.__ranks.rank(col, df[col], max_class_rank)
+                                     for col in self.__sbj_lst + ["总分"]})
 
-        if combine_ranks == 1:
-            df_mc = df_pair_cols(df_mc, self.__sbj_lst, '总分')
+            if combine_ranks == 1:
+                df_mc = df_pair_cols(df_mc, self.__sbj_lst, '总分')
+            return df_mc
 
-        return df_mc
+        return self._cached(("mc", None, max_class_rank, combine_ranks), build)
 
 
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -134,13 +369,15 @@ class Andf:
         :param max_total_rank: 总分最大名次，整数。默认40.
         :return: 班级分析报表.
         """
-        # 获取班级名次（学科名次，总分名次）表。
-        df_mc = self.get_mc(max_class_rank=None, combine_ranks=1)
-        df_mc = df_mc[["班级"]+self.__sbj_lst]
+        # 获取名次表（学科名次、总分名次为独立的列）。
+        df_mc = self._mc(None, combine_ranks=0)
 
-        # 获取学科双达标函数列表
-        func = functools.partial(count_dual_cond, a=max_subject_rank, b=max_total_rank)
-        df_db = df_mc.groupby("班级").agg(func)
+        # 按班级统计 学科名次<=max_subject_rank 且 总分名次<=max_total_rank 的人数。
+        codes, index = self._groups(None)
+        total_ok = _float_values(df_mc["总分"]) <= max_total_rank
+        df_db = pd.DataFrame({sbj: _count_true_by_group(codes, len(index),
+                                                        (_float_values(df_mc[sbj]) <= max_subject_rank) & total_ok)
+                              for sbj in self.__sbj_lst}, index=index)
 
         return df_db
 
@@ -163,29 +400,11 @@ class Andf:
         # 生成字典{学科:（72，96，120）}，并排序
         dic = dict_rev_sort(dic=dic_thresh_sbj, sort_order=self.__sbj_lst)
 
-        # 定义{学科:[分数段函数组]}字典
-        dic_FAN = {key: functools.partial(make_bin_counters, thresh=dic[key])() for key in dic.keys()}
-
-        # 获取df表,要求最大班次小于max_class_rank,列索引中有班级与学科名.
-        df = self.get_df(columns=["班级"] + self.get_sbj_lst(), max_class_rank=max_class_rank)
-
-        # 按班级分组后，执行分数段函数组。生成一个报表.
-        df_fsd = df.groupby("班级").agg(dic_FAN)
-
-        # 依据第0列索引，分割数据为多个df表。
-        df_fsd = df_split_levels(df_fsd)
-
-        for key, dff in df_fsd.items():
-            # 添加各分排名三列
-            if thresh_score != None and  add_rank_cols == 1 :
-                dff = df_add_rank(dff, lst=thresh_score, sum_col_name="积分", dot_col_name="点积", rank_col_name="点积排名")
-            # 添加行索引名称
-            dff.index.name = key
-            # 更新字典中的DataFrame
-            df_fsd[key] = dff
-
+        # 按班级分组，统计班次<=max_class_rank的学生各学科各分数段人数。生成一个报表.
+        df_fsd = self._count_bins(dic, cumu=0, mode=0, max_class_rank=max_class_rank)
 
-        return df_fsd
+        # 分割为各学科的df表，添加积分、点积、排名列。
+        return _fsd_report(df_fsd, thresh_score, add_rank_cols)
 
     # 生成学科多阈值双达标报表.
     def get_sdb(self,
@@ -203,32 +422,100 @@ class Andf:
         :return: 双达标报表.
         """
 
-        # 获取班级名次（学科名次，总分名次）表。
-        df_mc = self.get_mc(max_class_rank=max_class_rank, combine_ranks=1)
-
-        # 获取学科双达标函数列表
-        mcd_funs = functools.partial(make_dual_cond_counters, thresh=thresh, sec_thresh=max_total_rank)
-
-        # 创建字典，添加键值对为{学科名：单达标函数},以计算单达标人数.
-        dic_mcd_funs = {str(i): mcd_funs() for i in self.__sbj_lst}
-
-        # 使用聚合函数，计算学科双达标人数，并返回df表。
-        df_SDB = df_mc.groupby("班级").agg(dic_mcd_funs)
+        # 按班级分组，在双名次累计表上查询学科双达标人数（调整阈值时不再重新统计），并返回df表。
+        table = self._dual_table(max_class_rank, max_total_rank)
+        if table is not None:
+            df_SDB = table.frame(thresh, max_total_rank)
+        else:
+            # 获取名次表（学科名次、总分名次为独立的列），直接在名次数组上计算。
+            df_mc = self._mc(max_class_rank, combine_ranks=0)
+            df_SDB = count_dual_cond_by_group(df_mc, by="班级", cols=self.__sbj_lst, sec_col="总分",
+                                              thresh=thresh, sec_thresh=max_total_rank,
+                                              groups=self._groups(max_class_rank))
 
         # 依据第0列索引，分割数据为多个df表。
         dfs_xk = df_split_levels(df_SDB)
 
         # 添加各科积分列
         if thresh_score != 0:
+            # 添加各分排名三列（各学科表批量计算）
+            dfs_xk = df_add_rank_batch(dfs_xk, lst=thresh_score, sum_col_name="积分", dot_col_name="点积",
+                                       rank_col_name="排名")
             for key, dff in dfs_xk.items():
-                # 添加各分排名三列
-                dff = df_add_rank(dff, lst=thresh_score, sum_col_name="积分", dot_col_name="点积", rank_col_name="排名")
                 # 添加行索引名称
                 dff.index.name = key
-                # 更新字典中的DataFrame
-                dfs_xk[key] = dff
         return dfs_xk
 
+    # 成绩立方体：班级 × (各学科、总分、级次) × 不同分数 的人数表，见ScoreCube。
+    def get_cube(self,
+                 max_class_rank: int = None      # 班级最大名次，默认None：全部学生
+                 ) -> "ScoreCube":
+        """
+        生成成绩立方体（按最大班次缓存）。立方体可用任意阈值生成分数段、两率一平与班级次段报表，
+        也可保存为json（ScoreCube.save()），之后不需要学生成绩表。
+        :param max_class_rank: 最大班次，默认None：全部学生（包括总分为空、没有班次的学生，比率的分母与get_all()的班级人数相同）。
+            指定时立方体的报表与get_fsd()、get_lv()、get_cls()使用同一max_class_rank的结果相同。
+        :return: ScoreCube对象。
+        """
+        def build() -> ScoreCube:
+            cols = self.__sbj_lst + ["总分", "级次"]
+            rows = None if max_class_rank is None else (self._col("班次") <= max_class_rank).to_numpy()
+            arrays = {col: _float_values(self._col(col)) for col in cols}
+            if rows is not None:
+                arrays = {col: arr[rows] for col, arr in arrays.items()}
+            return ScoreCube.from_arrays(self._groups(max_class_rank), arrays, self.__sbj_lst, max_class_rank)
+        return self._cached(("cube", None, max_class_rank, None), build)
+
+    # 双达标阈值网格：一次计算多组候选阈值与最大校次的学科双达标积分，用于调整阈值。
+    def get_sdb_grid(self,
+                     thresh_grid: List[List[int]],                                 # 候选阈值列表.如:[[0,180,240,300],[0,200,260,300]]
+                     max_total_ranks: List[Union[int, float]],                     # 候选最大校次列表.如:[200,240,260]
+                     thresh_score: Optional[List[Union[int, float]]] = [10, 9, 2, 1, 0],   # 积分列表，None：统计双达标人数
+                     max_class_rank: int = None                                    # 班级最大名次，与get_sdb()相同
+                     ) -> pd.DataFrame:
+        """
+        对每组(thresh, max_total_rank)计算各班各学科的双达标积分，结果与
+        get_sdb(thresh, thresh_score, max_class_rank, max_total_rank)各学科表的"点积"列相同。
+        全部候选共用一张双名次累计表，每组候选只需下标取值。
+        :param thresh_grid: 候选阈值列表，每项同get_sdb()的thresh。
+        :param max_total_ranks: 候选最大校次列表。
+        :param thresh_score: 积分列表，同get_sdb()。None：统计双达标人数（学科名次在(第一个阈值, 最后一个阈值]且校次<=最大校次）。
+        :param max_class_rank: 最大班次，同get_sdb()。
+        :return: df表，行索引为(阈值, 总分名次, 班级)，阈值如"0-180-240-300"；列为学科。
+        """
+        cols = self.__sbj_lst
+        finite = [b for b in max_total_ranks
+                  if isinstance(b, (int, float)) and not math.isnan(b) and not math.isinf(b)]
+        table = self._dual_table(max_class_rank, max(finite)) if finite else None
+        frames = []
+        for thresh in thresh_grid:
+            for b in max_total_ranks:
+                edges = _dual_cond_thresh(thresh, b, 'rank')
+                if table is not None and b <= table.limit:
+                    index, counts = table.index, table.interval_counts(edges, b)
+                else:
+                    df_mc = self._mc(max_class_rank, combine_ranks=0)
+                    df_SDB = count_dual_cond_by_group(df_mc, by="班级", cols=cols, sec_col="总分", thresh=edges,
+                                                      sec_thresh=b, groups=self._groups(max_class_rank))
+                    index, counts = df_SDB.index, df_SDB.to_numpy()
+
+                # 每个学科依次为各区间人数与超限人数，共n列
+                n = len(edges) + 1
+                weights = np.zeros(n)
+                if thresh_score is None:
+                    # 双达标人数：区间(第一个阈值, 最后一个阈值]
+                    weights[:n - 2] = 1
+                else:
+                    # 与df_add_rank()相同：积分依次对应前len(thresh_score)列
+                    weights[:min(n, len(thresh_score))] = thresh_score[:n]
+                values = counts.reshape(len(index), len(cols), n) @ weights
+                label = "-".join(str(x) for x in edges)
+                frames.append(pd.DataFrame(values, columns=cols, index=pd.MultiIndex.from_arrays(
+                    [[label] * len(index), [b] * len(index), index], names=["阈值", "总分名次", "班级"])))
+        if not frames:
+            return pd.DataFrame(columns=cols)
+        return pd.concat(frames)
+
     # 生成两率一平报表.
     def get_lv(self,
                dic_total_sbj: Dict[int, List[str]],     #
@@ -236,6 +523,7 @@ class Andf:
                max_class_rank: int = 40,                # 班级最大名次，整数。默认40.
                include_count_valid: int = 0,             # 添加统计有效人数列。默认不统计：0。
                add_rank_cols= None,
+               cumu: bool = True,                        # 累计模式：True为[t,+∞)，False为区间[a,b)。
                ) -> Dict[Any, pd.DataFrame]:
         """
         生成两率一平报表.
@@ -243,34 +531,19 @@ class Andf:
         :param calcu: 0或1，默认1。0，添加。1，添加分析列。
         :param thresh: 及格率优秀率或其它比率的阈值,例[0.6,0.8]
         :param max_class_rank: 最大班次次，整数。默认40,取班次<=40的数据。
+        :param cumu: 累计模式，默认True。True统计[t,+∞)，False统计区间[a,b)（末区间为[a,b]）。
         :return: df表。
         """
 
-        # 使用字典推导式转换为{学科:总分}字典
-        dic = dict_rev_sort(dic=dic_total_sbj, sort_order=self.__sbj_lst)
+        # {学科:阈值}字典，阈值为比率×总分，如[72, 96, 120]
+        dic_thresh = _lv_thresh(dic_total_sbj, thresh, self.__sbj_lst)
 
-        # 定义{学科:[两率一平函数组]}字典
-        # 明确设置 include_mean=True
-        dic_FAN = {key: functools.partial(make_rate_counters,
-                                          thresh=np.array(thresh + [1]) * val,
-                                          include_count_valid=include_count_valid,
-                                          include_mean=True)() for key, val in dic.items()}
+        # 按班级分组，对班次<=max_class_rank的学生执行两率一平计算（include_mean=True）。生成一个报表.
+        df_lv = self._rate_stats(dic_thresh, cumu=cumu, include_count_valid=include_count_valid,
+                                 max_class_rank=max_class_rank)
 
-        # 获取需进行两率一平的df表,要求最大班次小于max_class_rank,列索引中人班级与学科名.
-        df = self.get_df(columns=["班级"] + self.get_sbj_lst(), max_class_rank=max_class_rank)
-
-        # 按班级分组后，执行两率一平计算。生成一个报表.
-        df_lv = df.groupby("班级").agg(dic_FAN)
-
-        # 依据第0列索引，分割数据为多个df表。
-        dfs_lv = df_split_levels(df_lv)
-
-        # 加入排名列
-        if add_rank_cols !=None:
-            for key, dff in dfs_lv.items():
-                dfs_lv[key] = df_add_cols_rank(dff, columns_to_rank=add_rank_cols)
-
-        return dfs_lv
+        # 分割为各学科的df表，加入排名列。
+        return _lv_report(df_lv, add_rank_cols)
 
     # 生成班级分析报表-各次段统计
     def get_cls(self,
@@ -290,18 +563,9 @@ class Andf:
         :return: df表。班级分析报表。
         """
 
-        # 定义偏函数，设置阈值列表，若为0，则默认为[0,200,400]。cumu:0为不累计，1为累计。
-        funs_cls = functools.partial(make_bin_counters, thresh=thresh, cumu=cumu, mode=mode)
-
-        # 获取班级名次表["班级"，"级次"]
-        df_cls = self.get_df(columns=["班级", "级次"], max_class_rank=max_class_rank)
-        # 按班级分组后，执行班级名次计算。生成一个报表.
-        df_cls = df_cls.groupby("班级")["级次"].agg(funs_cls())
-
-        if thresh_score is not None:
-            # 添加各分排名三列
-            df_cls = df_add_rank(df_cls, lst=thresh_score, sum_col_name="总人数", dot_col_name="点积", rank_col_name="排名")
-        return df_cls
+        # 按班级分组，统计班次<=max_class_rank的学生级次落在各名次段的人数。cumu:0为不累计，1为累计。生成一个报表.
+        df_cls = self._count_bins({"级次": thresh}, cumu=cumu, mode=mode, max_class_rank=max_class_rank)
+        return _cls_report(df_cls, thresh_score)
 
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   组合报表（基本报表+核心报表） ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
     # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -317,9 +581,87 @@ class Andf:
         fsd_df = self.get_fsd(dic_thresh_sbj=dic_thresh_sbj,thresh_score=thresh_score,add_rank_cols=0)
         for key,dff in fsd_df.items():
             dff.insert(0, '双达标<='+ str(max_subject_rank), df_db[key])
-            dff = df_add_rank(dff, lst=thresh_score, sum_col_name="积分", dot_col_name="点积", rank_col_name="排名")
-            fsd_df[key] = dff
-        return fsd_df
+        # 各学科表批量添加积分、点积、排名三列
+        return df_add_rank_batch(fsd_df, lst=thresh_score, sum_col_name="积分", dot_col_name="点积", rank_col_name="排名")
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   报表计划（批量生成报表） ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 报表类型与生成方法的对应关系
+    REPORT_KINDS: Dict[str, str] = {"fsd": "get_fsd", "sdb": "get_sdb", "lv": "get_lv", "cls": "get_cls",
+                                    "db": "get_db", "db_fsd": "get_db_fsd", "mc": "get_mc", "all": "get_all"}
+
+    # 按报表计划一次生成多个报表。
+    def build_reports(self,
+                      plan: List[Dict[str, Any]]     # 报表计划.如:[{"name": "bj", "report": "cls", "thresh": [0, 10, 50]}]
+                      ) -> Dict[str, Any]:
+        """
+        按报表计划一次生成多个报表，逐项调用对应的 get_xxx 方法，报表之间通过Andf的缓存共用中间结果：
+          - 学科数值列、总分、班次、级次只计算一次；
+          - fsd、lv、cls：最大班次不超过60时共用一个班级名次阶梯，同一组阈值只累加一次，
+            其他最大班次只需下标取值；超过60时按班次筛选后统计；
+          - sdb、mc：同一最大班次共用一张名次表（_mc）与一次班级编码（_groups），sdb还共用双名次累计表；
+            db、db_fsd共用全部学生的名次表与班级编码。
+        :param plan: 报表计划，列表。每项为字典：
+            "report": 报表类型，"fsd"、"sdb"、"lv"、"cls"、"db"、"db_fsd"、"mc"、"all" 之一；
+            "name":   结果字典中的键，可选，默认与 "report" 相同；
+            其余键值对原样传给对应的 get_xxx 方法，如 {"report": "cls", "thresh": [0, 10, 50], "cumu": 1}。
+        :return: {name: 报表}字典，报表与单独调用 get_xxx 方法的返回值相同。
+        """
+        # 先校验整个计划，避免生成一半报表后才报错
+        specs = []
+        for i, spec in enumerate(plan):
+            if not isinstance(spec, dict):
+                raise TypeError(f"plan[{i}] 必须是字典，当前类型: {type(spec).__name__}")
+            params = dict(spec)
+            kind = params.pop("report", None)
+            if kind not in self.REPORT_KINDS:
+                raise ValueError(f"plan[{i}] 的 report 必须是 {list(self.REPORT_KINDS)} 之一，当前值: {kind}")
+            name = params.pop("name", kind)
+            if any(name == n for n, _, _ in specs):
+                raise ValueError(f"plan[{i}] 的 name 重复: {name}")
+            specs.append((name, kind, params))
+
+        # 逐项生成报表，共用的派生列、阶梯、名次表、班级编码由缓存复用
+        return {name: getattr(self, self.REPORT_KINDS[kind])(**params) for name, kind, params in specs}
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 核心报表的后处理：Andf与ScoreCube共用，由分组统计表生成get_fsd、get_lv、get_cls的报表。
+def _fsd_report(df_fsd: pd.DataFrame, thresh_score: Optional[List[Union[int, float]]],
+                add_rank_cols: int = 1) -> Dict[Any, pd.DataFrame]:
+    # 依据第0列索引，分割数据为多个df表。
+    dfs_fsd = df_split_levels(df_fsd)
+    # 添加各分排名三列（各学科表批量计算）
+    if thresh_score != None and add_rank_cols == 1:
+        dfs_fsd = df_add_rank_batch(dfs_fsd, lst=thresh_score, sum_col_name="积分", dot_col_name="点积",
+                                    rank_col_name="点积排名")
+    for key, dff in dfs_fsd.items():
+        # 添加行索引名称
+        dff.index.name = key
+    return dfs_fsd
+
+
+def _lv_thresh(dic_total_sbj: Dict[int, List[str]], thresh: List[float], sbj_lst: List[str]) -> Dict[str, np.ndarray]:
+    # {学科:总分}字典，按学科顺序排序；阈值为比率×总分，如[72, 96, 120]
+    dic = dict_rev_sort(dic=dic_total_sbj, sort_order=sbj_lst)
+    return {key: np.array(thresh + [1]) * val for key, val in dic.items()}
+
+
+def _lv_report(df_lv: pd.DataFrame, add_rank_cols: Optional[List[int]] = None) -> Dict[Any, pd.DataFrame]:
+    # 依据第0列索引，分割数据为多个df表，加入排名列。
+    dfs_lv = df_split_levels(df_lv)
+    if add_rank_cols != None:
+        for key, dff in dfs_lv.items():
+            dfs_lv[key] = df_add_cols_rank(dff, columns_to_rank=add_rank_cols)
+    return dfs_lv
+
+
+def _cls_report(df_cls: pd.DataFrame, thresh_score: Optional[List[Union[int, float]]]) -> pd.DataFrame:
+    df_cls = df_cls["级次"]
+    if thresh_score is not None:
+        # 添加各分排名三列
+        df_cls = df_add_rank(df_cls, lst=thresh_score, sum_col_name="总人数", dot_col_name="点积", rank_col_name="排名")
+    return df_cls
 
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■   四大分析函数（组）单元   ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -496,6 +838,71 @@ def make_bin_counters(
         for c in counters:
             print(f"{c.__name__}: {c(data)}")
     """
+    # 参数验证，并生成区间列表
+    thresh, intervals = _bin_intervals(thresh, cumu=cumu, mode=mode)
+
+    def make_counter(lower, upper):
+        def counter(arr):
+            # 处理 pandas Series 对象
+            if isinstance(arr, pd.Series):
+                # 检查 Series 是否为空
+                if arr.empty:
+                    return 0
+                # 转换为 numpy 数组
+                arr = arr.values
+            # 验证输入数据
+            elif not isinstance(arr, (list, tuple, np.ndarray)):
+                raise TypeError("输入数据必须是列表、元组、numpy 数组或 pandas Series")
+
+            # 转换为 numpy 数组
+            arr = np.asarray(arr)
+
+            # 验证数组元素类型
+            if not np.issubdtype(arr.dtype, np.number):
+                raise TypeError("输入数组中的所有元素必须是数字类型")
+
+            # 过滤掉 NaN 值，只处理有效数值
+            valid_arr = arr[~np.isnan(arr)]
+
+            # 检查是否有无穷大值
+            if np.any(np.isinf(valid_arr)):
+                raise ValueError("输入数组中包含无穷大值")
+
+            # 如果过滤后没有有效数据，返回0
+            if len(valid_arr) == 0:
+                return 0
+
+            # 根据模式计算计数
+            if cumu == 1 and upper != float('inf'):
+                # 累计区间部分
+                if mode == 0:
+                    return np.sum((valid_arr >= lower) & (valid_arr < upper))
+                else:
+                    return np.sum((valid_arr > lower) & (valid_arr <= upper))
+            else:
+                # 滑动区间 或 最后独立区间
+                if mode == 0:
+                    return np.sum((valid_arr >= lower) & (valid_arr < upper))
+                else:
+                    return np.sum((valid_arr > lower) & (valid_arr <= upper))
+
+        # ========== 函数命名：统一使用 "Count[...)" 或 "Count(...]" ==========
+        counter.__name__ = _bin_name(lower, upper, mode)
+        return counter
+
+    return [make_counter(l, u) for l, u in intervals]
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 校验分段阈值，并生成分段区间列表（make_bin_counters 与 count_bins_by_group 共用）。
+def _bin_intervals(
+        thresh: Union[List[Union[int, float]], Tuple[Union[int, float], ...]],
+        cumu: int = 0,
+        mode: int = 0
+        ) -> Tuple[List[Union[int, float]], List[Tuple[Union[int, float], float]]]:
+    """
+    校验分段阈值，并生成分段区间列表。
+    :return: (排序后的阈值列表, [(lower, upper), ...])，最后一个区间的 upper 为 inf。
+    """
     # ========== 参数验证 ==========
     # 1. 验证 thresh 类型
     if not isinstance(thresh, (list, tuple)):
@@ -533,7 +940,7 @@ def make_bin_counters(
     # 排序（不影响原始数据）
     thresh_sorted = sorted(thresh)
     if thresh_sorted != list(thresh):
-        print(f"⚠️  警告: thresh 已自动排序（原: {thresh} → 现: {thresh_sorted}）")
+        warnings.warn(f"thresh 已自动排序（原: {thresh} → 现: {thresh_sorted}）")
     thresh = thresh_sorted
 
     base = thresh[0]
@@ -549,65 +956,184 @@ def make_bin_counters(
         thresh_ext = thresh + [float('inf')]
         intervals = [(thresh_ext[i], thresh_ext[i + 1]) for i in range(len(thresh_ext) - 1)]
 
-    def make_counter(lower, upper):
-        def counter(arr):
-            # 处理 pandas Series 对象
-            if isinstance(arr, pd.Series):
-                # 检查 Series 是否为空
-                if arr.empty:
-                    return 0
-                # 转换为 numpy 数组
-                arr = arr.values
-            # 验证输入数据
-            elif not isinstance(arr, (list, tuple, np.ndarray)):
-                raise TypeError("输入数据必须是列表、元组、numpy 数组或 pandas Series")
-
-            # 转换为 numpy 数组
-            arr = np.asarray(arr)
+    return thresh, intervals
 
-            # 验证数组元素类型
-            if not np.issubdtype(arr.dtype, np.number):
-                raise TypeError("输入数组中的所有元素必须是数字类型")
+# 生成分段区间的列名：Count[lower-upper) 或 Count(lower-upper]
+def _bin_name(lower: Union[int, float], upper: Union[int, float], mode: int = 0) -> str:
+    left_bracket = '[' if mode == 0 else '('
+    right_bracket = ')' if mode == 0 else ']'
+    # 处理无穷大的显示
+    upper_display = "inf" if math.isinf(upper) else upper
+    return f"Count{left_bracket}{lower}-{upper_display}{right_bracket}"
 
-            # 过滤掉 NaN 值，只处理有效数值
-            valid_arr = arr[~np.isnan(arr)]
-
-            # 检查是否有无穷大值
-            if np.any(np.isinf(valid_arr)):
-                raise ValueError("输入数组中包含无穷大值")
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 将分组列转换为整数编码（与 groupby(sort=True) 的分组顺序一致，空值编码为 -1）。
+def _group_codes(sr: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """
+    将分组列转换为整数编码。
+    :param sr: 分组列，如 df["班级"]。
+    :return: (编码数组, 分组索引)。编码与 groupby(sort=True) 的分组顺序一致，空值编码为 -1。
+    """
+    codes, uniques = pd.factorize(sr, sort=True)
+    return codes, pd.Index(uniques, name=sr.name)
+
+# 取出数值列为 float 数组，校验类型与无穷大值。
+def _float_values(sr: pd.Series) -> np.ndarray:
+    if not pd.api.types.is_numeric_dtype(sr):
+        raise TypeError(f"列 '{sr.name}' 中的所有元素必须是数字类型")
+    arr = sr.to_numpy(dtype=float, na_value=np.nan)
+    if np.isinf(arr).any():
+        raise ValueError(f"列 '{sr.name}' 中包含无穷大值")
+    return arr
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 计数排名：成绩为有界的整数、0.5分或0.25分时，用各分数的人数表（直方图）与累计和得到min法名次，不排序。
+# 放大倍数只取2的幂，放大后的分数与原分数一一对应，并列关系与排序法完全相同。
+_COUNT_RANK_SCALES = (1, 2, 4)
+_COUNT_RANK_MAX_CELLS = 1 << 22     # 人数表（分组数×分数个数）的最大格数，超过时使用排序法
+
+
+def _count_rank_bins(x: np.ndarray) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    将非空分数转换为从0开始的整数分数格编号。
+    :return: (编号数组, 分数格数)；分数不是有界的整数、0.5分或0.25分时返回None。
+    """
+    if not len(x):
+        return np.zeros(0, dtype=np.int64), 1
+    low, high = x.min(), x.max()
+    for scale in _COUNT_RANK_SCALES:
+        scaled = (x - low) * scale
+        span = (high - low) * scale + 1
+        if span > max(8 * len(x), 4096):
+            return None
+        bins = scaled.astype(np.int64)
+        if np.array_equal(bins, scaled):
+            return bins, int(span)
+    return None
+
+
+def _count_rank(x: np.ndarray, ascending: bool = False, codes: Optional[np.ndarray] = None,
+                n_groups: int = 1) -> Optional[np.ndarray]:
+    """
+    计数排名（method='min'，空值为空值），codes不为None时在各组内排名（编码-1的行为空值）。
+    :return: float数组；不适用计数排名时返回None。
+    """
+    valid = ~np.isnan(x)
+    if codes is not None:
+        valid &= codes >= 0
+    found = _count_rank_bins(x[valid])
+    if found is None:
+        return None
+    bins, span = found
+    if n_groups * span > _COUNT_RANK_MAX_CELLS:
+        return None
+    if codes is not None:
+        bins = codes[valid] * span + bins
+    counts = np.bincount(bins, minlength=n_groups * span).reshape(n_groups, span)
+    if ascending:
+        # 低于该分数的人数 = 组内累计人数 - 本分数人数
+        before = np.cumsum(counts, axis=1) - counts
+    else:
+        # 高于该分数的人数 = 组内从高到低的累计人数 - 本分数人数
+        before = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1] - counts
+    out = np.full(len(x), np.nan)
+    out[valid] = before.ravel()[bins] + 1
+    return out
 
-            # 如果过滤后没有有效数据，返回0
-            if len(valid_arr) == 0:
-                return 0
 
-            # 根据模式计算计数
-            if cumu == 1 and upper != float('inf'):
-                # 累计区间部分
-                if mode == 0:
-                    return np.sum((valid_arr >= lower) & (valid_arr < upper))
-                else:
-                    return np.sum((valid_arr > lower) & (valid_arr <= upper))
+def rank_min(sr: pd.Series, ascending: bool = False, by: Optional[pd.Series] = None) -> pd.Series:
+    """
+    min法排名，结果与sr.rank(method='min', ascending=ascending)、
+    sr.groupby(by).rank(method='min', ascending=ascending)相同。
+    成绩为有界的整数、0.5分或0.25分时使用计数排名，否则使用pandas排名。
+    :param sr: 数值列。
+    :param ascending: 是否升序，默认False：分数高的名次靠前。
+    :param by: 分组列，如班级列，默认None：不分组。分组值为空值的行名次为空值。
+    :return: float类型的名次列，索引、列名与sr相同。
+    """
+    # 只处理numpy数值类型（可空整数等扩展类型的排名规则与numpy类型不同，交给pandas）
+    if isinstance(sr.dtype, np.dtype) and sr.dtype.kind in "iuf":
+        x = sr.to_numpy(dtype=float, na_value=np.nan)
+        if not np.isinf(x).any():
+            if by is None:
+                out = _count_rank(x, ascending)
             else:
-                # 滑动区间 或 最后独立区间
-                if mode == 0:
-                    return np.sum((valid_arr >= lower) & (valid_arr < upper))
-                else:
-                    return np.sum((valid_arr > lower) & (valid_arr <= upper))
+                codes, index = _group_codes(by)
+                out = _count_rank(x, ascending, codes, max(len(index), 1))
+            if out is not None:
+                return pd.Series(out, index=sr.index, name=sr.name)
+    if by is None:
+        return sr.rank(method="min", ascending=ascending)
+    return sr.groupby(by).rank(method="min", ascending=ascending)
 
-        # ========== 函数命名：统一使用 "Count[...)" 或 "Count(...]" ==========
-        left_bracket = '[' if mode == 0 else '('
-        right_bracket = ')' if mode == 0 else ']'
 
-        # 处理无穷大的显示
-        if math.isinf(upper):
-            upper_display = "inf"
-        else:
-            upper_display = upper
+# {列名: 阈值列表}的缓存键。用repr区分整数与浮点数阈值（二者生成的列名不同）。
+def _thresh_key(dic_thresh: Dict[str, Any]) -> str:
+    return repr([(col, list(thresh)) for col, thresh in dic_thresh.items()])
 
-        counter.__name__ = f"Count{left_bracket}{lower}-{upper_display}{right_bracket}"
-        return counter
-
-    return [make_counter(l, u) for l, u in intervals]
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 分组分段计数引擎：一次性统计所有列、所有分组、所有区间的人数。
+def count_bins_by_group(
+        df: pd.DataFrame,
+        by: str,
+        dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...]]],
+        cumu: int = 0,
+        mode: int = 0,
+        groups: Optional[Tuple[np.ndarray, pd.Index]] = None
+        ) -> pd.DataFrame:
+    """
+    分组分段计数引擎，结果等价于 df.groupby(by).agg({列名: make_bin_counters(阈值, cumu, mode)})。
+
+    不再为每个 分组×列×区间 调用一次计数函数，而是：
+      1. 分组列编码为整数（班级编码）；
+      2. 每列用 np.searchsorted 一次求出所有数值所在的区间序号；
+      3. 以 (列, 分组, 区间) 合成一维下标，用一次 np.bincount 求出全部计数。
+    累计模式（cumu=1）由相邻区间计数按行累加得到。
+
+    :param df: 数据表，须包含分组列与 dic_thresh 中的所有列。
+    :param by: 分组列名，如 "班级"。
+    :param dic_thresh: {列名: 阈值列表}，如 {"语文": (36, 48, 60), "物理": (21, 28, 35)}。
+    :param cumu: 0 为滑动区间，1 为固定起点累计区间，同 make_bin_counters。
+    :param mode: 0 为前闭后开，1 为前开后闭，同 make_bin_counters。
+    :param groups: 预先计算的 _group_codes(df[by]) 结果，多个报表共用同一分组时传入，避免重复编码。
+    :return: 行索引为分组值，列索引为 (列名, "Count[...)") 两级索引的计数表。
+    """
+    codes, index = groups if groups is not None else _group_codes(df[by])
+    n_groups = len(index)
+    valid_group = codes >= 0
+
+    # 每列的区间与在合成下标中的偏移量
+    plans = []
+    offset = 0
+    for col, thresh in dic_thresh.items():
+        thresh, intervals = _bin_intervals(thresh, cumu=cumu, mode=mode)
+        plans.append((col, thresh, intervals, offset))
+        offset += n_groups * len(thresh)
+
+    # 合成下标：offset + 分组编码 × 区间数 + 区间序号
+    keys = []
+    for col, thresh, intervals, off in plans:
+        arr = _float_values(df[col])
+        # mode=0: [a,b) → side='right'；mode=1: (a,b] → side='left'
+        side = 'right' if mode == 0 else 'left'
+        bins = np.searchsorted(np.asarray(thresh, dtype=float), arr, side=side) - 1
+        # 低于最小阈值（bins=-1）与 NaN（排在末尾，但不参与计数）均剔除
+        ok = valid_group & (bins >= 0) & ~np.isnan(arr)
+        keys.append(off + codes[ok] * len(thresh) + bins[ok])
+    counts = np.bincount(np.concatenate(keys) if keys else np.empty(0, dtype=np.intp), minlength=offset)
+
+    # 按列还原为 (分组 × 区间) 矩阵，累计模式下前 k-1 个区间做行累加
+    blocks, columns = [], []
+    for col, thresh, intervals, off in plans:
+        k = len(thresh)
+        mat = counts[off:off + n_groups * k].reshape(n_groups, k)
+        if cumu == 1:
+            mat = np.hstack([np.cumsum(mat[:, :k - 1], axis=1), mat[:, k - 1:]])
+        blocks.append(mat)
+        columns.extend((col, _bin_name(lower, upper, mode)) for lower, upper in intervals)
+
+    data = np.hstack(blocks) if blocks else np.empty((n_groups, 0), dtype=np.int64)
+    return pd.DataFrame(data.astype(np.int64), index=index, columns=pd.MultiIndex.from_tuples(columns))
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 生成一组"双条件计数器"(Dual Condition Counters)，支持名次模式与分数模式。
@@ -672,46 +1198,7 @@ def make_dual_cond_counters(
             print(f"{c.__name__}: {c(data_score)}")
     """
     # ========== 参数校验 ==========
-    # 1. 验证 thresh 类型
-    if not isinstance(thresh, (list, tuple)):
-        raise TypeError(f"'thresh' 应为 list 或 tuple，当前类型: {type(thresh).__name__}")
-
-    # 2. 验证 thresh 长度
-    if len(thresh) < 2:
-        raise ValueError(f"'thresh' 至少需要2个阈值，当前: {len(thresh)}")
-
-    # 3. 验证 thresh 元素类型和值
-    for i, x in enumerate(thresh):
-        if not isinstance(x, (int, float)):
-            raise TypeError(f"thresh 中的元素必须为数字（int/float），但索引 {i} 的元素是 {type(x).__name__}")
-        if math.isnan(x):
-            raise ValueError(f"thresh 中的元素不能为 NaN，但索引 {i} 的元素是 NaN")
-        if x < 0:
-            raise ValueError(f"thresh 中的元素必须为非负数，但索引 {i} 的元素是 {x}")
-
-    # 4. 验证 sec_thresh 类型和值
-    if not isinstance(sec_thresh, (int, float)):
-        raise TypeError(f"'sec_thresh' 必须为数字（int/float），当前类型: {type(sec_thresh).__name__}")
-    if math.isnan(sec_thresh):
-        raise ValueError("'sec_thresh' 不能为 NaN")
-    if sec_thresh < 0:
-        raise ValueError(f"'sec_thresh' 必须为非负数，当前值: {sec_thresh}")
-
-    # 5. 验证 mode 类型和值
-    if not isinstance(mode, str):
-        raise TypeError(f"'mode' 必须为字符串，当前类型: {type(mode).__name__}")
-    if mode not in ('rank', 'score'):
-        raise ValueError(f"mode 必须为 'rank' 或 'score'，当前: {mode}")
-
-    # 6. 验证 thresh 是否为严格升序序列
-    thresh_sorted = sorted(thresh)
-    if thresh_sorted != list(thresh):
-        print(f"⚠️  警告: thresh 已自动排序（原: {thresh} → 现: {thresh_sorted}）")
-    thresh = thresh_sorted
-
-    # 检查是否有重复值
-    if len(set(thresh)) != len(thresh):
-        raise ValueError("thresh 中包含重复值")
+    thresh = _dual_cond_thresh(thresh, sec_thresh, mode)
 
     # ========== 根据 mode 设置比较逻辑 ==========
     if mode == 'rank':
@@ -720,18 +1207,12 @@ def make_dual_cond_counters(
         main_upper_op = lambda x, u: x <= u  # 小于等于上界
         secondary_op = lambda y: y <= sec_thresh
         secondary_fail_op = lambda y: y > sec_thresh
-        main_bracket = ('(', ']')
-        secondary_prefix = 'T≤'
-        secondary_fail_prefix = 'T>'
     else:  # mode == 'score'
         # 分数模式：主维度 [lower, upper)，次维度 >= sec_thresh
         main_lower_op = lambda x, l: x >= l  # 大于等于下界
         main_upper_op = lambda x, u: x < u  # 严格小于上界
         secondary_op = lambda y: y >= sec_thresh
         secondary_fail_op = lambda y: y < sec_thresh
-        main_bracket = ('[', ')')
-        secondary_prefix = 'T≥'
-        secondary_fail_prefix = 'T<'
 
     # ========== 生成计数器 ==========
     def make_counter(lower, upper):
@@ -761,11 +1242,6 @@ def make_dual_cond_counters(
                     count += 1
             return count
 
-        # 格式化函数名
-        if math.isinf(upper):
-            counter.__name__ = f"DC{main_bracket[0]}{lower}-inf{main_bracket[1]} {secondary_prefix}{sec_thresh}"
-        else:
-            counter.__name__ = f"DC{main_bracket[0]}{lower}-{upper}{main_bracket[1]} {secondary_prefix}{sec_thresh}"
         return counter
 
     def last_counter(arr):
@@ -794,16 +1270,232 @@ def make_dual_cond_counters(
                 count += 1
         return count
 
-    last_counter.__name__ = f"DC{main_bracket[0]}0-inf{main_bracket[1]} {secondary_fail_prefix}{sec_thresh}"
-
     # 添加无穷大，生成区间
     thresh_ext = thresh + [float('inf')]
     intervals = [(thresh_ext[i], thresh_ext[i + 1]) for i in range(len(thresh_ext) - 1)]
 
-    # 生成所有计数器
+    # 生成所有计数器，并格式化函数名
     counters = [make_counter(l, u) for l, u in intervals] + [last_counter]
+    for counter, name in zip(counters, _dual_cond_names(thresh, sec_thresh, mode)):
+        counter.__name__ = name
     return counters
 
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 校验双条件计数的参数，返回排序后的主维度阈值（make_dual_cond_counters 与 count_dual_cond_by_group 共用）。
+def _dual_cond_thresh(
+        thresh: Union[List[Union[int, float]], Tuple[Union[int, float], ...]],
+        sec_thresh: Union[int, float],
+        mode: str = 'rank'
+        ) -> List[Union[int, float]]:
+    # 1. 验证 thresh 类型
+    if not isinstance(thresh, (list, tuple)):
+        raise TypeError(f"'thresh' 应为 list 或 tuple，当前类型: {type(thresh).__name__}")
+
+    # 2. 验证 thresh 长度
+    if len(thresh) < 2:
+        raise ValueError(f"'thresh' 至少需要2个阈值，当前: {len(thresh)}")
+
+    # 3. 验证 thresh 元素类型和值
+    for i, x in enumerate(thresh):
+        if not isinstance(x, (int, float)):
+            raise TypeError(f"thresh 中的元素必须为数字（int/float），但索引 {i} 的元素是 {type(x).__name__}")
+        if math.isnan(x):
+            raise ValueError(f"thresh 中的元素不能为 NaN，但索引 {i} 的元素是 NaN")
+        if x < 0:
+            raise ValueError(f"thresh 中的元素必须为非负数，但索引 {i} 的元素是 {x}")
+
+    # 4. 验证 sec_thresh 类型和值
+    if not isinstance(sec_thresh, (int, float)):
+        raise TypeError(f"'sec_thresh' 必须为数字（int/float），当前类型: {type(sec_thresh).__name__}")
+    if math.isnan(sec_thresh):
+        raise ValueError("'sec_thresh' 不能为 NaN")
+    if sec_thresh < 0:
+        raise ValueError(f"'sec_thresh' 必须为非负数，当前值: {sec_thresh}")
+
+    # 5. 验证 mode 类型和值
+    if not isinstance(mode, str):
+        raise TypeError(f"'mode' 必须为字符串，当前类型: {type(mode).__name__}")
+    if mode not in ('rank', 'score'):
+        raise ValueError(f"mode 必须为 'rank' 或 'score'，当前: {mode}")
+
+    # 6. 验证 thresh 是否为严格升序序列
+    thresh_sorted = sorted(thresh)
+    if thresh_sorted != list(thresh):
+        warnings.warn(f"thresh 已自动排序（原: {thresh} → 现: {thresh_sorted}）")
+    thresh = thresh_sorted
+
+    # 检查是否有重复值
+    if len(set(thresh)) != len(thresh):
+        raise ValueError("thresh 中包含重复值")
+
+    return thresh
+
+# 生成双条件计数的列名：各区间 'DC(0-60] T≤100'，最后为超限统计 'DC(0-inf] T>100'。
+def _dual_cond_names(thresh: List[Union[int, float]], sec_thresh: Union[int, float], mode: str = 'rank') -> List[str]:
+    if mode == 'rank':
+        main_bracket, secondary_prefix, secondary_fail_prefix = ('(', ']'), 'T≤', 'T>'
+    else:
+        main_bracket, secondary_prefix, secondary_fail_prefix = ('[', ')'), 'T≥', 'T<'
+    thresh_ext = list(thresh) + [float('inf')]
+    names = []
+    for lower, upper in zip(thresh_ext[:-1], thresh_ext[1:]):
+        upper_display = "inf" if math.isinf(upper) else upper
+        names.append(f"DC{main_bracket[0]}{lower}-{upper_display}{main_bracket[1]} {secondary_prefix}{sec_thresh}")
+    names.append(f"DC{main_bracket[0]}0-inf{main_bracket[1]} {secondary_fail_prefix}{sec_thresh}")
+    return names
+
+# 按分组统计布尔掩码为 True 的个数。
+def _count_true_by_group(codes: np.ndarray, n_groups: int, mask: np.ndarray) -> np.ndarray:
+    return np.bincount(codes[mask & (codes >= 0)], minlength=n_groups)
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 分组双条件计数引擎：直接在 学科名次、总分名次 数组上统计，不再组合元组。
+def count_dual_cond_by_group(
+        df: pd.DataFrame,
+        by: str,
+        cols: List[str],
+        sec_col: str,
+        thresh: Union[List[Union[int, float]], Tuple[Union[int, float], ...]],
+        sec_thresh: Union[int, float],
+        mode: str = 'rank',
+        groups: Optional[Tuple[np.ndarray, pd.Index]] = None
+        ) -> pd.DataFrame:
+    """
+    分组双条件计数引擎，结果等价于：
+        df_pair_cols(df, cols, sec_col).groupby(by).agg({列名: make_dual_cond_counters(thresh, sec_thresh, mode)})
+
+    主维度（如学科名次）用 np.searchsorted 一次求出区间序号，与次维度（如总分名次）的布尔掩码组合后，
+    按 (列, 分组, 区间) 合成下标，用 np.bincount 统计全部人数。
+
+    :param df: 数据表，须包含分组列、cols 中的列与次维度列。
+    :param by: 分组列名，如 "班级"。
+    :param cols: 主维度列名列表，如 ["语文", "数学"]（值为学科名次）。
+    :param sec_col: 次维度列名，如 "总分"（值为总分名次）。
+    :param thresh: 主维度分段阈值，如 [0, 200, 260, 300]。
+    :param sec_thresh: 次维度阈值，如 260。
+    :param mode: 'rank' 名次模式 (lower, upper] 且 ≤ sec_thresh；'score' 分数模式 [lower, upper) 且 ≥ sec_thresh。
+    :param groups: 预先计算的 _group_codes(df[by]) 结果，多个报表共用同一分组时传入，避免重复编码。
+    :return: 行索引为分组值，列索引为 (列名, 'DC(...] T≤n') 两级索引的计数表，每列最后为 'T>n' 超限统计。
+    """
+    thresh = _dual_cond_thresh(thresh, sec_thresh, mode)
+    names = _dual_cond_names(thresh, sec_thresh, mode)
+    codes, index = groups if groups is not None else _group_codes(df[by])
+    n_groups, k = len(index), len(thresh)
+
+    # 次维度条件：满足 / 不满足（NaN 两者都不满足）
+    sec = _float_values(df[sec_col])
+    if mode == 'rank':
+        sec_ok, sec_fail, side = sec <= sec_thresh, sec > sec_thresh, 'left'
+    else:
+        sec_ok, sec_fail, side = sec >= sec_thresh, sec < sec_thresh, 'right'
+    fail_counts = _count_true_by_group(codes, n_groups, sec_fail)
+
+    # 合成下标：列序号 × (分组数 × 区间数) + 分组编码 × 区间数 + 区间序号
+    keep = sec_ok & (codes >= 0)
+    edges = np.asarray(thresh, dtype=float)
+    keys = []
+    for j, col in enumerate(cols):
+        arr = _float_values(df[col])
+        bins = np.searchsorted(edges, arr, side=side) - 1
+        ok = keep & (bins >= 0) & ~np.isnan(arr)
+        keys.append(j * n_groups * k + codes[ok] * k + bins[ok])
+    size = len(cols) * n_groups * k
+    counts = np.bincount(np.concatenate(keys) if keys else np.empty(0, dtype=np.intp), minlength=size)
+
+    blocks = [np.column_stack([counts[j * n_groups * k:(j + 1) * n_groups * k].reshape(n_groups, k), fail_counts])
+              for j in range(len(cols))]
+    data = np.hstack(blocks) if blocks else np.empty((n_groups, 0), dtype=np.int64)
+    columns = pd.MultiIndex.from_tuples([(col, name) for col in cols for name in names])
+    return pd.DataFrame(data.astype(np.int64), index=index, columns=columns)
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 双名次累计表：各班、各学科的 (学科名次, 总分名次) 二维累计人数表，
+# count(学科名次<=a 且 总分名次<=b) 只需两次二分查找与一次下标取值，调整双达标阈值时不再重新统计。
+# 只有总分名次<=limit的学生进入二维表（b不能超过limit），坐标为这些学生的不同名次，表的大小与limit有关、与总人数无关。
+_DUAL_TABLE_MAX_CELLS = 1 << 24     # 全部学科二维表的最大格数，超过时使用count_dual_cond_by_group()
+
+
+class _DualRankTable:
+
+    def __init__(self, df_mc: pd.DataFrame, cols: List[str], sec_col: str,
+                 groups: Tuple[np.ndarray, pd.Index], limit: Union[int, float]) -> None:
+        """
+        :param df_mc: 名次表（学科名次、总分名次为独立的列）。
+        :param cols: 学科列名列表。
+        :param sec_col: 次维度列名，如"总分"。
+        :param groups: _group_codes(df_mc["班级"])。
+        :param limit: 总分名次上限，查询的b不能超过limit。
+        """
+        codes, self.index = groups
+        self.cols = list(cols)
+        self.limit = limit
+        n_groups = len(self.index)
+        sec = _float_values(df_mc[sec_col])
+        valid = (codes >= 0) & ~np.isnan(sec)
+
+        # 总分名次的一维累计人数（用于"总分名次>b"的超限统计）
+        inside = valid & (sec <= limit)
+        self.sec_values = np.unique(sec[inside])
+        n_sec = len(self.sec_values) + 1
+        sec_pos = np.searchsorted(self.sec_values, sec[inside]) + 1
+        self.sec_valid = np.bincount(codes[valid], minlength=n_groups)
+        self.sec_table = np.cumsum(np.bincount(codes[inside] * n_sec + sec_pos, minlength=n_groups * n_sec)
+                                   .reshape(n_groups, n_sec), axis=1)
+
+        # 各学科的二维累计人数：tables[col][分组, 学科名次坐标, 总分名次坐标]
+        self.values: Dict[str, np.ndarray] = {}
+        self.tables: Dict[str, np.ndarray] = {}
+        for col in self.cols:
+            arr = _float_values(df_mc[col])
+            ok = inside & ~np.isnan(arr)
+            values = np.unique(arr[ok])
+            n_main = len(values) + 1
+            keys = (codes[ok] * n_main + np.searchsorted(values, arr[ok]) + 1) * n_sec + sec_pos[ok[inside]]
+            table = np.bincount(keys, minlength=n_groups * n_main * n_sec).reshape(n_groups, n_main, n_sec)
+            self.values[col] = values
+            self.tables[col] = table.cumsum(axis=1).cumsum(axis=2).astype(np.int32)
+
+    @staticmethod
+    def cells(df_mc: pd.DataFrame, cols: List[str], sec_col: str, n_groups: int, limit: Union[int, float]) -> int:
+        """估算全部学科二维表的格数。"""
+        sec = _float_values(df_mc[sec_col])
+        inside = sec <= limit
+        n_sec = len(np.unique(sec[inside])) + 1
+        return sum(n_groups * (len(np.unique(_float_values(df_mc[col])[inside])) + 1) * n_sec for col in cols)
+
+    def count(self, col: str, a: Union[int, float, np.ndarray], b: Union[int, float]) -> np.ndarray:
+        """
+        各班 学科名次<=a 且 总分名次<=b 的人数，a可以是数组（可含inf）。
+        :return: 形状为 (分组数,) 或 (分组数, len(a)) 的数组。
+        """
+        if b > self.limit:
+            raise ValueError(f"总分名次{b}超过了二维表的上限{self.limit}")
+        ia = np.searchsorted(self.values[col], a, side="right")
+        ib = np.searchsorted(self.sec_values, b, side="right")
+        return self.tables[col][:, ia, ib]
+
+    def sec_fail(self, b: Union[int, float]) -> np.ndarray:
+        """各班 总分名次>b 的人数。"""
+        return self.sec_valid - self.sec_table[:, np.searchsorted(self.sec_values, b, side="right")]
+
+    def interval_counts(self, thresh: List[Union[int, float]], b: Union[int, float]) -> np.ndarray:
+        """
+        各班、各学科 学科名次在各区间(lower, upper]（末区间为(最后阈值, inf)）且 总分名次<=b 的人数，
+        每个学科最后为"总分名次>b"的人数，列顺序与count_dual_cond_by_group()相同。
+        """
+        edges = np.append(np.asarray(thresh, dtype=float), np.inf)
+        fail = self.sec_fail(b)[:, None]
+        blocks = [np.hstack([np.diff(self.count(col, edges, b), axis=1), fail]) for col in self.cols]
+        return np.hstack(blocks) if blocks else np.empty((len(self.index), 0), dtype=np.int64)
+
+    def frame(self, thresh: List[Union[int, float]], b: Union[int, float]) -> pd.DataFrame:
+        """结果与count_dual_cond_by_group(df_mc, "班级", cols, sec_col, thresh, b)相同。"""
+        thresh = _dual_cond_thresh(thresh, b, 'rank')
+        names = _dual_cond_names(thresh, b, 'rank')
+        columns = pd.MultiIndex.from_tuples([(col, name) for col in self.cols for name in names])
+        return pd.DataFrame(self.interval_counts(thresh, b).astype(np.int64), index=self.index, columns=columns)
+
+
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 根据阈值生成一组成绩区间统计函数（计数 + 比率），可选生成低于最低分统计、平均分函数和有效数据个数统计。
 def make_rate_counters(
@@ -843,42 +1535,9 @@ def make_rate_counters(
     :raises ValueError: 当参数不符合要求时；
     :raises TypeError: 当参数类型不正确时。
     """
-    # 参数验证。
-    if not isinstance(thresh, (list, tuple, np.ndarray)):
-        raise TypeError("thresh 必须为列表、元组或 numpy 数组。")
-
-    if isinstance(thresh, np.ndarray):
-        thresh = thresh.tolist()
-
-    if len(thresh) < 2:
-        raise ValueError("thresh 必须包含至少 2 个元素。")
-
-    for i, t in enumerate(thresh):
-        if not isinstance(t, (int, float)):
-            raise TypeError(f"thresh 中的所有元素必须是数字类型，但索引 {i} 的元素是 {type(t)}。")
-
-    for i in range(len(thresh) - 1):
-        if thresh[i] >= thresh[i + 1]:
-            raise ValueError("thresh 必须是严格升序序列。")
-
-    if not isinstance(cumu, bool):
-        raise TypeError("cumu 必须是布尔值。")
-
-    if not isinstance(include_below_min, bool):
-        raise TypeError("include_below_min 必须是布尔值。")
-
-    if not isinstance(include_mean, bool):
-        raise TypeError("include_mean 必须是布尔值。")
-
-    if not isinstance(include_count_valid, int):
-        raise TypeError("include_count_valid 必须是整数（0, 1, -1）。")
-
-    if include_count_valid not in [0, 1, -1]:
-        raise ValueError("include_count_valid 必须是 0, 1 或 -1。")
-
-    for i, t in enumerate(thresh):
-        if t < 0:
-            raise ValueError(f"thresh 中的所有元素必须为非负数，但索引 {i} 的元素为 {t}。")
+    # 参数验证，并生成各统计列的说明（列名、类型、上下限）。
+    specs = _rate_specs(thresh, cumu=cumu, include_mean=include_mean,
+                        include_below_min=include_below_min, include_count_valid=include_count_valid)
 
     def make_threshold_func(lower, upper=None, ratio=False, cumu_mode=False, is_last_interval=False, below_min=False):
         """
@@ -919,18 +1578,6 @@ def make_rate_counters(
             total = len(arr)
             return count / total if ratio and total > 0 else int(count)
 
-        # 生成函数名。
-        prefix = "ratio" if ratio else "count"
-        if below_min:
-            func_name = f"{prefix}(-∞,{lower})"
-        elif cumu_mode:
-            func_name = f"{prefix}[{lower},+∞)"
-        else:
-            if is_last_interval:
-                func_name = f"{prefix}[{lower},{upper}]"
-            else:
-                func_name = f"{prefix}[{lower},{upper})"
-        func.__name__ = func_name
         return func
 
     def make_mean_func():
@@ -968,67 +1615,681 @@ def make_rate_counters(
         有效数据个数统计函数。
         """
 
-        def func(scores):
-            if isinstance(scores, pd.Series):
-                arr = scores.values
-            elif not isinstance(scores, (list, tuple, np.ndarray)):
-                raise TypeError("输入分数必须是列表、元组或 numpy 数组。")
-            else:
-                arr = np.array(scores)
+        def func(scores):
+            if isinstance(scores, pd.Series):
+                arr = scores.values
+            elif not isinstance(scores, (list, tuple, np.ndarray)):
+                raise TypeError("输入分数必须是列表、元组或 numpy 数组。")
+            else:
+                arr = np.array(scores)
+
+            # 尝试将数组转换为 float
+            try:
+                arr = arr.astype(float)
+            except (ValueError, TypeError):
+                raise TypeError("分数数组必须能转换为数值类型。")
+
+            # 计算有效数据个数（非 NaN）。
+            valid = ~np.isnan(arr)
+            return int(np.sum(valid))
+
+        func.__name__ = "count_valid"
+        return func
+
+    # 按统计列说明生成函数，函数名即列名。
+    funcs = []
+    for name, kind, lower, upper, ratio in specs:
+        if kind == 'below':
+            func = make_threshold_func(lower, ratio=ratio, below_min=True)
+        elif kind == 'ge':
+            func = make_threshold_func(lower, ratio=ratio, cumu_mode=True)
+        elif kind in ('range', 'range_last'):
+            func = make_threshold_func(lower, upper, ratio=ratio, is_last_interval=(kind == 'range_last'))
+        elif kind == 'mean':
+            func = make_mean_func()
+        else:  # count_valid
+            func = make_count_valid_func()
+        func.__name__ = name
+        funcs.append(func)
+
+    return tuple(funcs)
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 校验成绩区间统计的参数，生成各统计列的说明（make_rate_counters 与 rate_stats_by_group 共用）。
+def _rate_specs(
+        thresh: Union[List[Union[int, float]], Tuple[Union[int, float], ...], np.ndarray],
+        cumu: bool = True,
+        include_mean: bool = True,
+        include_below_min: bool = False,
+        include_count_valid: int = 0
+        ) -> List[Tuple[str, str, Optional[float], Optional[float], bool]]:
+    """
+    校验参数，并按 make_rate_counters 的函数顺序生成统计列说明。
+    :return: [(列名, 类型, 下限, 上限, 是否比率), ...]。
+        类型：'below' 低于最低分；'ge' 累计 [t,+∞)；'range' 区间 [a,b)；'range_last' 末区间 [a,b]；
+              'mean' 平均分；'count_valid' 有效人数。
+    """
+    # 参数验证。
+    if not isinstance(thresh, (list, tuple, np.ndarray)):
+        raise TypeError("thresh 必须为列表、元组或 numpy 数组。")
+
+    if isinstance(thresh, np.ndarray):
+        thresh = thresh.tolist()
+
+    if len(thresh) < 2:
+        raise ValueError("thresh 必须包含至少 2 个元素。")
+
+    for i, t in enumerate(thresh):
+        if not isinstance(t, (int, float)):
+            raise TypeError(f"thresh 中的所有元素必须是数字类型，但索引 {i} 的元素是 {type(t)}。")
+
+    for i in range(len(thresh) - 1):
+        if thresh[i] >= thresh[i + 1]:
+            raise ValueError("thresh 必须是严格升序序列。")
+
+    if not isinstance(cumu, bool):
+        raise TypeError("cumu 必须是布尔值。")
+
+    if not isinstance(include_below_min, bool):
+        raise TypeError("include_below_min 必须是布尔值。")
+
+    if not isinstance(include_mean, bool):
+        raise TypeError("include_mean 必须是布尔值。")
+
+    if not isinstance(include_count_valid, int):
+        raise TypeError("include_count_valid 必须是整数（0, 1, -1）。")
+
+    if include_count_valid not in [0, 1, -1]:
+        raise ValueError("include_count_valid 必须是 0, 1 或 -1。")
+
+    for i, t in enumerate(thresh):
+        if t < 0:
+            raise ValueError(f"thresh 中的所有元素必须为非负数，但索引 {i} 的元素为 {t}。")
+
+    specs = []
+    n = len(thresh)
+    min_thresh = thresh[0]
+
+    # 生成低于最低分的统计。
+    if include_below_min:
+        for ratio in (False, True):
+            prefix = "ratio" if ratio else "count"
+            specs.append((f"{prefix}(-∞,{min_thresh})", 'below', min_thresh, None, ratio))
+
+    # 生成阈值区间统计。
+    for i in range(n - 1):
+        lower = thresh[i]
+        upper = thresh[i + 1]
+        for ratio in (False, True):
+            prefix = "ratio" if ratio else "count"
+            if cumu:
+                specs.append((f"{prefix}[{lower},+∞)", 'ge', lower, None, ratio))
+            elif i == n - 2:
+                specs.append((f"{prefix}[{lower},{upper}]", 'range_last', lower, upper, ratio))
+            else:
+                specs.append((f"{prefix}[{lower},{upper})", 'range', lower, upper, ratio))
+
+    # 生成平均分统计。
+    if include_mean:
+        specs.append(("mean", 'mean', None, None, False))
+
+    # 根据 include_count_valid 添加有效数据个数统计。
+    if include_count_valid == 1:
+        specs.insert(0, ("count_valid", 'count_valid', None, None, False))  # 插入到第一个位置。
+    elif include_count_valid == -1:
+        specs.append(("count_valid", 'count_valid', None, None, False))  # 插入到最后一个位置。
+
+    return specs
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 分组成绩区间统计引擎：每班成绩只排序一次，用二分查找回答所有阈值的人数、比率与平均分。
+def rate_stats_by_group(
+        df: pd.DataFrame,
+        by: str,
+        dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...], np.ndarray]],
+        cumu: bool = True,
+        include_mean: bool = True,
+        include_below_min: bool = False,
+        include_count_valid: int = 0,
+        groups: Optional[Tuple[np.ndarray, pd.Index]] = None
+        ) -> pd.DataFrame:
+    """
+    分组成绩区间统计引擎，结果等价于 df.groupby(by).agg({列名: make_rate_counters(阈值, ...)})。
+
+    每列只做一次 (班级, 分数) 排序：
+      1. 分数离散为有序编号，与班级编码合成单调递增的键；
+      2. 对每个 (班级, 阈值) 用一次 np.searchsorted 求出位置，计数均为位置之差；
+      3. 比率的分母为班级总人数（含 NaN），与 make_rate_counters 一致；平均分按班级加权求和。
+
+    :param df: 数据表，须包含分组列与 dic_thresh 中的所有列。
+    :param by: 分组列名，如 "班级"。
+    :param dic_thresh: {列名: 阈值列表}，如 {"语文": [72, 96, 120], "物理": [42, 56, 70]}。
+    :param cumu: 是否为累计统计模式，同 make_rate_counters。
+    :param include_mean: 是否统计平均分，同 make_rate_counters。
+    :param include_below_min: 是否统计低于最低分的人数与比率，同 make_rate_counters。
+    :param include_count_valid: 有效人数列的位置（0=不添加, 1=第一列, -1=最后一列），同 make_rate_counters。
+    :param groups: 预先计算的 _group_codes(df[by]) 结果，多个报表共用同一分组时传入，避免重复编码。
+    :return: 行索引为分组值，列索引为 (列名, "count[72.0,+∞)") 两级索引的统计表。
+    """
+    codes, index = groups if groups is not None else _group_codes(df[by])
+    n_groups = len(index)
+    in_group = codes >= 0
+    group_ids = np.arange(n_groups)
+    # 班级总人数（含 NaN），为比率的分母
+    n_total = np.bincount(codes[in_group], minlength=n_groups)
+
+    data, columns = {}, []
+    for col, thresh in dic_thresh.items():
+        specs = _rate_specs(thresh, cumu=cumu, include_mean=include_mean,
+                            include_below_min=include_below_min, include_count_valid=include_count_valid)
+        arr = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        ok = in_group & ~np.isnan(arr)
+        x, c = arr[ok], codes[ok]
+
+        # 按 (班级, 分数) 排序一次，键 = 班级编码 × (不同分数个数 + 1) + 分数编号
+        uniq = np.unique(x)
+        span = len(uniq) + 1
+        key = np.sort(c * span + np.searchsorted(uniq, x))
+        starts = np.searchsorted(key, group_ids * span, side='left')
+        ends = np.searchsorted(key, (group_ids + 1) * span, side='left')
+
+        # pos(t, side)：各班第一个 分数>=t（side='left'）或 分数>t（side='right'）的位置
+        def pos(t, side='left'):
+            return np.searchsorted(key, group_ids * span + np.searchsorted(uniq, t, side=side), side='left')
+
+        for name, kind, lower, upper, ratio in specs:
+            if kind == 'below':
+                value = pos(lower) - starts
+            elif kind == 'ge':
+                value = ends - pos(lower)
+            elif kind == 'range':
+                value = pos(upper) - pos(lower)
+            elif kind == 'range_last':
+                value = pos(upper, side='right') - pos(lower)
+            elif kind == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    value = np.bincount(c, weights=x, minlength=n_groups) / (ends - starts)
+            else:  # count_valid
+                value = ends - starts
+            if ratio:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    value = value / n_total
+            data[(col, name)] = value
+            columns.append((col, name))
+
+    return pd.DataFrame(data, index=index, columns=pd.MultiIndex.from_tuples(columns))
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 班级名次阶梯：各班学生按班次排成阶梯，"班次<=k"的学生恰为每班阶梯的前若干人。
+# 沿阶梯累加各学生的统计量（分段计数、区间计数、分数和）后，任一最大班次的分组统计都只需两次下标取值相减。
+# 页面的最大班次滑动条不超过60，阶梯只包含班次<=60的学生，累加表的行数为 班级数×60，与年级人数无关。
+_LADDER_MAX_CLASS_RANK = 60
+
+
+class _RankLadder:
+
+    def __init__(self, cls: pd.Series, cls_rank: np.ndarray, max_class_rank: Union[int, float] = np.inf) -> None:
+        """
+        :param cls: 班级列。
+        :param cls_rank: 班次数组（与cls的行一一对应），空值不参与任何最大班次的统计。
+        :param max_class_rank: 阶梯上限，只包含班次<=上限的学生；cut()的最大班次不能超过上限。
+        """
+        codes, self.index = _group_codes(cls)
+        self.max_class_rank = max_class_rank
+        with np.errstate(invalid='ignore'):
+            rows = np.flatnonzero((codes >= 0) & (cls_rank <= max_class_rank))
+        # 按 (班级编码, 班次) 排序；键 = 班级编码 × span + 班次
+        self.span = (float(cls_rank[rows].max()) if len(rows) else 0.0) + 2
+        keys = codes[rows] * self.span + cls_rank[rows]
+        order = np.argsort(keys, kind="stable")
+        self.rows = rows[order]
+        self.keys = keys[order]
+        group_ids = np.arange(len(self.index))
+        self.starts = np.searchsorted(self.keys, group_ids * self.span, side="left")
+        self.group_ids = group_ids
+
+    def prefix(self, values: np.ndarray) -> np.ndarray:
+        """沿阶梯累加各行统计量（values与阶梯的行self.rows一一对应，一维或二维），首行补0。"""
+        out = np.zeros((len(values) + 1,) + values.shape[1:], dtype=values.dtype)
+        np.cumsum(values, axis=0, out=out[1:])
+        return out
+
+    def class_prefix(self, values: np.ndarray) -> np.ndarray:
+        """
+        按班级分别沿阶梯累加（每班从0开始），第i项为本班阶梯上到第i行（含）的累计，不补0。
+        浮点数的分数和使用此方法：差值只在班内相减，舍入误差不随年级人数增长。
+        """
+        out = np.empty_like(values)
+        bounds = np.append(self.starts, len(values))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            np.cumsum(values[start:end], axis=0, out=out[start:end])
+        return out
+
+    def cut(self, max_class_rank: Union[int, float]) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+        """
+        返回"班次<=max_class_rank"时各班在阶梯上的 (起点, 终点, 分组索引)，只含人数大于0的班级。
+        分组与 _group_codes(筛选后的班级列) 一致。max_class_rank不能超过阶梯上限。
+        """
+        if max_class_rank > self.max_class_rank:
+            raise ValueError(f"最大班次{max_class_rank}超过班级名次阶梯的上限{self.max_class_rank}")
+        limit = min(float(max_class_rank), self.span - 1)
+        ends = np.searchsorted(self.keys, self.group_ids * self.span + limit, side="right")
+        keep = ends > self.starts
+        return self.starts[keep], ends[keep], self.index[keep]
+
+
+def _bin_ladder(
+        ladder: _RankLadder,
+        arrays: Dict[str, np.ndarray],
+        dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...]]],
+        cumu: int = 0,
+        mode: int = 0
+        ) -> Callable[[Union[int, float]], pd.DataFrame]:
+    """
+    count_bins_by_group 的阶梯版：预先累加各行所在区间的计数，返回 最大班次 → 计数表 的函数。
+    结果与 count_bins_by_group(筛选后的df表, ...) 相同。
+
+    :param ladder: 班级名次阶梯。
+    :param arrays: {列名: 数值数组}，与阶梯的行（ladder.rows）一一对应。
+    :param dic_thresh: {列名: 阈值列表}，同 count_bins_by_group。
+    :param cumu: 同 count_bins_by_group。
+    :param mode: 同 count_bins_by_group。
+    """
+    side = 'right' if mode == 0 else 'left'
+    blocks, widths, columns = [], [], []
+    for col, thresh in dic_thresh.items():
+        thresh, intervals = _bin_intervals(thresh, cumu=cumu, mode=mode)
+        arr = arrays[col]
+        bins = np.searchsorted(np.asarray(thresh, dtype=float), arr, side=side) - 1
+        bins[np.isnan(arr)] = -1
+        blocks.append(bins[:, None] == np.arange(len(thresh)))
+        widths.append(len(thresh))
+        columns.extend((col, _bin_name(lower, upper, mode)) for lower, upper in intervals)
+    # 累计人数不超过阶梯行数，用int32保存
+    onehot = np.hstack(blocks) if blocks else np.empty((len(ladder.rows), 0), dtype=bool)
+    table = ladder.prefix(onehot.astype(np.int32))
+    columns = pd.MultiIndex.from_tuples(columns)
+
+    def at(max_class_rank: Union[int, float]) -> pd.DataFrame:
+        starts, ends, index = ladder.cut(max_class_rank)
+        mat = table[ends] - table[starts]
+        if cumu == 1:
+            parts, off = [], 0
+            for k in widths:
+                block = mat[:, off:off + k]
+                parts.append(np.hstack([np.cumsum(block[:, :k - 1], axis=1), block[:, k - 1:]]))
+                off += k
+            mat = np.hstack(parts) if parts else mat
+        return pd.DataFrame(mat.astype(np.int64), index=index, columns=columns)
+
+    return at
+
+
+def _rate_ladder(
+        ladder: _RankLadder,
+        arrays: Dict[str, np.ndarray],
+        dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...], np.ndarray]],
+        cumu: bool = True,
+        include_mean: bool = True,
+        include_below_min: bool = False,
+        include_count_valid: int = 0
+        ) -> Callable[[Union[int, float]], pd.DataFrame]:
+    """
+    rate_stats_by_group 的阶梯版：预先累加各统计列的计数与分数和，返回 最大班次 → 统计表 的函数。
+    结果与 rate_stats_by_group(筛选后的df表, ...) 相同；比率的分母为筛选后的班级人数（含 NaN）。
+    平均分的分数和按班级分别累加（见 _RankLadder.class_prefix），求和顺序为班次顺序，
+    与 rate_stats_by_group（原表顺序）的差异在浮点舍入范围内；成绩为整数或0.5分时完全相同。
+
+    :param ladder: 班级名次阶梯。
+    :param arrays: {列名: 数值数组}，与阶梯的行（ladder.rows）一一对应。
+    :param dic_thresh: 其余参数同 rate_stats_by_group。
+    """
+    # 各统计列对应阶梯累加表中的一列：计数列累加0/1，平均分累加分数和与有效人数
+    counts, sums, plans = [], [], []
+    for col, thresh in dic_thresh.items():
+        specs = _rate_specs(thresh, cumu=cumu, include_mean=include_mean,
+                            include_below_min=include_below_min, include_count_valid=include_count_valid)
+        arr = arrays[col]
+        valid = ~np.isnan(arr)
+        with np.errstate(invalid='ignore'):
+            for name, kind, lower, upper, ratio in specs:
+                if kind == 'below':
+                    mask = arr < lower
+                elif kind == 'ge':
+                    mask = arr >= lower
+                elif kind == 'range':
+                    mask = (arr >= lower) & (arr < upper)
+                elif kind == 'range_last':
+                    mask = (arr >= lower) & (arr <= upper)
+                else:  # mean 与 count_valid 都需要有效人数
+                    mask = valid
+                if kind == 'mean':
+                    plans.append(((col, name), 'mean', len(counts), len(sums), ratio))
+                    sums.append(np.where(valid, arr, 0.0))
+                else:
+                    plans.append(((col, name), 'count', len(counts), None, ratio))
+                counts.append(mask)
+
+    n = len(ladder.rows)
+    count_table = ladder.prefix(np.column_stack(counts).astype(np.int32) if counts else np.empty((n, 0), np.int32))
+    sum_table = ladder.class_prefix(np.column_stack(sums) if sums else np.empty((n, 0)))
+    columns = pd.MultiIndex.from_tuples([key for key, *_ in plans])
+
+    def at(max_class_rank: Union[int, float]) -> pd.DataFrame:
+        starts, ends, index = ladder.cut(max_class_rank)
+        count = (count_table[ends] - count_table[starts]).astype(np.int64)
+        # 只含人数大于0的班级（ends > starts），本班累计到终点前一行即为分数和
+        total = sum_table[ends - 1]
+        n_total = ends - starts
+        data = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for key, kind, j, m, ratio in plans:
+                value = total[:, m] / count[:, j] if kind == 'mean' else count[:, j]
+                data[key] = value / n_total if ratio else value
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    return at
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 分区合并名次：多个学校（分区）联合分析时，各分区只统计本分区的成绩直方图（各不同分数及人数），
+# 合并直方图后即可得到任一分数的全区名次（method='min'，降序）：名次 = 1 + 全区高于该分数的人数，
+# 与把各分区拼接成一个df表后rank()的结果相同，无需拼接成绩表。
+def score_histograms(
+        adf: "Andf",
+        max_class_ranks: Tuple[Optional[Union[int, float]], ...] = (None,)
+        ) -> Dict[Tuple[Optional[Union[int, float]], str], Tuple[np.ndarray, np.ndarray]]:
+    """
+    统计一个分区的各科成绩与总分直方图。
+
+    :param adf: 分区的Andf对象。
+    :param max_class_ranks: 最大班次元组，None：全部学生，k：班次<=k的学生（与get_mc(max_class_rank=k)的排名范围相同）。
+    :return: {(最大班次, 列名): (升序的不同分数, 人数)}，空值不计入。
+    """
+    cols = adf.get_sbj_lst() + ["总分"]
+    df = adf._all()
+    cls_rank = _float_values(df["班次"])
+    hists = {}
+    for k in max_class_ranks:
+        mask = None if k is None else cls_rank <= k
+        for col in cols:
+            values = _float_values(df[col])
+            if mask is not None:
+                values = values[mask]
+            hists[(k, col)] = np.unique(values[~np.isnan(values)], return_counts=True)
+    return hists
+
+
+class GlobalRanks:
+    """
+    合并各分区直方图后的全区名次表，传给Andf(ranks=...)后，级次与名次表（get_mc）中的学科、总分名次为全区名次。
+    """
+
+    def __init__(self, tables: Dict[Tuple[Optional[Union[int, float]], str], Tuple[np.ndarray, np.ndarray]]) -> None:
+        """
+        :param tables: {(最大班次, 列名): (升序的不同分数, 全区高于该分数的人数)}，一般由merge()生成。
+        """
+        self.tables = tables
+
+    @classmethod
+    def merge(cls, shard_hists: List[Dict[Tuple[Optional[Union[int, float]], str], Tuple[np.ndarray, np.ndarray]]]
+              ) -> "GlobalRanks":
+        """
+        合并各分区的直方图（见score_histograms()）。某个分区没有的学科只按其余分区合并。
+
+        :param shard_hists: 各分区的直方图列表。
+        :return: GlobalRanks对象。
+        """
+        keys = list(dict.fromkeys(key for hists in shard_hists for key in hists))
+        tables = {}
+        for key in keys:
+            parts = [hists[key] for hists in shard_hists if key in hists]
+            values, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([part[1] for part in parts]),
+                                 minlength=len(values)).astype(np.int64)
+            # 高于第i个分数的人数 = 总人数 - 前i+1个分数的累计人数
+            tables[key] = (values, counts.sum() - np.cumsum(counts))
+        return cls(tables)
+
+    def update(self, other: "GlobalRanks") -> None:
+        """并入另一个GlobalRanks对象的名次表（相同键以other为准）。"""
+        self.tables.update(other.tables)
+
+    def max_class_ranks(self) -> List[Optional[Union[int, float]]]:
+        """已有名次表的最大班次列表。"""
+        return list(dict.fromkeys(k for k, _ in self.tables))
+
+    def _table(self, col: str, max_class_rank: Optional[Union[int, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        try:
+            return self.tables[(max_class_rank, col)]
+        except KeyError:
+            raise KeyError(f"没有最大班次为{max_class_rank}的{col}全区直方图，请先计算该最大班次的直方图") from None
+
+    def rank(self, col: str, values: Union[pd.Series, np.ndarray],
+             max_class_rank: Optional[Union[int, float]] = None) -> np.ndarray:
+        """
+        返回分数的全区名次（method='min'，降序），空值的名次为空值。
+
+        :param col: 列名，学科名或"总分"。
+        :param values: 本分区的分数（须已计入直方图）。
+        :param max_class_rank: 最大班次，与计算直方图时相同，默认None：全部学生。
+        :return: float数组。
+        :raises ValueError: 分数不在直方图中（分区数据在计算直方图后被修改）。
+        """
+        table, greater = self._table(col, max_class_rank)
+        x = _float_values(values) if isinstance(values, pd.Series) else np.asarray(values, dtype=float)
+        out = np.full(len(x), np.nan)
+        ok = ~np.isnan(x)
+        pos = np.searchsorted(table, x[ok])
+        if len(pos) and (pos.max() >= len(table) or not np.array_equal(table[pos], x[ok])):
+            raise ValueError(f"{col}中有不在全区直方图中的分数，请重新计算直方图")
+        out[ok] = greater[pos] + 1
+        return out
+
 
-            # 尝试将数组转换为 float
-            try:
-                arr = arr.astype(float)
-            except (ValueError, TypeError):
-                raise TypeError("分数数组必须能转换为数值类型。")
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 成绩立方体：班级 × 列（各学科、总分、级次） × 不同分数 的人数表。
+# 任一组阈值的分段人数、比率与平均分都只需在各列的分数累计人数上二分查找，不再扫描学生成绩；
+# 立方体可保存为json，之后用新的阈值生成报表时不需要学生成绩表。
+_CUBE_VERSION = 1
 
-            # 计算有效数据个数（非 NaN）。
-            valid = ~np.isnan(arr)
-            return int(np.sum(valid))
 
-        func.__name__ = "count_valid"
-        return func
+class ScoreCube:
+    """
+    成绩立方体，由Andf.get_cube()生成，或由load()、from_dict()读取。
+    count_bins()、rate_stats()的结果与count_bins_by_group()、rate_stats_by_group()相同，
+    get_fsd()、get_lv()、get_cls()与Andf同名方法（使用生成立方体时的最大班次）相同。
+    """
 
-    funcs = []
-    n = len(thresh)
-    min_thresh = thresh[0]
+    def __init__(self,
+                 index: pd.Index,                                # 分组索引（班级）
+                 n_total: np.ndarray,                            # 各组人数（含空值），比率的分母
+                 axes: Dict[str, Tuple[np.ndarray, np.ndarray]], # {列名: (升序的不同分数, 各组各分数的人数)}
+                 sbj_lst: List[str],                             # 学科列表（已排序）
+                 max_class_rank: Optional[Union[int, float]] = None
+                 ) -> None:
+        self.index = index
+        self.n_total = np.asarray(n_total, dtype=np.int64)
+        self.axes = axes
+        self.sbj_lst = list(sbj_lst)
+        self.max_class_rank = max_class_rank
+        # 各列的累计人数与累计分数和：cum[:, i]为前i个分数的人数，首列为0
+        self.__cum: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_arrays(cls, groups: Tuple[np.ndarray, pd.Index], arrays: Dict[str, np.ndarray], sbj_lst: List[str],
+                    max_class_rank: Optional[Union[int, float]] = None) -> "ScoreCube":
+        """
+        由分组编码与各列数值数组生成立方体。
 
-    # 生成低于最低分的统计。
-    if include_below_min:
-        below_count_func = make_threshold_func(min_thresh, ratio=False, below_min=True)
-        below_ratio_func = make_threshold_func(min_thresh, ratio=True, below_min=True)
-        funcs.extend([below_count_func, below_ratio_func])
+        :param groups: _group_codes(分组列)，编码-1的行不计入。
+        :param arrays: {列名: 数值数组}，与分组编码的行一一对应，空值不计入该列。
+        :param sbj_lst: 学科列表。
+        :param max_class_rank: 生成立方体时的最大班次，只作为信息保存。
+        """
+        codes, index = groups
+        n_groups = len(index)
+        in_group = codes >= 0
+        axes = {}
+        for col, arr in arrays.items():
+            ok = in_group & ~np.isnan(arr)
+            values, inverse = np.unique(arr[ok], return_inverse=True)
+            counts = np.bincount(codes[ok] * len(values) + inverse, minlength=n_groups * len(values))
+            axes[col] = (values, counts.reshape(n_groups, len(values)))
+        return cls(index, np.bincount(codes[in_group], minlength=n_groups), axes, sbj_lst, max_class_rank)
 
-    # 生成阈值区间统计。
-    for i in range(n - 1):
-        lower = thresh[i]
-        upper = thresh[i + 1]
-        is_last_interval = (i == n - 2)
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 保存与读取
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可json序列化的字典，人数只保存非零项。"""
+        axes = {}
+        for col, (values, counts) in self.axes.items():
+            g, v = np.nonzero(counts)
+            axes[col] = dict(values=values.tolist(), group=g.tolist(), value=v.tolist(), count=counts[g, v].tolist())
+        index = self.index.tolist()
+        return dict(version=_CUBE_VERSION, by=self.index.name, index=[_json_value(x) for x in index],
+                    n_total=self.n_total.tolist(), sbj_lst=self.sbj_lst,
+                    max_class_rank=_json_value(self.max_class_rank), axes=axes)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScoreCube":
+        """由to_dict()的结果生成立方体。"""
+        if data.get("version") != _CUBE_VERSION:
+            raise ValueError(f"成绩立方体版本不匹配: {data.get('version')}，当前版本为{_CUBE_VERSION}")
+        index = pd.Index(data["index"], name=data["by"])
+        axes = {}
+        for col, item in data["axes"].items():
+            values = np.asarray(item["values"], dtype=float)
+            counts = np.zeros((len(index), len(values)), dtype=np.int64)
+            counts[item["group"], item["value"]] = item["count"]
+            axes[col] = (values, counts)
+        return cls(index, np.asarray(data["n_total"]), axes, data["sbj_lst"], data["max_class_rank"])
+
+    def save(self, path: str) -> None:
+        """保存为json文件。"""
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "ScoreCube":
+        """读取save()保存的json文件。"""
+        import json
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
 
-        # 根据 cumu 模式选择调用方式，避免传递无用参数
-        if cumu:
-            count_func = make_threshold_func(lower, ratio=False, cumu_mode=True)
-            ratio_func = make_threshold_func(lower, ratio=True, cumu_mode=True)
-        else:
-            count_func = make_threshold_func(lower, upper, ratio=False, is_last_interval=is_last_interval)
-            ratio_func = make_threshold_func(lower, upper, ratio=True, is_last_interval=is_last_interval)
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 分组统计
+    def _cum(self, col: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if col not in self.axes:
+            raise KeyError(f"成绩立方体中没有列: {col}")
+        if col not in self.__cum:
+            values, counts = self.axes[col]
+            n_groups = len(self.index)
+            cum = np.zeros((n_groups, len(values) + 1), dtype=np.int64)
+            np.cumsum(counts, axis=1, out=cum[:, 1:])
+            cum_sum = np.zeros((n_groups, len(values) + 1))
+            np.cumsum(counts * values, axis=1, out=cum_sum[:, 1:])
+            self.__cum[col] = (values, cum, cum_sum)
+        return self.__cum[col]
+
+    def _below(self, col: str, t: Union[int, float], side: str = 'left') -> np.ndarray:
+        """各组 分数<t（side='left'）或 分数<=t（side='right'）的人数。"""
+        values, cum, _ = self._cum(col)
+        return cum[:, np.searchsorted(values, t, side=side)]
+
+    def count_bins(self,
+                   dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...]]],
+                   cumu: int = 0,
+                   mode: int = 0
+                   ) -> pd.DataFrame:
+        """分段计数，参数与结果同count_bins_by_group()。"""
+        side = 'left' if mode == 0 else 'right'
+        blocks, columns = [], []
+        for col, thresh in dic_thresh.items():
+            thresh, intervals = _bin_intervals(thresh, cumu=cumu, mode=mode)
+            k = len(thresh)
+            below = np.column_stack([self._below(col, t, side) for t in thresh] + [self._cum(col)[1][:, -1]])
+            mat = np.diff(below, axis=1)
+            if cumu == 1:
+                mat = np.hstack([np.cumsum(mat[:, :k - 1], axis=1), mat[:, k - 1:]])
+            blocks.append(mat)
+            columns.extend((col, _bin_name(lower, upper, mode)) for lower, upper in intervals)
+        data = np.hstack(blocks) if blocks else np.empty((len(self.index), 0), dtype=np.int64)
+        return pd.DataFrame(data.astype(np.int64), index=self.index, columns=pd.MultiIndex.from_tuples(columns))
+
+    def rate_stats(self,
+                   dic_thresh: Dict[str, Union[List[Union[int, float]], Tuple[Union[int, float], ...], np.ndarray]],
+                   cumu: bool = True,
+                   include_mean: bool = True,
+                   include_below_min: bool = False,
+                   include_count_valid: int = 0
+                   ) -> pd.DataFrame:
+        """成绩区间人数、比率与平均分，参数与结果同rate_stats_by_group()。"""
+        data, columns = {}, []
+        for col, thresh in dic_thresh.items():
+            specs = _rate_specs(thresh, cumu=cumu, include_mean=include_mean,
+                                include_below_min=include_below_min, include_count_valid=include_count_valid)
+            values, cum, cum_sum = self._cum(col)
+            n_valid = cum[:, -1]
+            for name, kind, lower, upper, ratio in specs:
+                if kind == 'below':
+                    value = self._below(col, lower)
+                elif kind == 'ge':
+                    value = n_valid - self._below(col, lower)
+                elif kind == 'range':
+                    value = self._below(col, upper) - self._below(col, lower)
+                elif kind == 'range_last':
+                    value = self._below(col, upper, side='right') - self._below(col, lower)
+                elif kind == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        value = cum_sum[:, -1] / n_valid
+                else:  # count_valid
+                    value = n_valid
+                if ratio:
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        value = value / self.n_total
+                data[(col, name)] = value
+                columns.append((col, name))
+        return pd.DataFrame(data, index=self.index, columns=pd.MultiIndex.from_tuples(columns))
 
-        funcs.extend([count_func, ratio_func])
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 核心报表：参数同Andf的同名方法（不含max_class_rank，使用生成立方体时的最大班次）
+    def get_fsd(self,
+                dic_thresh_sbj: Dict[Tuple, List[str]],
+                thresh_score: List[Union[int, float]] = None,
+                add_rank_cols=1
+                ) -> Dict[Any, pd.DataFrame]:
+        """生成分数段报表，同Andf.get_fsd()。"""
+        dic = dict_rev_sort(dic=dic_thresh_sbj, sort_order=self.sbj_lst)
+        return _fsd_report(self.count_bins(dic, cumu=0, mode=0), thresh_score, add_rank_cols)
 
-    # 生成平均分统计。
-    if include_mean:
-        mean_func = make_mean_func()
-        funcs.append(mean_func)
+    def get_lv(self,
+               dic_total_sbj: Dict[int, List[str]],
+               thresh: List[float] = [0.6, 0.8],
+               include_count_valid: int = 0,
+               add_rank_cols=None,
+               cumu: bool = True
+               ) -> Dict[Any, pd.DataFrame]:
+        """生成两率一平报表，同Andf.get_lv()。"""
+        dic_thresh = _lv_thresh(dic_total_sbj, thresh, self.sbj_lst)
+        df_lv = self.rate_stats(dic_thresh, cumu=cumu, include_count_valid=include_count_valid)
+        return _lv_report(df_lv, add_rank_cols)
 
-    # 根据 include_count_valid 添加有效数据个数统计。
-    if include_count_valid != 0:
-        count_valid_func = make_count_valid_func()
-        if include_count_valid == 1:
-            funcs.insert(0, count_valid_func)  # 插入到第一个位置。
-        elif include_count_valid == -1:
-            funcs.append(count_valid_func)  # 插入到最后一个位置。
+    def get_cls(self,
+                thresh: List[int],
+                thresh_score: List[Union[int, float]] = None,
+                cumu: int = 0,
+                mode: int = 1
+                ) -> pd.DataFrame:
+        """生成班级分析报表-各次段统计，同Andf.get_cls()。"""
+        return _cls_report(self.count_bins({"级次": thresh}, cumu=cumu, mode=mode), thresh_score)
 
-    return tuple(funcs)
+
+# numpy标量转换为json可以保存的python标量。
+def _json_value(x: Any) -> Any:
+    return x.item() if isinstance(x, np.generic) else x
 
 
 # --- 示例用法 ---
@@ -1078,9 +2339,9 @@ if __name__ == "__main__":
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 返回工作薄与指定工作表。
 def trim_wb(
-        wb: Workbook,
+        wb: "Workbook",
         sheet_names: Union[str, List[str]]
-        ) -> Tuple[Workbook, Union[Worksheet, List[Worksheet]]]:
+        ) -> Tuple["Workbook", Union["Worksheet", List["Worksheet"]]]:
     """
     只保留指定名称的工作表，并删除工作簿中的其他所有工作表。
 
@@ -1112,6 +2373,569 @@ def trim_wb(
     else:
         return wb, retained_sheets
 
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 模板池：每个模板文件在进程内只解析一次，按工作表名缓存裁剪后的原始副本（xlsx字节），每次请求返回一个新的克隆。
+# 键为(绝对路径, 修改时间, 文件大小)，模板文件被修改后自动失效。
+_TEMPLATE_POOL: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+_TEMPLATE_LOCK = threading.Lock()
+_XLSX_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _template_key(path: str) -> Tuple[str, int, int]:
+    """返回模板池的键：(绝对路径, 修改时间ns, 文件大小)。"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def get_sheet_names(path: Union[str, Any]) -> List[str]:
+    """
+    从xlsx文件的xl/workbook.xml中读取工作表名称列表（按工作簿中的顺序），不解析任何单元格数据。
+
+    :param path: xlsx文件路径或文件对象（如streamlit上传的文件）。
+    :return: 工作表名称列表。
+    :raises ValueError: 文件不是有效的xlsx文件。
+    """
+    from xml.etree import ElementTree
+
+    try:
+        with zipfile.ZipFile(path) as zf:
+            root = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ValueError(f"无法读取xlsx文件的工作表名称: {str(e)}")
+    finally:
+        if hasattr(path, "seek"):
+            path.seek(0)
+
+    return [sheet.get("name") for sheet in root.iter(f"{_XLSX_MAIN_NS}sheet")]
+
+
+def template_bytes(path: str, sheet_name: str) -> bytes:
+    """
+    返回模板池中只保留指定工作表的模板工作簿（xlsx字节）。
+
+    首次使用某模板时解析整个工作簿并保留在池中；首次使用某工作表时，将裁剪后的工作簿保存为xlsx字节缓存。
+    字节可以传给其他进程，由openpyxl.load_workbook(BytesIO(data))加载，避免每个进程重新解析整个模板。
+
+    :param path: 模板xlsx文件路径。
+    :param sheet_name: 要保留的工作表名称。
+    :return: xlsx字节。
+    :raises ValueError: 如果指定的工作表名称不存在于模板中。
+    """
+    import openpyxl
+
+    key = _template_key(path)
+
+    with _TEMPLATE_LOCK:
+        entry = _TEMPLATE_POOL.get(key)
+        if entry is None:
+            # 同一路径的旧版本模板一并清除
+            for old_key in [k for k in _TEMPLATE_POOL if k[0] == key[0]]:
+                del _TEMPLATE_POOL[old_key]
+            entry = _TEMPLATE_POOL[key] = {"wb": openpyxl.load_workbook(key[0]), "sheets": {}}
+
+        data = entry["sheets"].get(sheet_name)
+        if data is None:
+            wb = entry["wb"]
+            if sheet_name not in wb.sheetnames:
+                raise ValueError(f"工作表 '{sheet_name}' 不存在于工作簿中")
+
+            # 与trim_wb相同，仅从工作表列表中移除其他工作表；保存后恢复，池中的工作簿保持完整
+            sheets = wb._sheets
+            wb._sheets = [ws for ws in sheets if ws.title == sheet_name]
+            try:
+                data = wb_to_bytesIO(wb).getvalue()
+            finally:
+                wb._sheets = sheets
+            entry["sheets"][sheet_name] = data
+
+    return data
+
+
+def load_template(path: str, sheet_name: str) -> Tuple["Workbook", "Worksheet"]:
+    """
+    从模板池中获取只保留指定工作表的模板工作簿，等同于load_workbook(path)后再trim_wb(wb, sheet_name)。
+
+    模板在进程内只解析一次（见template_bytes()），每次调用只需从缓存字节加载一个较小的克隆，
+    调用方可以任意修改返回的工作簿，不影响池中的原始副本。
+
+    :param path: 模板xlsx文件路径。
+    :param sheet_name: 要保留的工作表名称。
+    :return: 元组（克隆的工作簿对象, 保留的工作表对象）。
+    :raises ValueError: 如果指定的工作表名称不存在于模板中。
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(BytesIO(template_bytes(path, sheet_name)))
+    return wb, wb[sheet_name]
+
+
+def clear_template_pool() -> None:
+    """清空模板池。"""
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_POOL.clear()
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 上传文件缓存：按(文件内容哈希, 工作表名)缓存解析后的df表与Andf对象，按内存占用进行LRU淘汰。
+# streamlit每次交互都会重新运行页面脚本，缓存后拖动滑动条不会重新解析xlsx、重建Andf。
+INGEST_CACHE_BYTES = 512 * 1024 ** 2     # 默认内存上限：512MB
+
+
+class _SizedLRU:
+    """按内存占用（字节）限制容量的LRU缓存，线程安全。"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.__items = OrderedDict()     # {key: (value, nbytes)}
+        self.__lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is None:
+                return None
+            self.__items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: Any, value: Any, nbytes: int) -> None:
+        with self.__lock:
+            if key in self.__items:
+                self.nbytes -= self.__items.pop(key)[1]
+            # 单项超过上限时不缓存
+            if nbytes > self.max_bytes:
+                return
+            self.__items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def charge(self, key: Any, nbytes: int) -> None:
+        """更新已缓存项的内存占用（如缓存的对象内部又缓存了结果），超出上限时按LRU淘汰（可能淘汰该项本身）。"""
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is None:
+                return
+            self.nbytes += nbytes - item[1]
+            self.__items[key] = (item[0], nbytes)
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        with self.__lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__items.clear()
+            self.nbytes = 0
+
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes and self.__items:
+            self.nbytes -= self.__items.popitem(last=False)[1][1]
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+
+_INGEST_CACHE = _SizedLRU(INGEST_CACHE_BYTES)
+
+
+def _df_nbytes(df: pd.DataFrame) -> int:
+    """df表的内存占用（字节，含object列的实际内容）。"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+_NBYTES_SAMPLE = 1000     # 估算object列内存占用时的抽样行数
+
+
+def _estimate_nbytes(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    估算Andf缓存对象的内存占用（字节）：df表、Series、索引与数组，以及列表、字典、闭包（阶梯统计函数）
+    和普通对象（_RankLadder、_DualRankTable、ScoreCube等）中引用的这些数据，一次估算中同一对象只计一次。
+    object列（姓名、名次元组等）按抽样行的平均大小估算，不逐个统计。
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, Andf):
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.index.memory_usage()) + sum(_values_nbytes(obj.iloc[:, i]) for i in range(obj.shape[1]))
+    if isinstance(obj, pd.Series):
+        return int(obj.index.memory_usage()) + _values_nbytes(obj)
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(_estimate_nbytes(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(_estimate_nbytes(value, seen) for value in obj)
+    if callable(obj) and getattr(obj, "__closure__", None):
+        return sum(_estimate_nbytes(cell.cell_contents, seen) for cell in obj.__closure__)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return _estimate_nbytes(vars(obj), seen)
+    return 0
+
+
+def _values_nbytes(sr: pd.Series) -> int:
+    """Series数据（不含索引）的内存占用；object列按抽样行的平均大小估算。"""
+    nbytes = int(sr.memory_usage(index=False))
+    n = len(sr)
+    if sr.dtype != object or n == 0:
+        return nbytes
+    sample = sr.iloc[::max(1, n // _NBYTES_SAMPLE)]
+    extra = sample.memory_usage(index=False, deep=True) - sample.memory_usage(index=False)
+    return nbytes + int(extra * n / len(sample))
+
+
+def _file_bytes(file: Union[str, Any]) -> bytes:
+    """读取文件路径或文件对象（如streamlit上传的文件）的全部内容，不改变文件对象的读取位置。"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return f.read()
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    pos = file.tell()
+    try:
+        file.seek(0)
+        return file.read()
+    finally:
+        file.seek(pos)
+
+
+def file_digest(file: Union[str, Any]) -> str:
+    """
+    计算文件内容的哈希值（blake2b，32位十六进制字符串），作为上传文件缓存的键。
+
+    :param file: 文件路径或文件对象（如streamlit上传的文件）。
+    :return: 哈希值字符串。
+    """
+    return hashlib.blake2b(_file_bytes(file), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def excel_engine() -> str:
+    """
+    返回解析xlsx工作表使用的引擎：安装了python-calamine时为'calamine'（速度约为openpyxl的5~6倍），
+    否则为'openpyxl'（pandas以只读流式方式读取）。
+    """
+    return "calamine" if importlib.util.find_spec("python_calamine") is not None else "openpyxl"
+
+
+def _read_excel_sheet(data: bytes, sheet_name: str, engine: str) -> pd.DataFrame:
+    """用指定引擎只解析一个工作表；calamine解析失败时改用openpyxl重新读取。"""
+    if engine == "calamine":
+        try:
+            return pd.read_excel(BytesIO(data), engine="calamine", sheet_name=sheet_name)
+        except Exception as e:
+            warnings.warn(f"calamine解析工作表'{sheet_name}'失败，改用openpyxl: {str(e)}")
+    return pd.read_excel(BytesIO(data), engine="openpyxl", sheet_name=sheet_name)
+
+
+def read_sheet(
+        file: Union[str, Any],
+        sheet_name: str,
+        digest: Optional[str] = None,
+        engine: Optional[str] = None
+        ) -> pd.DataFrame:
+    """
+    读取xlsx文件中的一个工作表（只解析该工作表），结果按(文件内容哈希, 工作表名)缓存。
+
+    :param file: 文件路径或文件对象（如streamlit上传的文件）。
+    :param sheet_name: 工作表名称。
+    :param digest: 文件内容哈希，默认None：由file_digest()计算。同一次运行中多次调用时可传入以免重复计算。
+    :param engine: 解析引擎，'calamine'或'openpyxl'。默认None：由excel_engine()选择。
+    :return: df表（浅复制，调用方增删列不影响缓存）。
+    :raises ValueError: 如果指定的工作表名称不存在于工作簿中。
+    """
+    digest = digest or file_digest(file)
+    key = ("sheet", digest, sheet_name)
+    df = _INGEST_CACHE.get(key)
+    if df is None:
+        data = _file_bytes(file)
+        # 先从目录中检查工作表名，避免引擎解析失败后重复读取
+        if sheet_name not in get_sheet_names(BytesIO(data)):
+            raise ValueError(f"工作表 '{sheet_name}' 不存在于工作簿中")
+        df = _read_excel_sheet(data, sheet_name, engine or excel_engine())
+        _INGEST_CACHE.put(key, df, _df_nbytes(df))
+    return df.copy(deep=False)
+
+
+def get_andf(file: Union[str, Any], sheet_name: str, digest: Optional[str] = None, **kwargs) -> "Andf":
+    """
+    获取由xlsx文件中一个工作表构建的Andf对象，按(文件内容哈希, 工作表名, 构建参数)缓存。
+
+    缓存的Andf对象保留其内部的筛选、排名结果缓存，重复运行时直接复用。内存占用为源表加上Andf内部的派生列与结果缓存，
+    Andf之后每缓存一项结果都会更新占用并按上限淘汰，因此set_ingest_cache_limit()也限制了结果缓存的内存。
+    源表由load_sheet()获取，命中Parquet缓存时不解析xlsx。
+
+    :param file: 文件路径或文件对象（如streamlit上传的文件）。
+    :param sheet_name: 工作表名称。
+    :param digest: 文件内容哈希，默认None：由file_digest()计算。
+    :param kwargs: 传给Andf()的其他参数，如cache_size。
+    :return: Andf对象。
+    """
+    digest = digest or file_digest(file)
+    key = ("andf", digest, sheet_name, tuple(sorted(kwargs.items())))
+    adf = _INGEST_CACHE.get(key)
+    if adf is None:
+        df = load_sheet(file, sheet_name, digest=digest)
+        adf = Andf(df, **kwargs)
+        adf._track_nbytes(functools.partial(_INGEST_CACHE.charge, key))
+        _INGEST_CACHE.put(key, adf, adf._nbytes())
+    return adf
+
+
+def load_sheet(file: Union[str, Any], sheet_name: str, digest: Optional[str] = None) -> pd.DataFrame:
+    """
+    获取学科成绩列已转换为数值的工作表（与Andf内部的转换相同：非数值成绩为空值），供Andf等分析使用。
+
+    依次查找内存缓存、Parquet缓存（开启时，见set_parquet_cache_dir()）；都未命中时由read_sheet()解析xlsx，转换后写入Parquet缓存。
+    同一份成绩表以不同参数重新分析、或在其他页面与命令行中分析时，直接以Arrow内存映射读取Parquet文件，不解析xlsx。
+    缺考等非数值成绩已转为空值，检查原始数据时应使用read_sheet()。
+
+    :param file: 文件路径或文件对象（如streamlit上传的文件）。
+    :param sheet_name: 工作表名称。
+    :param digest: 文件内容哈希，默认None：由file_digest()计算。
+    :return: df表（浅复制）。
+    :raises ValueError: 如果指定的工作表名称不存在于工作簿中。
+    """
+    digest = digest or file_digest(file)
+    key = ("table", digest, sheet_name)
+    df = _INGEST_CACHE.get(key)
+    if df is None:
+        path = _parquet_path(digest, sheet_name)
+        df = _read_parquet(path) if path else None
+        if df is None:
+            df = _coerce_scores(read_sheet(file, sheet_name, digest=digest))
+            if path:
+                _write_parquet(df, path)
+        _INGEST_CACHE.put(key, df, _df_nbytes(df))
+    return df.copy(deep=False)
+
+
+def _coerce_scores(df: pd.DataFrame) -> pd.DataFrame:
+    """将df表中的学科成绩列转换为数值（非数值为空值），其他列不变。"""
+    df = df.copy(deep=False)
+    for sbj in Andf(df).get_sbj_lst():
+        df[sbj] = pd.to_numeric(df[sbj], errors="coerce")
+    return df
+
+
+def set_ingest_cache_limit(max_bytes: int) -> None:
+    """设置上传文件缓存的内存上限（字节），超出部分立即按LRU淘汰。"""
+    if not isinstance(max_bytes, int) or max_bytes < 0:
+        raise ValueError("max_bytes必须是非负整数")
+    _INGEST_CACHE.resize(max_bytes)
+
+
+def clear_ingest_cache() -> None:
+    """清空上传文件缓存。"""
+    _INGEST_CACHE.clear()
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# Parquet缓存：load_sheet()转换后的工作表按(文件内容哈希, 工作表名)保存为Parquet文件，进程重启后仍然有效。
+# 缓存文件含学生姓名、学号与成绩，默认关闭：设置环境变量LONGSEA_CACHE_DIR或调用set_parquet_cache_dir()后开启
+# （命令行批量分析默认使用DEFAULT_PARQUET_DIR）。缓存目录中的文件总大小超过上限时，按最近使用时间删除最旧的文件。
+_PARQUET_VERSION = 1     # 转换规则或文件格式变化时加1，旧文件不再命中
+DEFAULT_PARQUET_DIR = os.path.join(os.path.expanduser("~"), ".cache", "longsea")
+PARQUET_CACHE_BYTES = 1024 ** 3     # 默认容量上限：1GB
+_PARQUET_DIR: Optional[str] = os.environ.get("LONGSEA_CACHE_DIR") or None
+_PARQUET_LIMIT = PARQUET_CACHE_BYTES
+
+
+@functools.lru_cache(maxsize=None)
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _parquet_path(digest: str, sheet_name: str) -> Optional[str]:
+    """Parquet缓存文件路径；未开启缓存或没有安装pyarrow时返回None。"""
+    if not _PARQUET_DIR or not _has_pyarrow():
+        return None
+    sheet_key = hashlib.blake2b(str(sheet_name).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(_PARQUET_DIR, f"{digest}_{sheet_key}_v{_PARQUET_VERSION}.parquet")
+
+
+def _read_parquet(path: str) -> Optional[pd.DataFrame]:
+    """以内存映射读取Parquet缓存文件，文件不存在或损坏时返回None。"""
+    if not os.path.exists(path):
+        return None
+    import pyarrow.parquet as pq
+    try:
+        df = pq.read_table(path, memory_map=True).to_pandas()
+        # 修改时间即最近使用时间，容量超限时按此淘汰
+        os.utime(path)
+        return df
+    except FileNotFoundError:
+        return None     # 刚被其他进程淘汰
+    except Exception as e:
+        warnings.warn(f"Parquet缓存文件读取失败，重新解析xlsx: {path}: {str(e)}")
+        return None
+
+
+def _write_parquet(df: pd.DataFrame, path: str) -> None:
+    """
+    将df表写入Parquet缓存文件（先写临时文件再改名，多个进程同时写入也不会读到不完整的文件）。
+    列名不是字符串、或列中混有Arrow无法表示的多种类型时不写入，只保留内存缓存。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    try:
+        table = pa.Table.from_pandas(df)
+    except (pa.ArrowException, TypeError, ValueError):
+        return
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+    except OSError as e:
+        warnings.warn(f"Parquet缓存文件写入失败: {path}: {str(e)}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    _prune_parquet_cache(os.path.dirname(path), _PARQUET_LIMIT)
+
+
+def _prune_parquet_cache(cache_dir: str, max_bytes: int) -> int:
+    """
+    缓存目录中Parquet文件的总大小超过max_bytes时，按修改时间（最近使用时间）从旧到新删除，返回删除的文件数。
+    单个文件超过上限时也会被删除。多个进程同时淘汰时，已被删除的文件跳过。
+    """
+    files = []
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".parquet"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in files)
+    n = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            n += 1
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        total -= size
+    return n
+
+
+def set_parquet_cache_dir(path: Optional[str]) -> None:
+    """设置Parquet缓存目录并开启缓存，None：关闭Parquet缓存。"""
+    global _PARQUET_DIR
+    _PARQUET_DIR = os.path.abspath(path) if path else None
+
+
+def set_parquet_cache_limit(max_bytes: int) -> None:
+    """设置Parquet缓存目录的容量上限（字节），已开启缓存时立即按最近使用时间淘汰超出的文件。"""
+    global _PARQUET_LIMIT
+    if not isinstance(max_bytes, int) or max_bytes < 0:
+        raise ValueError("max_bytes必须是非负整数")
+    _PARQUET_LIMIT = max_bytes
+    if _PARQUET_DIR and os.path.isdir(_PARQUET_DIR):
+        _prune_parquet_cache(_PARQUET_DIR, max_bytes)
+
+
+def get_parquet_cache_dir() -> Optional[str]:
+    """返回Parquet缓存目录，未开启时返回None。"""
+    return _PARQUET_DIR
+
+
+def clear_parquet_cache() -> int:
+    """删除缓存目录中的全部Parquet缓存文件，返回删除的文件数。"""
+    if not _PARQUET_DIR or not os.path.isdir(_PARQUET_DIR):
+        return 0
+    n = 0
+    for name in os.listdir(_PARQUET_DIR):
+        if name.endswith(".parquet"):
+            os.remove(os.path.join(_PARQUET_DIR, name))
+            n += 1
+    return n
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 合并单元格映射：{(行, 列): (起始行, 起始列)}，按工作表缓存，合并区域变化时自动重建
+_MERGED_ANCHORS = weakref.WeakKeyDictionary()
+
+
+def _merged_anchor_map(ws: Any) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    """
+    返回工作表中合并区域内非起始单元格到起始单元格的坐标映射。
+
+    同一坐标属于多个合并区域时，取ws.merged_cells.ranges中的第一个（与逐个扫描的结果一致）。
+
+    :param ws: openpyxl工作表对象。
+    :return: 字典{(行, 列): (起始行, 起始列)}。
+    """
+    merged = getattr(ws, "merged_cells", None)
+    ranges = list(merged.ranges) if merged is not None else []
+    key = tuple(r.bounds for r in ranges)
+
+    try:
+        cached = _MERGED_ANCHORS.get(ws)
+    except TypeError:  # 不支持弱引用的对象，不缓存
+        cached = None
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    anchors = {}
+    for min_col, min_row, max_col, max_row in key:
+        for r in range(min_row, max_row + 1):
+            for c in range(min_col, max_col + 1):
+                if (r, c) != (min_row, min_col):
+                    anchors.setdefault((r, c), (min_row, min_col))
+
+    try:
+        _MERGED_ANCHORS[ws] = (key, anchors)
+    except TypeError:
+        pass
+    return anchors
+
+
+def _set_cell(ws: Any, anchors: Dict[Tuple[int, int], Tuple[int, int]], r: int, c: int, value: Any) -> None:
+    """向单元格写入值；若为合并单元格（非起始单元格），则写入合并区域的起始单元格。"""
+    cell = ws.cell(row=r, column=c)
+    if getattr(cell, 'merged_cell', False):
+        anchor = anchors.get((r, c))
+        if anchor is not None:
+            cell = ws.cell(row=anchor[0], column=anchor[1])
+    cell.value = value
+
+
+def _cell_value(value: Any, na_rep: Any) -> Any:
+    """单元格值转换：空值替换为na_rep，元组（如多级列索引名称）转换为'_'连接的字符串。"""
+    if pd.isnull(value):
+        return na_rep
+    if isinstance(value, tuple):
+        return '_'.join(str(v) for v in value)
+    return value
+
+
+def _header_rows(df: pd.DataFrame, index: bool, header: bool) -> List[list]:
+    """返回dataframe_to_rows生成的表头行与索引名称行（不含数据行）。"""
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
+    n_head = (df.columns.nlevels if header else 0) + (1 if index else 0)
+    rows = dataframe_to_rows(df.iloc[:0], index=index, header=header)
+    return [row for _, row in zip(range(n_head), rows)]
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 将一个或多个Pandas DataFrame逐一注入到一个由openpyxl创建的工作表中。
 def dfs_to_ws(
@@ -1177,7 +3001,8 @@ def dfs_to_ws(
     1. 此函数会直接修改传入的工作表对象，但不会自动保存工作簿
     2. 空值处理使用Pandas的isnull()方法，可以识别多种空值类型（NaN、NaT等）
     3. 对于大型DataFrame，建议使用na_rep参数处理空值，避免Excel显示错误
-    4. 函数采用批量写入方式优化性能，减少方法调用次数
+    4. 函数采用批量写入方式优化性能，减少方法调用次数；无空值的数值列直接写入，不逐值检查
+    5. 合并单元格的起始单元格通过预先建立的坐标映射查找，不再逐个扫描合并区域
     """
     # 检查ws是否为Worksheet对象
     if not hasattr(ws, 'cell'):
@@ -1195,6 +3020,9 @@ def dfs_to_ws(
     if row < 1 or col < 1:
         raise ValueError("行和列参数必须大于等于1")
 
+    # 合并单元格坐标→起始单元格映射，每个工作表只建立一次
+    anchors = _merged_anchor_map(ws)
+
     # 遍历每个DataFrame
     for df_idx, df in enumerate(dfs):
         # 检查DataFrame是否为空
@@ -1202,39 +3030,37 @@ def dfs_to_ws(
             warnings.warn(f"第{df_idx + 1}个DataFrame为空，跳过处理")
             continue
 
-        # 获取所有行数据（提前转换为列表，避免重复生成）
+        # 表头、索引行仍由dataframe_to_rows生成（数量少，逐值检查）
         try:
-            rows = list(dataframe_to_rows(df, index=idx, header=hd))
+            head_rows = list(_header_rows(df, index=idx, header=hd))
         except Exception as e:
             raise ValueError(f"处理第{df_idx + 1}个DataFrame时出错: {str(e)}")
 
-        # 批量写入数据
-        for r_offset, row_data in enumerate(rows):
+        for r_offset, row_data in enumerate(head_rows):
             for c_offset, value in enumerate(row_data):
-                # 处理NaN值
-                if pd.isnull(value):
-                    value = na_rep
-                # 处理元组类型的值（如多级列索引名称）
-                elif isinstance(value, tuple):
-                    # 将元组转换为字符串形式
-                    value = '_'.join(str(v) for v in value)
-
-                # 计算实际单元格位置
-                current_row = row + r_offset
-                current_col = col + c_offset
-
-                # 检查单元格是否为合并单元格，如果是，则找到合并区域的起始单元格
-                cell = ws.cell(row=current_row, column=current_col)
-                if hasattr(cell, 'merged_cell') and cell.merged_cell:
-                    # 对于合并单元格，我们需要找到左上角的单元格来写入值
-                    for merged_range in ws.merged_cells.ranges:
-                        if cell.coordinate in merged_range:
-                            # 获取合并区域的起始单元格
-                            cell = ws.cell(row=merged_range.min_row, column=merged_range.min_col)
-                            break
-                
-                # 直接赋值
-                cell.value = value
+                _set_cell(ws, anchors, row + r_offset, col + c_offset, _cell_value(value, na_rep))
+
+        # 数据区按列批量写入：仅对含空值或object类型的列逐值检查空值与元组
+        r0 = row + len(head_rows)
+        c0 = col
+        if idx:
+            # 索引列逐值检查（多级索引按dataframe_to_rows的方式展开，重复的上级标签留空）
+            from openpyxl.utils.dataframe import expand_index
+            index_rows = expand_index(df.index) if df.index.nlevels > 1 else ([v] for v in df.index)
+            for r_offset, values in enumerate(index_rows):
+                for c_offset, value in enumerate(values):
+                    _set_cell(ws, anchors, r0 + r_offset, c0 + c_offset, _cell_value(value, na_rep))
+            c0 += df.index.nlevels
+
+        has_null = df.isnull().any(axis=0).to_numpy()
+        for j in range(df.shape[1]):
+            sr = df.iloc[:, j]
+            values = sr.tolist()
+            if has_null[j] or sr.dtype == object:
+                values = [_cell_value(value, na_rep) for value in values]
+            c = c0 + j
+            for r_offset, value in enumerate(values):
+                _set_cell(ws, anchors, r0 + r_offset, c, value)
 
         # 更新位置为下一个DataFrame的起始位置
         row +=  rg
@@ -1792,6 +3618,12 @@ def merge_mult_dfs(
     """
     合并多个DataFrame，处理重复列名并提供详细的警告和错误信息。
 
+    how为'outer'或'inner'、各DataFrame的键不重复且键的数据类型相同时，全部DataFrame纵向拼接一次，
+    重复列按键分组取最后（keep_last=True）或第一个非空值，行、列与各值都与逐个两两合并相同。
+    数据类型：没有空值的列保持提供其值的表中该列的数据类型（多个表的数值类型不同时取共同类型），有空值的整数列为浮点数；
+    两两合并时中间结果出现过空值的整数列即使最终没有空值也是浮点数，一次拼接时仍为整数。
+    其他情况仍逐个两两合并。
+
     参数:
     dfs: DataFrame列表，需要合并的所有DataFrame
     on: 字符串或列表，合并的键列
@@ -1838,6 +3670,7 @@ def merge_mult_dfs(
             raise ValueError(f"DataFrame {i} 缺少键列: {missing_keys}")
 
     # 检查合并键的数据类型一致性
+    same_key_dtypes = True
     for key in on_keys:
         dtypes = []
         for i, df in enumerate(dfs):
@@ -1847,6 +3680,7 @@ def merge_mult_dfs(
         # 检查所有DataFrame中同一键的数据类型是否一致
         unique_dtypes = set(dtype for _, dtype in dtypes)
         if len(unique_dtypes) > 1:
+            same_key_dtypes = False
             dtype_info = ", ".join([f"df{i}: {dtype}" for i, dtype in dtypes])
             warnings.warn(
                 f"合并键 '{key}' 的数据类型在不同DataFrame中不一致: {dtype_info}. "
@@ -1898,9 +3732,15 @@ def merge_mult_dfs(
             "考虑使用 how='outer' 或 how='inner' 以获得更可预测的结果。"
         )
 
-    # 使用reduce逐步合并所有DataFrame
+    # 键不重复且键的数据类型一致时一次拼接合并，否则使用reduce逐步合并所有DataFrame。
+    # 键的类型不一致时（如学号一个表为整数、另一个表为文本）拼接分组会把同一学生分成两行，
+    # 由pd.merge判断能否合并（不能合并时报错）。
     try:
-        result = functools.reduce(merge_two_dfs, dfs)
+        if (how in ('outer', 'inner') and same_key_dtypes
+                and not any(df.duplicated(on_keys).any() for df in dfs)):
+            result = _merge_concat(dfs, on_keys, how, keep_last)
+        else:
+            result = functools.reduce(merge_two_dfs, dfs)
 
         # 检查结果是否为空
         if result.empty:
@@ -1910,6 +3750,59 @@ def merge_mult_dfs(
     except Exception as e:
         raise ValueError(f"合并过程中发生错误: {str(e)}") from e
 
+
+def _merge_concat(dfs: List[pd.DataFrame], on_keys: List[str], how: str, keep_last: bool) -> pd.DataFrame:
+    """
+    多个键不重复的DataFrame一次合并：纵向拼接后按键分组，各列取最后（或第一个）非空值。
+
+    列顺序与两两合并相同：每次合并时，左表的重复列被右表的同名列取代。
+    外连接的行按键排序（与pd.merge相同），内连接只保留各表都有的键，按第一个表的顺序排列。
+    拼接后没有空值的列恢复为原数据类型，见merge_mult_dfs()。
+    """
+    # 模拟两两合并的列顺序，并发出重复列警告
+    columns = list(dfs[0].columns)
+    for df in dfs[1:]:
+        common = set(columns) & set(df.columns) - set(on_keys)
+        if common:
+            warnings.warn(
+                f"发现重复列: {[col for col in df.columns if col in common]}. "
+                f"{'保留最后一个DataFrame的值' if keep_last else '保留第一个DataFrame的值'}"
+            )
+        columns = [col for col in columns if col not in common] + [col for col in df.columns if col not in on_keys]
+
+    stacked = pd.concat(dfs, ignore_index=True, sort=False)
+    grouped = stacked.groupby(on_keys, sort=(how == 'outer'), dropna=False)
+    result = grouped.last() if keep_last else grouped.first()
+    keep = None
+    if how == 'inner':
+        # 键在每个表中只出现一次，出现次数等于表的个数即为各表都有的键
+        keep = grouped.size().to_numpy() == len(dfs)
+        result = result[keep]
+    result = result.reset_index()[columns]
+
+    # 拼接时缺列的行为空值，整数、布尔列变为浮点数或object：没有空值的列恢复为取值来源表中该列的数据类型
+    for col in columns:
+        if col in on_keys or result[col].isna().any():
+            continue
+        dtypes = {df[col].dtype for df in dfs if col in df.columns}
+        if len(dtypes) > 1:
+            # 多个表有该列且类型不同：只取实际提供了值的表
+            src = np.repeat(np.arange(len(dfs)), [len(df) for df in dfs])
+            codes = grouped.ngroup().to_numpy()
+            valid = stacked[col].notna().to_numpy()
+            winners = pd.Series(src[valid]).groupby(codes[valid])
+            winners = (winners.last() if keep_last else winners.first()).to_numpy()
+            if keep is not None:
+                winners = winners[keep[np.unique(codes[valid])]]
+            if len(winners):
+                dtypes = {dfs[i][col].dtype for i in np.unique(winners)}
+            if len(dtypes) > 1 and all(isinstance(dtype, np.dtype) for dtype in dtypes):
+                dtypes = {np.result_type(*dtypes)}
+        if len(dtypes) == 1 and result[col].dtype not in dtypes:
+            result[col] = result[col].astype(dtypes.pop())
+    return result
+
+
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 将DataFrame的列索引按指定列表顺序排序，然后按指定列对数据进行排序
 def df_sort(
@@ -2048,6 +3941,10 @@ def df_rank_cols(
         """
         df_ranked = df.copy()
         for col in cols:
+            if method == 'min' and na_option == 'keep':
+                # 有界成绩使用计数排名，结果相同
+                df_ranked[col] = rank_min(df_ranked[col], ascending=ascending)
+                continue
             df_ranked[col] = df_ranked[col].rank(
                 method=method,
                 ascending=ascending,
@@ -2166,6 +4063,170 @@ def _move_cols(df: pd.DataFrame, target_cols: List[str], pos: Literal['left', 'r
     new_order = existing_cols + other_cols if pos == 'left' else other_cols + existing_cols
     return df[new_order]
 
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 批量为多个 df 表添加行和、点积、点积排名三列
+def df_add_rank_batch(
+        dfs: Dict[Any, pd.DataFrame],
+        lst: Optional[List[Union[int, float]]] = None,
+        sum_col_name: str = "行和",
+        dot_col_name: str = "点积",
+        rank_col_name: str = "点积排名",
+        direction: Literal['first', 'last'] = 'first',
+        position: Literal['left', 'right'] = 'left'    ) -> Dict[Any, pd.DataFrame]:
+    """
+    对字典中的每个 df 表执行 df_add_rank()，结果与逐表调用相同。
+
+    各表参与计算的列行数相同、数据类型相同（int64 或 float64）时，把各表叠成一个三维数组
+    （表 × 行 × 列），一次矩阵乘法得到全部点积，再沿行方向排名；否则逐表调用 df_add_rank()。
+    get_fsd()、get_sdb()、get_db_fsd() 的各学科表使用本函数。
+
+    参数：
+      dfs: {键: df表}字典
+      其余参数同 df_add_rank()
+
+    返回：
+      {键: 新增三列的df表}字典（不修改原数据）
+    """
+    values = _stack_rank_cols(dfs, lst, direction)
+    if values is not None:
+        n_tables, n_rows, n_cols = values.shape
+        # 与 DataFrame.dot 相同的二维乘法，各表的行依次排列
+        dots = values.reshape(n_tables * n_rows, n_cols).dot(np.array(lst[:n_cols])).reshape(n_tables, n_rows)
+        # 点积有空值时 df_add_rank() 报错，逐表调用以保持相同的行为
+        if not (dots.dtype.kind == 'f' and np.isnan(dots).any()):
+            sums = values.sum(axis=2)
+            ranks = _dense_rank_desc(dots, axis=1)
+            result = {}
+            for i, (key, df) in enumerate(dfs.items()):
+                df = df.copy()
+                df[sum_col_name] = sums[i]
+                df[dot_col_name] = dots[i]
+                df[rank_col_name] = ranks[i]
+                result[key] = _move_cols(df, [sum_col_name, dot_col_name, rank_col_name], position)
+            return result
+
+    return {key: df_add_rank(df, lst=lst, sum_col_name=sum_col_name, dot_col_name=dot_col_name,
+                             rank_col_name=rank_col_name, direction=direction, position=position)
+            for key, df in dfs.items()}
+
+
+def _stack_rank_cols(dfs: Dict[Any, pd.DataFrame], lst: Any, direction: str) -> Optional[np.ndarray]:
+    """
+    df_add_rank_batch() 的三维数组：各表参与计算的列（与 df_add_rank() 的选列规则相同）叠成 表 × 行 × 列。
+    权重为空、表含非数值列或重复列名、各表形状或数据类型不同时返回 None。
+    """
+    if not isinstance(lst, list) or not lst or not dfs:
+        return None
+    blocks = []
+    for df in dfs.values():
+        if not isinstance(df, pd.DataFrame) or df.empty or not df.columns.is_unique:
+            return None
+        dtypes = set(df.dtypes)
+        # 全部列为同一数值类型时，数值列即全部列；sum、dot 的结果类型与 pandas 相同
+        if len(dtypes) != 1 or dtypes.pop() not in (np.dtype(np.int64), np.dtype(np.float64)):
+            return None
+        n = len(df.columns)
+        m = min(len(lst), n)
+        blocks.append(df.iloc[:, :m] if direction == 'first' else df.iloc[:, n - m:])
+    if len({block.shape for block in blocks}) != 1 or len({block.dtypes.iloc[0] for block in blocks}) != 1:
+        return None
+    return np.stack([block.to_numpy() for block in blocks])
+
+
+def _dense_rank_desc(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """
+    沿 axis 方向的降序密集排名，与 Series.rank(method='dense', ascending=False) 相同。
+    没有空值时返回 int64 数组；有空值时返回 float64 数组，空值的排名为空值。
+    """
+    values = np.moveaxis(values, axis, -1)
+    if values.shape[-1] == 0:
+        return np.moveaxis(np.zeros(values.shape, dtype=np.int64), -1, axis)
+    # 升序排序（空值在最后），相邻不同时密集名次加1
+    order = np.argsort(values, axis=-1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+    step = np.ones(sorted_values.shape, dtype=np.int64)
+    step[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    dense = np.cumsum(step, axis=-1)
+
+    nan = np.isnan(values) if values.dtype.kind == 'f' else None
+    if nan is not None and nan.any():
+        top = np.where(np.isnan(sorted_values), 0, dense).max(axis=-1, keepdims=True)
+    else:
+        nan = None
+        top = dense[..., -1:]
+    # 升序密集名次转为降序：最大值为1
+    ranks = np.empty_like(dense)
+    np.put_along_axis(ranks, order, top - dense + 1, axis=-1)
+    if nan is not None:
+        ranks = ranks.astype(np.float64)
+        ranks[nan] = np.nan
+    return np.moveaxis(ranks, -1, axis)
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 比较多组积分方案：一次矩阵乘法得到各表在每组积分下的点积与点积排名
+def df_rank_schemes(
+        dfs: Dict[Any, pd.DataFrame],
+        lst_grid: List[List[Union[int, float]]],
+        direction: Literal['first', 'last'] = 'first'    ) -> pd.DataFrame:
+    """
+    对每组积分列表，计算各表的点积与点积排名，结果与 df_add_rank(df, lst=积分列表) 的点积、点积排名列相同
+    （点积为 float64；点积有空值时该行排名为空值，不报错）。
+    各表的数值列补零对齐后叠成三维数组，每个表一个 列 × 方案 的权重矩阵，全部方案一次批量矩阵乘法。
+
+    用法：
+      dfs = adf.get_fsd(dic_thresh_sbj, add_rank_cols=0)     # 或 adf.get_sdb(thresh, thresh_score=0)
+      df = df_rank_schemes(dfs, [[10, 9, 2, 1, 0], [5, 4, 3, 2, 1]])
+      df["排名"]                                             # 行为(积分, 班级)，列为学科
+
+    参数：
+      dfs: {键: df表}字典，各表的行索引必须相同（如各学科的班级）
+      lst_grid: 积分列表的列表，每项同 df_add_rank() 的 lst（非空）
+      direction: 同 df_add_rank()
+
+    返回：
+      df表，行索引为(积分, 班级)，积分如"10-9-2-1-0"；列索引为(指标, 键)，指标为"点积"、"排名"。
+    """
+    if not dfs:
+        raise ValueError("dfs 不能为空")
+    if not lst_grid or not all(isinstance(lst, list) and lst for lst in lst_grid):
+        raise ValueError("lst_grid 必须是非空积分列表的列表")
+    keys = list(dfs)
+    index = dfs[keys[0]].index
+    if not all(dfs[key].index.equals(index) for key in keys):
+        raise ValueError("dfs 中各表的行索引必须相同")
+
+    # 各表数值列（float64，空值保留），右侧补零到相同列数
+    blocks = [dfs[key].select_dtypes(include=[np.number]).to_numpy(dtype=np.float64, na_value=np.nan)
+              for key in keys]
+    width = max(block.shape[1] for block in blocks)
+    if width == 0:
+        raise ValueError("dfs 中的表没有数值列")
+    values = np.zeros((len(keys), len(index), width))
+    # selected[t, c, j]：第 t 个表第 c 列参与第 j 组积分的计算；weights 为对应的积分
+    selected = np.zeros((len(keys), width, len(lst_grid)))
+    weights = np.zeros_like(selected)
+    for t, block in enumerate(blocks):
+        n = block.shape[1]
+        values[t, :, :n] = block
+        for j, lst in enumerate(lst_grid):
+            m = min(len(lst), n)
+            cols = slice(0, m) if direction == 'first' else slice(n - m, n)
+            selected[t, cols, j] = 1
+            weights[t, cols, j] = lst[:m]
+
+    # 空值按0参与乘法，再把含空值的点积置为空值（未参与计算的列中的空值不影响结果）
+    nan = np.isnan(values)
+    dots = np.matmul(np.where(nan, 0, values), weights)
+    dots[np.matmul(nan.astype(np.float64), selected) > 0] = np.nan
+    ranks = _dense_rank_desc(dots, axis=1)
+
+    # 表 × 行 × 方案 → (方案, 行) × 表
+    labels = ["-".join(str(x) for x in lst) for lst in lst_grid]
+    row_index = pd.MultiIndex.from_product([labels, index], names=["积分", "班级"])
+    frames = {name: pd.DataFrame(arr.transpose(2, 1, 0).reshape(-1, len(keys)), index=row_index, columns=keys)
+              for name, arr in (("点积", dots), ("排名", ranks))}
+    return pd.concat(frames, axis=1, names=["指标", None])
+
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■  封装为bytesIO/zip  ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
@@ -2193,30 +4254,189 @@ def df_to_bytesIO(df):
 
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 把一个 openpyxl 生成的 workbook 封装为一个二进进制的 BytesIO 对象。
-def wb_to_bytesIO(wb):
+def wb_to_bytesIO(
+        wb: "Workbook",
+        data_sheets: Optional[Dict[str, pd.DataFrame]] = None,
+        na_rep: Optional[Any] = None
+        ) -> BytesIO:
     """
     把一个 openpyxl 生成的 workbook 对象封装为一个二进制的 BytesIO 对象。
 
+    data_sheets中的df表在保存时以流式方式直接写入xlsx文件中对应工作表的xml，不创建openpyxl单元格对象，
+    适合名次表、成绩表等逐行数据的大表。写入结果与dfs_to_ws(ws, 1, 1, df, hd=True, na_rep=na_rep)相同；
+    df表中含日期时间值时，该表改用dfs_to_ws写入。
+
     :param wb: 由 openpyxl 生成的 workbook 对象
+    :param data_sheets: {工作表名: df表}，默认None。工作表须已在wb中且为空表，如wb.create_sheet("名次表", 1)。
+    :param na_rep: data_sheets中空值的替代值，默认None：空单元格。
     :return: 一个二进制的 BytesIO 对象
     """
+    import openpyxl
+
     if not isinstance(wb, openpyxl.Workbook):
         raise ValueError("wb 必须是 openpyxl 生成的 Workbook 对象")
 
+    streams = {}
+    for name, df in (data_sheets or {}).items():
+        if name not in wb.sheetnames:
+            raise ValueError(f"工作表 '{name}' 不存在于工作簿中")
+        ws = wb[name]
+        if ws._cells:  # 不能用ws.cell()检查，会创建单元格
+            raise ValueError(f"工作表 '{name}' 必须为空表")
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError("data_sheets的值必须是Pandas DataFrame对象")
+        if _has_datetime(df):
+            dfs_to_ws(ws, 1, 1, df, hd=True, na_rep=na_rep)
+        else:
+            streams[name] = df
+
     bio_file = BytesIO()
     wb.save(bio_file)
+    if streams:
+        bio_file = _stream_data_sheets(bio_file, streams, na_rep)
     bio_file.seek(0)  # 确保指针位于文件的开头
     return bio_file
 
+
+def _has_datetime(df: pd.DataFrame) -> bool:
+    """df表（含列名）中是否有日期时间值。流式写入不处理日期格式，含日期时间值的表改用dfs_to_ws写入。"""
+    types = (datetime.date, datetime.time, datetime.timedelta)
+    if any(isinstance(v, types) for v in np.ravel(df.columns.to_flat_index())):
+        return True
+    for j in range(df.shape[1]):
+        sr = df.iloc[:, j]
+        if sr.dtype.kind in "Mm" or isinstance(sr.dtype, pd.DatetimeTZDtype):
+            return True
+        if sr.dtype == object and any(isinstance(v, types) for v in sr.tolist()):
+            return True
+    return False
+
+
+def _xlsx_sheet_parts(zf: zipfile.ZipFile) -> Dict[str, str]:
+    """返回{工作表名: 工作表xml在压缩包中的路径}。"""
+    from xml.etree import ElementTree
+
+    rel_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+    root = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    rels = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+
+    parts = {}
+    for sheet in root.iter(f"{_XLSX_MAIN_NS}sheet"):
+        target = targets[sheet.get(f"{rel_ns}id")]
+        parts[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else "xl/" + target
+    return parts
+
+
+# 与openpyxl.cell.cell.ILLEGAL_CHARACTERS_RE相同：xml不允许的控制字符
+_ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+
+def _xml_escape(value: str) -> str:
+    """转义xml文本中的&、<、>（与xml.sax.saxutils.escape相同，避免导入xml.sax）。"""
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _xml_cell(ref: str, value: Any) -> str:
+    """一个单元格的xml，与openpyxl写出的格式一致；值为None时返回空字符串，空字符串写为无值的单元格（读回为None）。"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, np.number)):
+        if isinstance(value, (float, np.floating)) and (math.isnan(value) or math.isinf(value)):
+            return f'<c r="{ref}" t="n"><v></v></c>'
+        return f'<c r="{ref}" t="n"><v>{"%.16g" % value}</v></c>'
+
+    value = str(value)
+    if not value:
+        return f'<c r="{ref}" t="inlineStr"></c>'
+    if _ILLEGAL_CHARACTERS_RE.search(value):
+        from openpyxl.utils.exceptions import IllegalCharacterError
+        raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+    if value.startswith("=") and len(value) > 1:
+        return f'<c r="{ref}"><f>{_xml_escape(value[1:])}</f><v></v></c>'
+    space = ' xml:space="preserve"' if value != value.strip() else ""
+    return f'<c r="{ref}" t="inlineStr"><is><t{space}>{_xml_escape(value)}</t></is></c>'
+
+
+def _sheet_rows_xml(df: pd.DataFrame, na_rep: Any, chunk_rows: int = 2000):
+    """逐块生成df表（含表头，不含索引）的<row>元素xml，每块最多chunk_rows行。"""
+    from openpyxl.utils import get_column_letter
+
+    letters = [get_column_letter(j + 1) for j in range(df.shape[1])]
+    rows = [[_cell_value(v, na_rep) for v in row] for row in _header_rows(df, index=False, header=True)]
+    r0 = len(rows) + 1
+
+    # 数据区按列取值：与dfs_to_ws相同，仅对含空值或object类型的列逐值检查空值与元组
+    has_null = df.isnull().any(axis=0).to_numpy()
+    columns = []
+    for j in range(df.shape[1]):
+        sr = df.iloc[:, j]
+        values = sr.tolist()
+        if has_null[j] or sr.dtype == object:
+            values = [_cell_value(v, na_rep) for v in values]
+        columns.append(values)
+
+    def row_xml(r, values):
+        cells = "".join(_xml_cell(f"{letter}{r}", v) for letter, v in zip(letters, values))
+        return f'<row r="{r}">{cells}</row>' if cells else ""
+
+    yield "".join(row_xml(r, values) for r, values in enumerate(rows, start=1))
+    for start in range(0, len(df), chunk_rows):
+        stop = min(start + chunk_rows, len(df))
+        block = zip(*(col[start:stop] for col in columns)) if columns else ([] for _ in range(start, stop))
+        yield "".join(row_xml(r0 + i, values) for i, values in enumerate(block, start=start))
+
+
+def _stream_data_sheets(bio_file: BytesIO, streams: Dict[str, pd.DataFrame], na_rep: Any) -> BytesIO:
+    """把df表逐块写入openpyxl保存的xlsx中对应的空工作表，返回新的xlsx。其他文件原样复制。"""
+    from openpyxl.utils import get_column_letter
+
+    bio_file.seek(0)
+    out = BytesIO()
+    with zipfile.ZipFile(bio_file) as zin, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zout:
+        parts = _xlsx_sheet_parts(zin)
+        targets = {parts[name]: df for name, df in streams.items()}
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            df = targets.get(item.filename)
+            if df is None:
+                zout.writestr(item, data)
+                continue
+
+            # openpyxl写出的空表为<sheetData></sheetData>（或<sheetData />），在其中插入行
+            xml = data.decode("utf-8")
+            match = re.search(r"<sheetData\s*/>|<sheetData>\s*</sheetData>", xml)
+            if match is None:
+                raise ValueError(f"无法定位工作表xml中的sheetData: {item.filename}")
+            n_rows = df.columns.nlevels + len(df)
+            ref = f"A1:{get_column_letter(max(df.shape[1], 1))}{n_rows}"
+            head = re.sub(r'<dimension ref="[^"]*"\s*/>', f'<dimension ref="{ref}" />', xml[:match.start()], count=1)
+
+            with zout.open(item.filename, "w", force_zip64=True) as f:
+                f.write((head + "<sheetData>").encode("utf-8"))
+                for chunk in _sheet_rows_xml(df, na_rep):
+                    f.write(chunk.encode("utf-8"))
+                f.write(("</sheetData>" + xml[match.end():]).encode("utf-8"))
+    return out
+
+
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 多个DataFrame保存到内存中的ZIP文件,以提供给下载按钮
 def dfs_to_zip(
         dfs_dic: Dict[str, pd.DataFrame],
         format: str = 'excel',
-        empty_msg: str = '空值') -> BytesIO:
+        empty_msg: str = '空值',
+        compression: int = zipfile.ZIP_DEFLATED,
+        compresslevel: Optional[int] = None,
+        jobs: Optional[int] = None) -> BytesIO:
     """
     将多个DataFrame保存到内存中的ZIP文件
 
+    各成员文件在进程池中并行生成，再按dfs_dic的顺序写入ZIP。成员文件的时间戳固定为1980-01-01，
+    xlsx文件内的创建、修改时间也固定，相同的输入得到完全相同的ZIP字节。
+
     Parameters:
     -----------
     dfs_dic : dict
@@ -2225,6 +4445,15 @@ def dfs_to_zip(
         输出格式，支持'excel'（默认）或'csv'
     empty_msg : str, optional
         空DataFrame时显示的消息，默认为'空值'
+    compression : int, optional
+        压缩方法，zipfile.ZIP_STORED、ZIP_DEFLATED（默认）、ZIP_BZIP2或ZIP_LZMA。
+        xlsx文件本身已压缩，使用ZIP_STORED可明显加快打包
+    compresslevel : int, optional
+        压缩级别，默认None：使用压缩方法的默认级别。ZIP_DEFLATED为0~9，ZIP_BZIP2为1~9
+    jobs : int, optional
+        并行进程数，默认None：各成员df表共有ZIP_PARALLEL_CELLS个以上单元格时为CPU核数，
+        否则在当前进程中依次生成（启动进程池、在子进程中导入pandas的耗时超过小文件的生成时间）。
+        为1或只有一个文件时在当前进程中依次生成。页面中使用默认值即可：小表不启动进程池，大表（如分班分学科拆分）并行生成
 
     Returns:
     --------
@@ -2234,46 +4463,84 @@ def dfs_to_zip(
     Raises:
     -------
     ValueError
-        如果指定的格式不被支持
+        如果指定的格式、压缩方法或压缩级别不被支持
     """
     # 验证格式参数
     if format not in ('excel', 'csv'):
         raise ValueError(f"不支持的格式: {format}. 支持 'excel' 或 'csv'")
+    if compression not in _ZIP_LEVELS:
+        raise ValueError(f"不支持的压缩方法: {compression}. 支持 ZIP_STORED、ZIP_DEFLATED、ZIP_BZIP2 或 ZIP_LZMA")
+    levels = _ZIP_LEVELS[compression]
+    if compresslevel is not None and compresslevel not in levels:
+        raise ValueError(f"压缩方法 {compression} 不支持压缩级别 {compresslevel}")
+
+    # 安全处理文件名，空DataFrame替换为提示信息
+    tasks = []
+    for name, df in dfs_dic.items():
+        if df.empty:
+            df = pd.DataFrame({'提示': [empty_msg]})
+        tasks.append((_sanitize_filename(str(name) if name is not None else 'data'), df, format))
+
+    # 并行生成成员文件，map按提交顺序返回结果
+    if jobs is None:
+        cells = sum(df.size for _, df, _ in tasks)
+        jobs = (os.cpu_count() or 1) if cells >= ZIP_PARALLEL_CELLS else 1
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        members = [_zip_member(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            members = list(pool.map(_zip_member, tasks))
 
     # 创建内存中的ZIP文件
     bio_zip = BytesIO()
-
-    try:
-        with zipfile.ZipFile(bio_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for name, df in dfs_dic.items():
-                # 检查DataFrame是否为空
-                if df.empty:
-                    df = pd.DataFrame({'提示': [empty_msg]})
-
-                # 安全处理文件名
-                safe_name = _sanitize_filename(str(name) if name is not None else 'data')
-
-                # 根据格式处理数据
-                if format == 'excel':
-                    file_data = _df_to_excel(df, safe_name)
-                    file_ext = 'xlsx'
-                else:  # csv
-                    file_data = _df_to_csv(df)
-                    file_ext = 'csv'
-
-                # 将文件数据写入ZIP
-                zipf.writestr(f'{safe_name}.{file_ext}', file_data)
-
-    except Exception as e:
-        # 重新抛出异常，但先确保缓冲区被重置
-        bio_zip.seek(0)
-        bio_zip.truncate(0)
-        raise e
+    with zipfile.ZipFile(bio_zip, 'w', compression, compresslevel=compresslevel) as zipf:
+        for arcname, file_data in members:
+            zipf.writestr(_zip_info(arcname, compression), file_data, compresslevel=compresslevel)
 
     # 将指针重置到缓冲区开头
     bio_zip.seek(0)
     return bio_zip
 
+
+# dfs_to_zip()默认并行生成的最少单元格数：约为在当前进程中生成5秒的数据量，少于该数量时进程池的启动开销得不偿失
+ZIP_PARALLEL_CELLS = 200000
+# 各压缩方法支持的压缩级别，ZIP_STORED、ZIP_LZMA忽略compresslevel
+_ZIP_LEVELS = {zipfile.ZIP_STORED: (), zipfile.ZIP_DEFLATED: range(0, 10),
+               zipfile.ZIP_BZIP2: range(1, 10), zipfile.ZIP_LZMA: ()}
+# 固定的时间戳：ZIP格式的最早日期
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+_XLSX_EPOCH = "1980-01-01T00:00:00Z"
+
+
+def _zip_info(arcname: str, compression: int) -> zipfile.ZipInfo:
+    """时间戳与权限固定的ZipInfo。"""
+    info = zipfile.ZipInfo(arcname, date_time=_ZIP_EPOCH)
+    info.compress_type = compression
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _zip_member(task: Tuple[str, pd.DataFrame, str]) -> Tuple[str, bytes]:
+    """生成一个成员文件，返回（文件名, 文件字节）。在进程池中运行。"""
+    safe_name, df, format = task
+    if format == 'excel':
+        return f'{safe_name}.xlsx', _normalize_xlsx(_df_to_excel(df, safe_name))
+    return f'{safe_name}.csv', _df_to_csv(df)
+
+
+def _normalize_xlsx(data: bytes) -> bytes:
+    """固定xlsx内的文件时间戳与文档创建、修改时间，使相同内容的xlsx字节相同。"""
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(data)) as zin, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for item in zin.infolist():
+            content = zin.read(item.filename)
+            if item.filename == 'docProps/core.xml':
+                content = re.sub(rb'(<dcterms:(?:created|modified)[^>]*>)[^<]*(</dcterms:)',
+                                 rb'\g<1>' + _XLSX_EPOCH.encode() + rb'\g<2>', content)
+            zout.writestr(_zip_info(item.filename, zipfile.ZIP_DEFLATED), content)
+    return out.getvalue()
+
 # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
 # 创建一个安全处理文件名的函数
 def _sanitize_filename(
@@ -2426,4 +4693,8 @@ def dict_rev_sort(
             if item not in sorted_dict:
                 sorted_dict[item] = value
 
-    return sorted_dict
\ No newline at end of file
+    return sorted_dict
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 性能统计：包装本模块的公共函数与Andf的公共方法（perf.enable()后记录用时、调用次数与内存峰值）
+perf.instrument_module(globals(), "al2")
+perf.instrument_class(Andf, "Andf")
@@ -0,0 +1,340 @@
+"""
+批量成绩分析：不依赖streamlit页面，对一个目录中的全部成绩xlsx文件执行与分析页面相同的流程
+（Andf报表计划 → 模板注入 → wb_to_bytesIO），各文件在进程池中并行处理，结果写入输出目录。
+
+用法示例：
+    python -m longsea.batch 成绩目录 输出目录 --config analysis9_40
+    python -m longsea.batch 成绩目录 输出目录 --config analysis7 --lv-rank 40 --cls-rank 50 --jobs 4
+    python -m longsea.batch 成绩目录 输出目录 --config my_config.py
+    python -m longsea.batch 成绩目录 输出目录 --cache-dir D:/缓存          # 成绩表的Parquet缓存目录，--no-cache关闭
+    python -m longsea.batch 成绩目录 输出目录 --store D:/成绩库            # 同时追加到历史成绩库（见longsea.history）
+
+成绩表经转换后保存为Parquet缓存（见al2.load_sheet()），以不同参数重新分析同一批成绩文件时不再解析xlsx。
+命令行默认开启Parquet缓存（库与分析页面默认关闭），缓存目录超过容量上限时按最近使用时间淘汰。
+指定--store时，分析成功的文件在主进程中依次追加到历史成绩库，考试名称为文件名（不含扩展名），已有的同名考试被替换。
+
+自定义配置文件为python文件，需定义CONFIG字典，键与内置方案相同：
+    template_sheet : 模板工作表名称
+    plan           : Andf.build_reports()的报表计划
+    layout         : 报表注入位置列表，每项为{"report", "row", "col", "rg", "cg"}
+    data_sheets    : 新建的数据工作表列表，每项为(工作表名, 报表名)
+    sort_cols      : 数据工作表的列顺序
+    sort_by        : 数据工作表的排序列
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openpyxl
+
+from longsea import al2, history
+
+# 默认模板文件
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "模板2024.xlsx")
+
+# {总分：学科}字典，各方案共用
+DIC_LV = {120: ["语文", "数学", "英语"],
+          70: ["物理", "政治"],
+          50: ["化学", "生物", "历史", "地理"]}
+
+# 名次表、成绩表的列顺序与排序列，各方案共用
+SORT_COLS = ['班级', '学号', '姓名', "语文", "数学", "英语"]
+SORT_BY = ["班级", "级次"]
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 内置方案：与Pages中各分析页面的报表计划、注入位置一致。
+# lv_rank为两率一平参评人数(max_class_rank)，cls_rank为班级分析参评人数(max_cls_rank)。
+def _data_plan() -> List[Dict[str, Any]]:
+    """名次表、成绩表的报表计划。"""
+    return [dict(name="df_MC0", report="mc", combine_ranks=0),
+            dict(name="df_all", report="all")]
+
+
+def preset_analysis7(lv_rank: int = 45, cls_rank: int = 50, rows40: bool = False) -> Dict[str, Any]:
+    """七八年级分析方案（Pages/analysis7.py，rows40=True时为analysis7_40.py）。"""
+    dic_fsd = {(48, 60, 72, 84, 96, 108, 120): ["语文", "数学", "英语"],
+               (28, 35, 42, 49, 56, 63, 70): ["物理", "政治"],
+               (20, 25, 30, 35, 40, 45, 50): ["化学", "生物", "历史", "地理"]}
+    thresh_cls = [0, 10, 50, 100, 150, 200, 260, 300, 350, 400]
+    thresh_cls_score = [10, 10, 10, 10, 8, 6, 2, 1.5, 1, 1]
+
+    plan = [dict(name="fsd_dfs", report="fsd", dic_thresh_sbj=dic_fsd, thresh_score=[1, 2, 6, 7, 8, 9, 10]),
+            dict(name="lv_dfs", report="lv", dic_total_sbj=DIC_LV, max_class_rank=lv_rank,
+                 include_count_valid=1, add_rank_cols=[2, 4, 5]),
+            dict(name="bj1_dfs", report="cls", thresh=thresh_cls, thresh_score=thresh_cls_score,
+                 max_class_rank=cls_rank),
+            dict(name="bj0_dfs", report="cls", thresh=thresh_cls, thresh_score=None,
+                 max_class_rank=cls_rank, cumu=1)] + _data_plan()
+
+    rg, bj_row = (48, 405) if rows40 else (16, 149)
+    layout = [dict(report="fsd_dfs", row=5, col=4, rg=rg, cg=0),
+              dict(report="lv_dfs", row=5, col=14, rg=rg, cg=0),
+              dict(report="bj1_dfs", row=bj_row, col=4, rg=16, cg=0),
+              dict(report="bj0_dfs", row=bj_row, col=17, rg=16, cg=0)]
+
+    return dict(template_sheet="八年级2025_40" if rows40 else "八年级2025", plan=plan, layout=layout,
+                data_sheets=[("名次表", "df_MC0"), ("成绩表", "df_all")], sort_cols=SORT_COLS, sort_by=SORT_BY)
+
+
+def preset_analysis9(lv_rank: int = 45, cls_rank: int = 50, rows40: bool = False) -> Dict[str, Any]:
+    """九年级分析方案（Pages/analysis9.py，rows40=True时为analysis9_40.py）。"""
+    thresh_cls = [0, 10, 50, 100, 150, 200, 240, 300, 350, 400]
+    thresh_cls_score = [10, 10, 10, 10, 8, 6, 1, 1, 1, 1]
+
+    plan = [dict(name="sdb_dfs", report="sdb", thresh=[0, 180, 240, 300], thresh_score=[10, 9, 2, 1, 0],
+                 max_total_rank=240),
+            dict(name="lv_dfs", report="lv", dic_total_sbj=DIC_LV, thresh=[0.6, 0.8], include_count_valid=-1,
+                 max_class_rank=lv_rank),
+            dict(name="bj_dfs", report="cls", thresh=thresh_cls, thresh_score=thresh_cls_score,
+                 max_class_rank=cls_rank),
+            dict(name="bj1_dfs", report="cls", thresh=thresh_cls, max_class_rank=cls_rank, cumu=1)] + _data_plan()
+
+    rg, bj_row, bj1_row = (48, 357, 399) if rows40 else (16, 133, 143)
+    layout = [dict(report="sdb_dfs", row=5, col=4, rg=rg, cg=0),
+              dict(report="lv_dfs", row=5, col=12, rg=rg, cg=0),
+              dict(report="bj_dfs", row=bj_row, col=4, rg=16, cg=0),
+              dict(report="bj1_dfs", row=bj1_row, col=7, rg=16, cg=0)]
+
+    return dict(template_sheet="九年级2025_40" if rows40 else "九年级2025", plan=plan, layout=layout,
+                data_sheets=[("名次表", "df_MC0"), ("成绩表", "df_all")], sort_cols=SORT_COLS, sort_by=SORT_BY)
+
+
+PRESETS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "analysis7": lambda lv_rank, cls_rank: preset_analysis7(lv_rank, cls_rank),
+    "analysis7_40": lambda lv_rank, cls_rank: preset_analysis7(lv_rank, cls_rank, rows40=True),
+    "analysis9": lambda lv_rank, cls_rank: preset_analysis9(lv_rank, cls_rank),
+    "analysis9_40": lambda lv_rank, cls_rank: preset_analysis9(lv_rank, cls_rank, rows40=True),
+}
+
+
+def load_config(config: str, lv_rank: int = 45, cls_rank: int = 50) -> Dict[str, Any]:
+    """
+    获取批量分析配置。
+
+    :param config: 内置方案名（见PRESETS），或定义了CONFIG字典的python配置文件路径。
+    :param lv_rank: 两率一平参评人数，仅对内置方案有效。
+    :param cls_rank: 班级分析参评人数，仅对内置方案有效。
+    :return: 配置字典。
+    :raises ValueError: 方案名不存在，或配置文件中没有CONFIG字典。
+    """
+    if config in PRESETS:
+        return PRESETS[config](lv_rank, cls_rank)
+    if not os.path.isfile(config):
+        raise ValueError(f"配置'{config}'既不是内置方案{list(PRESETS)}，也不是配置文件")
+
+    cfg = runpy.run_path(config).get("CONFIG")
+    if not isinstance(cfg, dict):
+        raise ValueError(f"配置文件'{config}'中必须定义CONFIG字典")
+    missing = [key for key in ("template_sheet", "plan", "layout") if key not in cfg]
+    if missing:
+        raise ValueError(f"配置文件'{config}'的CONFIG缺少键: {missing}")
+    return cfg
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 单个成绩表的分析流程
+def build_workbook(
+        adf: al2.Andf,
+        cfg: Dict[str, Any],
+        template_path: str = TEMPLATE_PATH,
+        template_data: Optional[bytes] = None):
+    """
+    按配置生成报表并注入模板，返回填好的工作簿与数据工作表。
+
+    :param adf: Andf对象。
+    :param cfg: 配置字典，见load_config()。
+    :param template_path: 模板xlsx文件路径。
+    :param template_data: 已裁剪的模板xlsx字节（见al2.template_bytes()），默认None：从模板池获取。
+    :return: 元组（openpyxl工作簿对象, {工作表名: df表}）。数据工作表在工作簿中为空表，
+             由al2.wb_to_bytesIO(wb, data_sheets)在保存时流式写入。
+    """
+    reports = adf.build_reports(cfg["plan"])
+
+    # 将分析报表注入模板工作表
+    if template_data is None:
+        wb, ws = al2.load_template(template_path, cfg["template_sheet"])
+    else:
+        wb = openpyxl.load_workbook(BytesIO(template_data))
+        ws = wb[cfg["template_sheet"]]
+    for item in cfg["layout"]:
+        dfs = reports[item["report"]]
+        if isinstance(dfs, dict):
+            dfs = list(dfs.values())
+        al2.dfs_to_ws(ws, item["row"], item["col"], dfs, item.get("rg", 16), item.get("cg", 0), False, idx=False)
+
+    # 新建名次表、成绩表等数据工作表（依次插入到模板工作表之后），数据在保存时写入
+    data_sheets = {}
+    for sheet_name, report in cfg.get("data_sheets", []):
+        wb.create_sheet(sheet_name, 1)
+        data_sheets[sheet_name] = al2.df_sort(reports[report], cols=cfg.get("sort_cols"),
+                                              sort_by=cfg.get("sort_by", SORT_BY))
+
+    return wb, data_sheets
+
+
+def run_file(
+        path: str,
+        out_dir: str,
+        cfg: Dict[str, Any],
+        sheet_name: Optional[str] = None,
+        template_path: str = TEMPLATE_PATH,
+        template_data: Optional[bytes] = None
+        ) -> Tuple[str, Optional[str], float, Optional[str]]:
+    """
+    处理一个成绩xlsx文件，写出报表文件。在进程池中运行，不抛出异常。
+
+    :param path: 成绩xlsx文件路径。
+    :param out_dir: 输出目录。
+    :param cfg: 配置字典。
+    :param sheet_name: 成绩工作表名称，默认None：第一个工作表。
+    :param template_path: 模板xlsx文件路径。
+    :param template_data: 已裁剪的模板xlsx字节，默认None：从模板池获取。
+    :return: 元组（输入文件, 输出文件, 用时秒数, 错误信息）。成功时错误信息为None，失败时输出文件为None。
+    """
+    start = time.time()
+    try:
+        sheet_name = sheet_name or al2.get_sheet_names(path)[0]
+        adf = al2.Andf(al2.load_sheet(path, sheet_name))
+        wb, data_sheets = build_workbook(adf, cfg, template_path, template_data)
+
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0]
+                                + "_" + cfg["template_sheet"] + "_报表" + ".xlsx")
+        with open(out_path, "wb") as f:
+            f.write(al2.wb_to_bytesIO(wb, data_sheets).getvalue())
+        return path, out_path, time.time() - start, None
+    except Exception as e:
+        return path, None, time.time() - start, f"{type(e).__name__}: {str(e)}"
+
+
+def run_batch(
+        in_dir: str,
+        out_dir: str,
+        cfg: Dict[str, Any],
+        sheet_name: Optional[str] = None,
+        template_path: str = TEMPLATE_PATH,
+        jobs: Optional[int] = None
+        ) -> List[Tuple[str, Optional[str], float, Optional[str]]]:
+    """
+    在进程池中处理目录中的全部xlsx文件（忽略以~$开头的Excel临时文件）。
+
+    :param in_dir: 成绩文件目录。
+    :param out_dir: 输出目录，不存在时自动创建。
+    :param cfg: 配置字典。
+    :param sheet_name: 成绩工作表名称，默认None：各文件的第一个工作表。
+    :param template_path: 模板xlsx文件路径。
+    :param jobs: 进程数，默认None：CPU核数。为1时在当前进程中依次处理。
+    :return: 各文件的run_file()结果列表，按文件名排序。
+    """
+    files = sorted(os.path.join(in_dir, name) for name in os.listdir(in_dir)
+                   if name.lower().endswith(".xlsx") and not name.startswith("~$"))
+    os.makedirs(out_dir, exist_ok=True)
+
+    if jobs == 1 or len(files) <= 1:
+        return [run_file(path, out_dir, cfg, sheet_name, template_path) for path in files]
+
+    # 模板只在主进程中解析一次，裁剪后的xlsx字节（几十KB）随任务传给各子进程
+    data = al2.template_bytes(template_path, cfg["template_sheet"])
+    # 子进程使用与主进程相同的Parquet缓存目录
+    with ProcessPoolExecutor(max_workers=jobs, initializer=al2.set_parquet_cache_dir,
+                             initargs=(al2.get_parquet_cache_dir(),)) as executor:
+        futures = [executor.submit(run_file, path, out_dir, cfg, sheet_name, template_path, data)
+                   for path in files]
+        return [future.result() for future in futures]
+
+
+def store_results(
+        store_path: str,
+        results: List[Tuple[str, Optional[str], float, Optional[str]]],
+        sheet_name: Optional[str] = None
+        ) -> List[Tuple[str, Optional[str]]]:
+    """
+    将分析成功的成绩文件追加到历史成绩库（在主进程中依次写入），考试名称为文件名，已有的同名考试被替换。
+    成绩表从Parquet缓存读取，不再解析xlsx。
+
+    :param store_path: 历史成绩库目录。
+    :param results: run_batch()的结果列表。
+    :param sheet_name: 成绩工作表名称，默认None：各文件的第一个工作表。
+    :return: 列表，每项为（考试名称, 错误信息），成功时错误信息为None。
+    """
+    store = history.ExamStore(store_path)
+    stored = []
+    for path, out_path, _, error in results:
+        if error is not None:
+            continue
+        exam = os.path.splitext(os.path.basename(path))[0]
+        try:
+            sheet = sheet_name or al2.get_sheet_names(path)[0]
+            store.append(exam, al2.Andf(al2.load_sheet(path, sheet)), overwrite=True)
+            stored.append((exam, None))
+        except Exception as e:
+            stored.append((exam, f"{type(e).__name__}: {str(e)}"))
+    return stored
+
+
+# ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+# 命令行入口
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m longsea.batch", description="批量成绩分析：为目录中的每个成绩文件生成报表。")
+    parser.add_argument("in_dir", help="成绩xlsx文件目录")
+    parser.add_argument("out_dir", help="报表输出目录")
+    parser.add_argument("--config", default="analysis9", help=f"内置方案{list(PRESETS)}或配置文件路径，默认analysis9")
+    parser.add_argument("--sheet", default=None, help="成绩工作表名称，默认各文件的第一个工作表")
+    parser.add_argument("--template", default=TEMPLATE_PATH, help="模板xlsx文件路径，默认longsea/模板2024.xlsx")
+    parser.add_argument("--template-sheet", default=None, help="模板工作表名称，默认使用方案中的设置")
+    parser.add_argument("--lv-rank", type=int, default=45, help="两率一平参评人数，默认45")
+    parser.add_argument("--cls-rank", type=int, default=50, help="班级分析参评人数，默认50")
+    parser.add_argument("--jobs", type=int, default=None, help="并行进程数，默认CPU核数")
+    parser.add_argument("--cache-dir", default=None, help="Parquet缓存目录，默认为环境变量LONGSEA_CACHE_DIR或~/.cache/longsea")
+    parser.add_argument("--no-cache", action="store_true", help="不使用Parquet缓存")
+    parser.add_argument("--store", default=None, help="历史成绩库目录，分析成功的文件追加到成绩库")
+    args = parser.parse_args(argv)
+
+    try:
+        cfg = load_config(args.config, args.lv_rank, args.cls_rank)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.template_sheet:
+        cfg["template_sheet"] = args.template_sheet
+    # 分发前检查模板：并行时模板在主进程中裁剪，出错不会按文件报告
+    try:
+        sheet_names = al2.get_sheet_names(args.template)
+    except (ValueError, OSError) as e:
+        parser.error(f"无法读取模板文件 {args.template}: {e}")
+    if cfg["template_sheet"] not in sheet_names:
+        parser.error(f"模板文件中没有工作表 '{cfg['template_sheet']}'，可用的工作表: {sheet_names}")
+    # 命令行默认开启Parquet缓存（库与页面默认关闭）
+    if args.no_cache:
+        al2.set_parquet_cache_dir(None)
+    else:
+        al2.set_parquet_cache_dir(args.cache_dir or al2.get_parquet_cache_dir() or al2.DEFAULT_PARQUET_DIR)
+
+    start = time.time()
+    results = run_batch(args.in_dir, args.out_dir, cfg, args.sheet, args.template, args.jobs)
+
+    n_failed = 0
+    for path, out_path, seconds, error in results:
+        if error is None:
+            print(f"完成 {os.path.basename(path)} -> {out_path}（{seconds:.2f}秒）")
+        else:
+            n_failed += 1
+            print(f"失败 {os.path.basename(path)}: {error}", file=sys.stderr)
+    if args.store:
+        for exam, error in store_results(args.store, results, args.sheet):
+            if error is None:
+                print(f"已追加到历史成绩库 {exam}")
+            else:
+                n_failed += 1
+                print(f"追加到历史成绩库失败 {exam}: {error}", file=sys.stderr)
+    print(f"共{len(results)}个文件，失败{n_failed}个，共用时：{round(time.time() - start, 2)}秒。")
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
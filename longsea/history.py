@@ -0,0 +1,358 @@
+"""
+历史成绩库：把每次考试的分析结果（各科成绩、总分、班次、级次、学科名次）按考试追加保存到目录中，
+之后查询学生的名次轨迹、班级均分走势等跨考试的统计，不再重新解析各次考试的xlsx文件。
+
+用法：
+    from longsea import al2, history
+    store = history.ExamStore("D:/成绩库")
+    store.append("2026.09月考", al2.get_andf(file, "Sheet1"), date="2026-09-28")
+    store.exams()                                    # 考试目录：考试、日期、人数、学科
+    store.trajectory([20260001, 20260002])           # 学生的级次轨迹，行为学号，列为考试
+    store.trajectory(ids, value="数学名次")           # 学科名次轨迹
+    store.class_trend("总分", stat="mean")            # 班级总分均分走势，行为班级，列为考试
+    store.load(exams=["2026.09月考"], columns=["学号", "总分"])   # 长表，第一列为考试
+
+目录结构（需要pyarrow）：
+    catalog.json            考试目录，按追加顺序排列，查询结果的考试列也按此顺序
+    index.parquet           学号索引（学号, 考试），按学号排序
+    exam_<哈希>.parquet      每次考试一个列式文件，按学号排序，查询学号时只读取包含这些学号的行组
+
+学号统一保存为字符串（20260001与"20260001"、20260001.0视为同一学号），每次考试中学号不能重复。
+姓名、班级也保存为字符串（班级6与6.0都保存为"6"）：Excel中同一列常混有数字与文本（如6与"6班"），
+统一类型后才能写入Parquet，各次考试的班级也能按同一个值分组。
+同一目录只应由一个进程写入；写入文件时先写临时文件再改名，读取时不会读到不完整的文件。
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from longsea import al2
+
+STORE_VERSION = 1
+ID_COL = "学号"
+EXAM_COL = "考试"
+# 每次考试保存的基本列（成绩表中存在时），学科成绩列与"学科名次"列在此之后
+BASE_COLS = ["学号", "姓名", "班级"]
+TOTAL_COLS = ["总分", "班次", "级次"]
+RANK_SUFFIX = "名次"
+# 每个行组的行数：按学号查询时以行组为单位跳过不相关的数据
+ROW_GROUP_SIZE = 4096
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("历史成绩库需要安装pyarrow：pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _normalize_id(value: Any) -> Optional[str]:
+    """学号转换为字符串：整数值的浮点数去掉小数部分，字符串去掉首尾空白，空值返回None。"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    text = str(value).strip()
+    return text or None
+
+
+def normalize_ids(ids: Any) -> pd.Series:
+    """
+    将学号序列转换为字符串序列（见_normalize_id()），空学号为None。
+
+    :param ids: 学号列表或Series。
+    :return: dtype为object的Series，索引与传入的Series相同。
+    """
+    sr = ids if isinstance(ids, pd.Series) else pd.Series(list(ids), dtype=object)
+    if pd.api.types.is_integer_dtype(sr.dtype) and not isinstance(sr.dtype, pd.api.extensions.ExtensionDtype):
+        return sr.astype(str).astype(object)
+    return sr.map(_normalize_id).astype(object)
+
+
+def exam_record(data: Union["al2.Andf", pd.DataFrame]) -> pd.DataFrame:
+    """
+    生成一次考试的保存记录：学号、姓名、班级、各科成绩、总分、班次、级次与各科年级名次（列名为"学科名次"）。
+
+    :param data: Andf对象，或成绩表（自动创建Andf对象）。
+    :return: df表，按学号排序，学号、姓名、班级为字符串（空值为None）。
+    :raises ValueError: 没有学号列、或学号重复。
+    """
+    adf = data if isinstance(data, al2.Andf) else al2.Andf(data)
+    df_all = adf.get_all()
+    if ID_COL not in df_all.columns:
+        raise ValueError(f"成绩表中没有{ID_COL}列，无法保存到历史成绩库")
+
+    sbj_lst = adf.get_sbj_lst()
+    cols = [col for col in BASE_COLS if col in df_all.columns] + sbj_lst + TOTAL_COLS
+    record = df_all[cols].copy()
+    # 年级学科名次与get_mc(combine_ranks=0)相同
+    df_mc = adf.get_mc(combine_ranks=0)
+    for sbj in sbj_lst:
+        record[sbj + RANK_SUFFIX] = df_mc[sbj]
+
+    # 学号、姓名、班级转换为字符串，混有数字与文本的列也能写入Parquet
+    for col in BASE_COLS:
+        if col in record.columns:
+            record[col] = normalize_ids(record[col])
+    record = record[record[ID_COL].notna()]
+    duplicated = record[ID_COL][record[ID_COL].duplicated()].unique().tolist()
+    if duplicated:
+        raise ValueError(f"{ID_COL}重复，无法保存到历史成绩库: {duplicated[:10]}")
+    return record.sort_values(ID_COL, kind="stable").reset_index(drop=True)
+
+
+class ExamStore:
+    """按考试分区保存成绩的历史成绩库，见模块说明。"""
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: 成绩库目录，不存在时在第一次追加考试时创建。
+        """
+        self.path = os.path.abspath(path)
+        self.__catalog: Optional[List[Dict[str, Any]]] = None
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 目录与文件
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _catalog(self) -> List[Dict[str, Any]]:
+        """考试目录（按追加顺序），首次使用时读取catalog.json。"""
+        if self.__catalog is None:
+            path = self._file("catalog.json")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") != STORE_VERSION:
+                    raise ValueError(f"历史成绩库版本不匹配: {data.get('version')}，当前版本为{STORE_VERSION}")
+                self.__catalog = data["exams"]
+            else:
+                self.__catalog = []
+        return self.__catalog
+
+    def _save_catalog(self, catalog: List[Dict[str, Any]]) -> None:
+        text = json.dumps(dict(version=STORE_VERSION, exams=catalog), ensure_ascii=False, indent=1)
+        tmp = self._tmp("catalog.json")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self._file("catalog.json"))
+        self.__catalog = catalog
+
+    def _tmp(self, name: str) -> str:
+        return self._file(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _write_table(self, df: pd.DataFrame, name: str) -> None:
+        pa, pq = _require_pyarrow()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp = self._tmp(name)
+        try:
+            pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp, self._file(name))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _entry(self, exam: str) -> Dict[str, Any]:
+        for entry in self._catalog():
+            if entry["exam"] == exam:
+                return entry
+        raise KeyError(f"历史成绩库中没有考试: {exam}")
+
+    def _select(self, exams: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """按考试名列表取目录项（保持目录顺序），None：全部考试。"""
+        if exams is None:
+            return list(self._catalog())
+        wanted = [self._entry(exam)["exam"] for exam in exams]
+        return [entry for entry in self._catalog() if entry["exam"] in wanted]
+
+    @staticmethod
+    def _exam_file(exam: str) -> str:
+        return "exam_" + hashlib.blake2b(exam.encode("utf-8"), digest_size=8).hexdigest() + ".parquet"
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 追加与删除考试
+    def append(self,
+               exam: str,                                    # 考试名称，例："2026.09月考"
+               data: Union["al2.Andf", pd.DataFrame],        # Andf对象或成绩表
+               date: Optional[str] = None,                   # 考试日期，只作为目录信息保存
+               overwrite: bool = False                       # 考试已存在时是否替换
+               ) -> int:
+        """
+        追加一次考试，保存exam_record(data)，并更新学号索引与考试目录。
+
+        :param exam: 考试名称，在成绩库中唯一。
+        :param data: Andf对象，或成绩表。
+        :param date: 考试日期，默认None。
+        :param overwrite: 考试已存在时，True：替换（保持原来的顺序），False：报错。默认False。
+        :return: 保存的学生人数。
+        :raises ValueError: 考试已存在且overwrite=False，或成绩表没有学号列、学号重复。
+        """
+        _require_pyarrow()
+        exam = str(exam)
+        catalog = [dict(entry) for entry in self._catalog()]
+        old = next((entry for entry in catalog if entry["exam"] == exam), None)
+        if old is not None and not overwrite:
+            raise ValueError(f"历史成绩库中已有考试: {exam}，替换请设置overwrite=True")
+
+        record = exam_record(data)
+        os.makedirs(self.path, exist_ok=True)
+        columns = record.columns.tolist()
+        entry = dict(exam=exam, file=self._exam_file(exam), date=date, rows=len(record), columns=columns,
+                     subjects=[col for col in columns if col + RANK_SUFFIX in columns],
+                     added=datetime.datetime.now().isoformat(timespec="seconds"))
+        self._write_table(record, entry["file"])
+
+        index = self._index()
+        index = index[index[EXAM_COL] != exam]
+        index = pd.concat([index, pd.DataFrame({ID_COL: record[ID_COL].to_numpy(dtype=object),
+                                                EXAM_COL: exam})], ignore_index=True)
+        self._write_table(index.sort_values(ID_COL, kind="stable"), "index.parquet")
+
+        if old is None:
+            catalog.append(entry)
+        else:
+            catalog[catalog.index(old)] = entry
+        self._save_catalog(catalog)
+        return len(record)
+
+    def remove(self, exam: str) -> None:
+        """
+        删除一次考试。
+
+        :param exam: 考试名称。
+        :raises KeyError: 考试不存在。
+        """
+        entry = self._entry(exam)
+        index = self._index()
+        self._write_table(index[index[EXAM_COL] != exam], "index.parquet")
+        self._save_catalog([item for item in self._catalog() if item["exam"] != exam])
+        path = self._file(entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+
+    # ■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■■
+    # 查询
+    def exams(self) -> pd.DataFrame:
+        """
+        返回考试目录：考试、日期、人数、学科、追加时间，按追加顺序排列。
+        """
+        rows = [{EXAM_COL: entry["exam"], "日期": entry["date"], "人数": entry["rows"],
+                 "学科": entry["subjects"],
+                 "追加时间": entry["added"]} for entry in self._catalog()]
+        return pd.DataFrame(rows, columns=[EXAM_COL, "日期", "人数", "学科", "追加时间"])
+
+    def _index(self, ids: Optional[List[str]] = None) -> pd.DataFrame:
+        """读取学号索引（学号, 考试），ids不为None时只读取这些学号。"""
+        path = self._file("index.parquet")
+        # 空学号列表不能作为Arrow的in过滤条件（类型无法推断）
+        if not os.path.exists(path) or (ids is not None and not ids):
+            return pd.DataFrame({ID_COL: pd.Series(dtype=object), EXAM_COL: pd.Series(dtype=object)})
+        _, pq = _require_pyarrow()
+        filters = None if ids is None else [(ID_COL, "in", ids)]
+        return pq.read_table(path, filters=filters).to_pandas()
+
+    def student_exams(self, ids: Any) -> Dict[str, List[str]]:
+        """
+        从学号索引中查询学生参加过的考试。
+
+        :param ids: 学号列表。
+        :return: {学号: [考试名, ...]}，考试按目录顺序排列，没有记录的学号不在字典中。
+        """
+        ids = [i for i in normalize_ids(ids).tolist() if i is not None]
+        order = {entry["exam"]: n for n, entry in enumerate(self._catalog())}
+        result: Dict[str, List[str]] = {}
+        for sid, exam in self._index(ids).itertuples(index=False):
+            result.setdefault(sid, []).append(exam)
+        return {sid: sorted(exams, key=order.__getitem__) for sid, exams in result.items()}
+
+    def load(self,
+             exams: Optional[List[str]] = None,      # 考试名列表，默认全部考试
+             columns: Optional[List[str]] = None,    # 列名列表，默认全部列
+             ids: Any = None                         # 学号列表，默认全部学生
+             ) -> pd.DataFrame:
+        """
+        读取多次考试的记录，返回长表：第一列为考试（按目录顺序的有序分类），之后为所选列。
+        指定学号时先查学号索引，只读取这些学生参加过的考试，每个文件只读取包含这些学号的行组。
+        某次考试没有的列（如未考的学科）为空值。
+
+        :param exams: 考试名列表，默认None：全部考试。
+        :param columns: 列名列表，默认None：全部列。
+        :param ids: 学号列表，默认None：全部学生。
+        :return: df表。
+        """
+        pa, pq = _require_pyarrow()
+        entries = self._select(exams)
+        filters = None
+        if ids is not None:
+            ids = [i for i in normalize_ids(ids).tolist() if i is not None]
+            taken = set(self._index(ids)[EXAM_COL])
+            entries = [entry for entry in entries if entry["exam"] in taken]
+            filters = [(ID_COL, "in", ids)]
+
+        names = [entry["exam"] for entry in self._catalog()]
+        frames = []
+        for entry in entries:
+            cols = None if columns is None else [col for col in columns if col in entry["columns"]]
+            df = pq.read_table(self._file(entry["file"]), columns=cols, filters=filters).to_pandas()
+            df.insert(0, EXAM_COL, entry["exam"])
+            frames.append(df)
+
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=[EXAM_COL])
+        if columns is not None:
+            df = df.reindex(columns=[EXAM_COL] + [col for col in columns if col != EXAM_COL])
+        df[EXAM_COL] = pd.Categorical(df[EXAM_COL], categories=names, ordered=True)
+        return df
+
+    def trajectory(self,
+                   ids: Any,                                 # 学号列表
+                   value: str = "级次",                       # 统计列，例："级次"、"班次"、"总分"、"数学名次"
+                   exams: Optional[List[str]] = None         # 考试名列表，默认全部考试
+                   ) -> pd.DataFrame:
+        """
+        学生的成绩或名次轨迹。
+
+        :param ids: 学号列表。
+        :param value: 统计列，默认"级次"。
+        :param exams: 考试名列表，默认None：全部考试。
+        :return: df表，行为学号（按传入顺序，没有记录的学号为空行），列为考试（按目录顺序），未参加的考试为空值。
+        """
+        ids = normalize_ids(ids).dropna().drop_duplicates().tolist()
+        df = self.load(exams=exams, columns=[ID_COL, value], ids=ids)
+        names = [entry["exam"] for entry in self._select(exams)]
+        wide = df.pivot(index=ID_COL, columns=EXAM_COL, values=value) if len(df) else pd.DataFrame()
+        wide = wide.reindex(index=pd.Index(ids, name=ID_COL), columns=pd.Index(names, name=EXAM_COL))
+        return wide
+
+    def class_trend(self,
+                    value: str = "总分",                      # 统计列
+                    stat: Union[str, Callable] = "mean",     # 统计方法，pandas聚合函数名或函数
+                    by: str = "班级",                         # 分组列
+                    exams: Optional[List[str]] = None        # 考试名列表，默认全部考试
+                    ) -> pd.DataFrame:
+        """
+        按班级（或其他分组列）统计各次考试的走势。
+
+        :param value: 统计列，默认"总分"。
+        :param stat: 统计方法，如"mean"、"median"、"count"，默认"mean"。
+        :param by: 分组列，默认"班级"。
+        :param exams: 考试名列表，默认None：全部考试。
+        :return: df表，行为分组值，列为考试（按目录顺序）。
+        """
+        names = [entry["exam"] for entry in self._select(exams)]
+        df = self.load(exams=exams, columns=[by, value])
+        trend = df.groupby([by, EXAM_COL], observed=True)[value].agg(stat).unstack(EXAM_COL)
+        return trend.reindex(columns=pd.Index(names, name=EXAM_COL))
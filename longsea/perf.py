@@ -0,0 +1,314 @@
+"""
+性能统计：记录各环节与al2公共函数的用时、调用次数与内存峰值（tracemalloc），默认关闭。
+
+用法：
+    from longsea import perf
+    with perf.session(memory=True):           # 开启统计（memory=True时同时记录内存峰值，运行会变慢），退出时关闭
+        with perf.stage("报表计算"):           # 自定义环节，可嵌套
+            reports = adf.build_reports(plan)  # al2的公共函数与Andf的公共方法自动记录
+        perf.report()                         # 统计字典
+        perf.save_chrome_trace("trace.json")  # Chrome trace格式，可在chrome://tracing或Perfetto中查看
+        perf.st_expander()                    # 在streamlit页面中以折叠框显示
+
+也可以直接调用enable()、disable()，此时应在finally中调用disable()：streamlit在控件变化时以异常中断页面运行，
+未关闭的统计（及tracemalloc）会一直保留。
+
+统计数据按线程分别保存（streamlit每个会话在各自的线程中运行页面）。内存峰值由tracemalloc统计，
+为进程内全部线程的分配，多个会话同时运行时会互相影响。tracemalloc由第一个需要它的enable()启动、
+最后一个disable()停止；在开启统计之前已由其他代码启动的tracemalloc不会被停止。
+关闭时，被包装的函数只增加一次标志判断，stage()返回空的上下文管理器。
+"""
+
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+# 每个线程最多保留的事件数（用于Chrome trace），超出后只累计统计数据
+MAX_EVENTS = 100000
+
+_local = threading.local()
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# tracemalloc为进程级：记录使用它的线程数，以及是否由本模块启动
+_TRACE_LOCK = threading.Lock()
+_trace_users = 0
+_trace_started = False
+
+
+def _state() -> Any:
+    """当前线程的统计状态。"""
+    if not hasattr(_local, "enabled"):
+        _local.enabled = False
+        _local.memory = False
+        _local.tracing = False  # 本线程是否计入tracemalloc的使用者
+        _local.stack = []       # 进行中的环节：[名称, 开始时间, 起始内存, 内存峰值]
+        _local.events = []      # 已结束的环节：(名称, 开始时间, 用时, 深度, 内存峰值)
+        _local.stats = {}       # {名称: [调用次数, 总用时, 最大用时, 内存峰值]}
+        _local.dropped = 0
+        _local.origin = time.perf_counter()
+    return _local
+
+
+def enable(memory: bool = False) -> None:
+    """
+    在当前线程开启统计，并清空之前的记录。
+
+    :param memory: 是否用tracemalloc记录内存峰值，默认False。开启后运行速度明显变慢。
+    """
+    global _trace_users, _trace_started
+    reset()
+    state = _state()
+    state.enabled = True
+    state.memory = memory
+    if memory and not state.tracing:
+        with _TRACE_LOCK:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _trace_started = True
+            _trace_users += 1
+        state.tracing = True
+    elif not memory:
+        _release_trace(state)
+
+
+def disable() -> None:
+    """
+    在当前线程关闭统计，保留已记录的数据。
+    没有其他线程使用tracemalloc时，停止由enable()启动的tracemalloc（其他代码启动的不停止）。
+    """
+    state = _state()
+    _release_trace(state)
+    state.enabled = False
+    state.memory = False
+
+
+def _release_trace(state: Any) -> None:
+    """当前线程不再使用tracemalloc；最后一个使用者退出时停止本模块启动的tracemalloc。"""
+    global _trace_users, _trace_started
+    if not state.tracing:
+        return
+    state.tracing = False
+    with _TRACE_LOCK:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started:
+            _trace_started = False
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def session(enabled: bool = True, memory: bool = False):
+    """
+    在with语句块中开启统计，退出时（包括异常、streamlit中断运行）关闭统计。
+
+    :param enabled: 是否开启统计，False时不做任何事，便于按页面选项决定。
+    :param memory: 同enable()。
+    """
+    if not enabled:
+        yield
+        return
+    enable(memory)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def is_enabled() -> bool:
+    """当前线程是否开启了统计。"""
+    return getattr(_local, "enabled", False)
+
+
+def reset() -> None:
+    """清空当前线程的记录。"""
+    state = _state()
+    state.stack = []
+    state.events = []
+    state.stats = {}
+    state.dropped = 0
+    state.origin = time.perf_counter()
+
+
+def _begin(name: str) -> None:
+    state = _state()
+    start_mem = 0
+    if state.memory and tracemalloc.is_tracing():
+        # 子环节开始前，把到目前为止的峰值记入各上级环节，再重置峰值
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in state.stack:
+            frame[3] = max(frame[3], peak)
+        tracemalloc.reset_peak()
+        start_mem = current
+    state.stack.append([name, time.perf_counter(), start_mem, start_mem])
+
+
+def _end() -> None:
+    end = time.perf_counter()
+    state = _state()
+    if not state.stack:
+        return
+    name, start, start_mem, peak_mem = state.stack.pop()
+
+    peak = None
+    if state.memory and tracemalloc.is_tracing():
+        peak_mem = max(peak_mem, tracemalloc.get_traced_memory()[1])
+        for frame in state.stack:
+            frame[3] = max(frame[3], peak_mem)
+        peak = peak_mem - start_mem
+
+    elapsed = end - start
+    stat = state.stats.get(name)
+    if stat is None:
+        stat = state.stats[name] = [0, 0.0, 0.0, None]
+    stat[0] += 1
+    stat[1] += elapsed
+    stat[2] = max(stat[2], elapsed)
+    if peak is not None:
+        stat[3] = peak if stat[3] is None else max(stat[3], peak)
+
+    if len(state.events) < MAX_EVENTS:
+        state.events.append((name, start, elapsed, len(state.stack), peak))
+    else:
+        state.dropped += 1
+
+
+@contextlib.contextmanager
+def _stage(name: str):
+    _begin(name)
+    try:
+        yield
+    finally:
+        _end()
+
+
+def stage(name: str) -> contextlib.AbstractContextManager:
+    """
+    自定义环节的上下文管理器，可嵌套。未开启统计时返回空的上下文管理器。
+
+    :param name: 环节名称。
+    """
+    if not is_enabled():
+        return _NULL_CONTEXT
+    return _stage(name)
+
+
+def instrument(func: Callable, name: Optional[str] = None) -> Callable:
+    """
+    包装函数，开启统计时记录其用时、调用次数与内存峰值。
+
+    :param func: 要包装的函数。
+    :param name: 统计名称，默认为函数的__qualname__。
+    :return: 包装后的函数。
+    """
+    name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not getattr(_local, "enabled", False):
+            return func(*args, **kwargs)
+        _begin(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _end()
+
+    wrapper.__perf_wrapped__ = True
+    return wrapper
+
+
+def instrument_module(namespace: Dict[str, Any], prefix: str) -> None:
+    """
+    包装模块中定义的全部公共函数（不以下划线开头），用于模块末尾：instrument_module(globals(), "al2")。
+
+    :param namespace: 模块的globals()。
+    :param prefix: 统计名称前缀，如"al2"。
+    """
+    module = namespace.get("__name__")
+    for key, obj in list(namespace.items()):
+        if (not key.startswith("_") and inspect.isfunction(obj) and obj.__module__ == module
+                and not getattr(obj, "__perf_wrapped__", False)):
+            namespace[key] = instrument(obj, f"{prefix}.{key}")
+
+
+def instrument_class(cls: type, prefix: Optional[str] = None) -> None:
+    """
+    包装类中定义的全部公共方法（不以下划线开头，不含静态方法、类方法与属性）。
+
+    :param cls: 类。
+    :param prefix: 统计名称前缀，默认为类名。
+    """
+    prefix = prefix or cls.__name__
+    for key, obj in list(vars(cls).items()):
+        if not key.startswith("_") and inspect.isfunction(obj) and not getattr(obj, "__perf_wrapped__", False):
+            setattr(cls, key, instrument(obj, f"{prefix}.{key}"))
+
+
+def report() -> Dict[str, Any]:
+    """
+    返回当前线程的统计结果。
+
+    :return: 字典{"total": 顶层环节总用时(秒), "stages": {名称: {"calls", "total", "mean", "max", "peak_bytes"}},
+             "events": 事件数, "dropped": 超出MAX_EVENTS未保留的事件数}。stages按首次结束的顺序排列。
+    """
+    state = _state()
+    stages = {name: dict(calls=calls, total=total, mean=total / calls, max=longest, peak_bytes=peak)
+              for name, (calls, total, longest, peak) in state.stats.items()}
+    total = sum(event[2] for event in state.events if event[3] == 0)
+    return dict(total=total, stages=stages, events=len(state.events), dropped=state.dropped)
+
+
+def report_df() -> pd.DataFrame:
+    """以df表返回统计结果，按总用时降序排列，列为调用次数、总用时、平均用时、最大用时（秒）与内存峰值（MB）。"""
+    stages = report()["stages"]
+    df = pd.DataFrame.from_dict(stages, orient="index", columns=["calls", "total", "mean", "max", "peak_bytes"])
+    df["peak_bytes"] = df["peak_bytes"].astype(float) / 1024 ** 2
+    df.columns = ["调用次数", "总用时", "平均用时", "最大用时", "内存峰值MB"]
+    return df.sort_values("总用时", ascending=False)
+
+
+def chrome_trace() -> Dict[str, Any]:
+    """
+    返回Chrome trace格式的事件字典（完整事件"X"，时间单位为微秒），可用json.dump保存。
+    """
+    state = _state()
+    pid, tid = os.getpid(), threading.get_ident()
+    events = []
+    for name, start, elapsed, depth, peak in state.events:
+        args = {"depth": depth}
+        if peak is not None:
+            args["peak_bytes"] = peak
+        events.append(dict(name=name, cat=name.split(".")[0] if "." in name else "stage", ph="X",
+                           ts=(start - state.origin) * 1e6, dur=elapsed * 1e6, pid=pid, tid=tid, args=args))
+    return dict(traceEvents=events, displayTimeUnit="ms")
+
+
+def save_chrome_trace(path: str) -> None:
+    """将chrome_trace()保存为json文件。"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(), f, ensure_ascii=False)
+
+
+def st_expander(title: str = "用时统计", expanded: bool = False) -> None:
+    """
+    在streamlit页面中以折叠框显示统计结果：总用时、各环节统计表与Chrome trace下载按钮。
+
+    :param title: 折叠框标题。
+    :param expanded: 是否默认展开。
+    """
+    import streamlit as st
+
+    result = report()
+    with st.expander(f"{title}：共用时{round(result['total'], 2)}秒", expanded=expanded):
+        st.dataframe(report_df(), use_container_width=True)
+        if result["dropped"]:
+            st.caption(f"事件数超过{MAX_EVENTS}，{result['dropped']}个事件未记入trace。")
+        st.download_button(label="下载Chrome trace", data=json.dumps(chrome_trace(), ensure_ascii=False),
+                           file_name="trace.json", mime="application/json")
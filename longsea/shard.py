@@ -0,0 +1,158 @@
+"""
+多校联合分析：每个学校的成绩表作为一个分区，各分区在进程池中并行分析，级次与学科名次为全区名次。
+
+全区名次不拼接各校成绩表：各分区只统计本校的成绩直方图（al2.score_histograms()），主进程合并直方图
+得到全区名次表（al2.GlobalRanks），再由各分区按全区名次生成本校报表。结果与把全部学校拼接成一个成绩表
+后排名相同；班次仍为本校班级内的名次。
+
+用法：
+    from longsea import shard, batch
+    sdf = shard.ShardedAndf.from_files(["一中.xlsx", "二中.xlsx", ...], jobs=4)
+    plan = batch.preset_analysis9()["plan"]
+    reports = sdf.build_reports(plan)           # {学校: {报表名: 报表}}
+    adf = sdf.andf("一中")                       # 使用全区名次的Andf对象，可单独调用get_xxx方法
+
+分区可以是成绩表（df表），也可以是(文件路径, 工作表名)，文件在子进程中由al2.load_sheet()读取（使用Parquet缓存）。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from longsea import al2
+
+# 分区数据：成绩表，或(成绩xlsx文件路径, 工作表名)
+Source = Union[pd.DataFrame, Tuple[str, str]]
+
+# 按max_class_rank参数筛选后排名（get_mc）的报表类型，其最大班次需要全区直方图；db、db_fsd只用全部学生的名次
+_RANKED_REPORTS = ("mc", "sdb")
+
+
+def _load(source: Source) -> pd.DataFrame:
+    if isinstance(source, pd.DataFrame):
+        return source
+    path, sheet_name = source
+    return al2.load_sheet(path, sheet_name)
+
+
+def _shard_histograms(source: Source, max_class_ranks: Tuple[Optional[Union[int, float]], ...]) -> Dict:
+    """子进程：统计一个分区的直方图。"""
+    return al2.score_histograms(al2.Andf(_load(source)), max_class_ranks)
+
+
+def _shard_reports(source: Source, ranks: "al2.GlobalRanks", plan: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """子进程：按全区名次生成一个分区的报表。"""
+    return al2.Andf(_load(source), ranks=ranks).build_reports(plan)
+
+
+def plan_max_class_ranks(plan: List[Dict[str, Any]]) -> List[Optional[Union[int, float]]]:
+    """
+    报表计划中需要全区直方图的最大班次：mc、sdb报表的max_class_rank（默认None），以及全部学生（None）。
+
+    :param plan: Andf.build_reports()的报表计划。
+    :return: 最大班次列表，第一项为None。
+    """
+    ks = [None]
+    for spec in plan:
+        if spec.get("report") in _RANKED_REPORTS:
+            k = spec.get("max_class_rank")
+            if k not in ks:
+                ks.append(k)
+    return ks
+
+
+class ShardedAndf:
+    """按学校分区的联合分析，见模块说明。"""
+
+    def __init__(self,
+                 shards: Dict[str, Source],    # {学校: 成绩表或(文件路径, 工作表名)}
+                 jobs: Optional[int] = None    # 并行进程数，默认CPU核数，1：在当前进程中依次处理
+                 ) -> None:
+        if not shards:
+            raise ValueError("至少需要一个分区")
+        self.shards: Dict[str, Source] = dict(shards)
+        self.jobs = jobs
+        self.__ranks: Optional[al2.GlobalRanks] = None
+
+    @classmethod
+    def from_files(cls,
+                   paths: List[str],
+                   sheet_name: Optional[str] = None,
+                   jobs: Optional[int] = None
+                   ) -> "ShardedAndf":
+        """
+        以成绩xlsx文件为分区，分区名为文件名（不含扩展名）。
+
+        :param paths: 文件路径列表。
+        :param sheet_name: 成绩工作表名称，默认None：各文件的第一个工作表。
+        :param jobs: 并行进程数。
+        :return: ShardedAndf对象。
+        :raises ValueError: 文件名重复。
+        """
+        shards = {}
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in shards:
+                raise ValueError(f"分区名重复: {name}")
+            shards[name] = (path, sheet_name or al2.get_sheet_names(path)[0])
+        return cls(shards, jobs=jobs)
+
+    def names(self) -> List[str]:
+        """分区名列表。"""
+        return list(self.shards)
+
+    def _map(self, func: Callable, *args) -> List[Any]:
+        """对各分区执行func(分区数据, *args)，分区多于一个且jobs不为1时在进程池中并行执行。"""
+        sources = list(self.shards.values())
+        if self.jobs == 1 or len(sources) <= 1:
+            return [func(source, *args) for source in sources]
+        # 子进程使用与主进程相同的Parquet缓存目录
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=al2.set_parquet_cache_dir,
+                                 initargs=(al2.get_parquet_cache_dir(),)) as executor:
+            futures = [executor.submit(func, source, *args) for source in sources]
+            return [future.result() for future in futures]
+
+    def ranks(self, max_class_ranks: Tuple[Optional[Union[int, float]], ...] = (None,)) -> "al2.GlobalRanks":
+        """
+        全区名次表。各分区并行统计直方图后合并，已计算过的最大班次不再重复统计。
+
+        :param max_class_ranks: 最大班次元组，None：全部学生（级次与get_mc()的名次）。
+        :return: al2.GlobalRanks对象。
+        """
+        known = [] if self.__ranks is None else self.__ranks.max_class_ranks()
+        missing = tuple(k for k in dict.fromkeys(max_class_ranks) if k not in known)
+        if missing:
+            merged = al2.GlobalRanks.merge(self._map(_shard_histograms, missing))
+            if self.__ranks is None:
+                self.__ranks = merged
+            else:
+                self.__ranks.update(merged)
+        return self.__ranks
+
+    def andf(self,
+             name: str,
+             max_class_ranks: Tuple[Optional[Union[int, float]], ...] = (None,)
+             ) -> "al2.Andf":
+        """
+        返回一个分区的Andf对象，级次与名次表为全区名次。
+
+        :param name: 分区名。
+        :param max_class_ranks: 需要全区名次的最大班次，见ranks()。get_mc、get_sdb使用其他最大班次时报错。
+        :return: Andf对象。
+        """
+        if name not in self.shards:
+            raise KeyError(f"没有分区: {name}")
+        return al2.Andf(_load(self.shards[name]), ranks=self.ranks(max_class_ranks))
+
+    def build_reports(self, plan: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        按报表计划为各分区生成报表（见Andf.build_reports()），名次为全区名次。
+        先并行统计计划所需的全区直方图，再并行生成各分区的报表。
+
+        :param plan: 报表计划。
+        :return: {分区名: {报表名: 报表}}。
+        """
+        ranks = self.ranks(tuple(plan_max_class_ranks(plan)))
+        return dict(zip(self.shards, self._map(_shard_reports, ranks, plan)))
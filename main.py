@@ -45,6 +45,7 @@ MB_file = "c:/loongsea/模板2023.xlsx"
 '''
 from longsea.als import workbook_to_bytesIO
 from longsea import als
+from longsea import al2
 from openpyxl import load_workbook
 import streamlit as st
 import pandas as pd
@@ -102,12 +103,10 @@ elif uploaded_file:
     col_A, col_B = st.columns(2)
     # 左分列
     with col_A:
-        # 使用Pandas读取己上传的Excel文件
-        df = pd.read_excel(uploaded_file, engine='openpyxl', sheet_name=None)      # 读取所有工作表。
-        # 创建一个选择框，返回列表中的一个选中的工作表。df.keys(),df的所有工作表名列表
-        selected_sheet = st.selectbox("选择工作表", list(df.keys()))
-        # 将所选工作表的数据返回df表。
-        df = df[selected_sheet]                          # *****************df表为所选工作表学生成绩表***********************
+        # 创建一个选择框，返回列表中的一个选中的工作表。工作表名列表直接从xlsx文件的目录中读取。
+        selected_sheet = st.selectbox("选择工作表", al2.get_sheet_names(uploaded_file))
+        # 读取所选工作表的数据返回df表，按上传文件内容哈希缓存，重新运行页面时不会重新解析xlsx。
+        df = al2.read_sheet(uploaded_file, selected_sheet)  # *****************df表为所选工作表学生成绩表***********************
         # 添加一个滑动条,用于选择统计学科成绩时,计算的班级学生数.
         bc_xk = st.slider('选择学科分析范围', min_value=1, max_value=60, value=45)
         # 右分列:
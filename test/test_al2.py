@@ -0,0 +1,465 @@
+"""longsea.al2 的回归测试。在仓库根目录运行：python -m pytest -q test"""
+
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synth import make_grades
+from longsea import al2
+
+warnings.simplefilter("ignore")
+
+
+@pytest.fixture
+def grades() -> pd.DataFrame:
+    return make_grades(300, 6, seed=1)
+
+
+def test_get_mc_result_is_not_cache(grades):
+    # 修改get_mc()的结果不影响之后的调用（结果缓存在Andf中，可能被多个会话共用）
+    adf = al2.Andf(grades)
+    expected = adf.get_mc(combine_ranks=0).copy()
+    m = adf.get_mc(combine_ranks=0)
+    m.loc[m.index[0], "数学"] = -999
+    m.iloc[1, 0] = -1
+    pd.testing.assert_frame_equal(adf.get_mc(combine_ranks=0), expected)
+
+
+def test_get_df_result_is_not_cache(grades):
+    adf = al2.Andf(grades)
+    expected = adf.get_df(columns=["班级", "数学"], max_class_rank=40).copy()
+    df = adf.get_df(columns=["班级", "数学"], max_class_rank=40)
+    df.loc[df.index[0], "数学"] = -999
+    df.iloc[:, 0] = 0
+    pd.testing.assert_frame_equal(adf.get_df(columns=["班级", "数学"], max_class_rank=40), expected)
+
+
+def test_get_all_result_is_not_cache(grades):
+    # get_andf()缓存的Andf由多个会话共用：修改get_all()的结果不影响之后的调用
+    adf = al2.Andf(grades)
+    expected = adf.get_all().copy()
+    df = adf.get_all()
+    df.loc[df.index[0], "总分"] = -999
+    df["x"] = 1
+    pd.testing.assert_frame_equal(adf.get_all(), expected)
+
+
+def test_cache_shared_across_threads(grades):
+    # 多个线程同时查询同一个Andf：缓存不超过上限，结果与单线程相同
+    adf = al2.Andf(grades, cache_size=4)
+    expected = {k: al2.Andf(grades).get_mc(k, combine_ranks=0) for k in range(5, 45, 5)}
+
+    def work(seed):
+        for k in np.random.default_rng(seed).permutation(list(expected)):
+            pd.testing.assert_frame_equal(adf.get_mc(int(k), combine_ranks=0), expected[k])
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(16)))
+
+
+def test_ingest_cache_charges_andf_results(grades, tmp_path):
+    # get_andf缓存的Andf之后缓存的结果计入上传文件缓存的占用，并受set_ingest_cache_limit()限制
+    path = str(tmp_path / "grades.xlsx")
+    grades.to_excel(path, index=False, sheet_name="成绩")
+    cache_dir = al2.get_parquet_cache_dir()
+    al2.set_parquet_cache_dir(None)
+    al2.clear_ingest_cache()
+    try:
+        adf = al2.get_andf(path, "成绩")
+        before = al2._INGEST_CACHE.nbytes
+        adf.get_cls([0, 50, 100, 200], max_class_rank=40)
+        adf.get_mc(combine_ranks=1)
+        assert al2._INGEST_CACHE.nbytes - before >= adf._nbytes() - al2._df_nbytes(grades) > 0
+
+        # 上限小于Andf当前占用时淘汰Andf，之后重新构建
+        al2.set_ingest_cache_limit(adf._nbytes() - 1)
+        assert al2.get_andf(path, "成绩") is not adf
+    finally:
+        al2.set_ingest_cache_limit(al2.INGEST_CACHE_BYTES)
+        al2.clear_ingest_cache()
+        al2.set_parquet_cache_dir(cache_dir)
+
+
+def test_dfs_to_zip_small_input_stays_in_process(grades, monkeypatch):
+    # 默认jobs=None：小文件不启动进程池
+    def no_pool(*args, **kwargs):
+        raise AssertionError("不应启动进程池")
+
+    monkeypatch.setattr(al2, "ProcessPoolExecutor", no_pool)
+    monkeypatch.setattr(al2.os, "cpu_count", lambda: 4)
+    dfs = {str(name): item for name, item in grades.groupby("班级")}
+    assert al2.dfs_to_zip(dfs).getvalue() == al2.dfs_to_zip(dfs, jobs=1).getvalue()
+
+
+def test_parquet_cache_is_opt_in_and_bounded(grades, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(al2, "_PARQUET_DIR", None)
+    monkeypatch.setattr(al2, "_PARQUET_LIMIT", al2.PARQUET_CACHE_BYTES)
+    al2.clear_ingest_cache()
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"grades{i}.xlsx")
+        grades.assign(学号=grades["学号"] + i).to_excel(path, index=False, sheet_name="成绩")
+        paths.append(path)
+
+    # 默认关闭：不写入任何缓存文件
+    al2.load_sheet(paths[0], "成绩")
+    assert al2.get_parquet_cache_dir() is None
+
+    cache_dir = tmp_path / "cache"
+    al2.set_parquet_cache_dir(str(cache_dir))
+    al2.clear_ingest_cache()
+    al2.load_sheet(paths[0], "成绩")
+    digest0 = al2.file_digest(paths[0])
+    size = sum(f.stat().st_size for f in cache_dir.glob("*.parquet"))
+    # 容量只够两个文件：写入第三个时淘汰最久未使用的第一个
+    al2.set_parquet_cache_limit(int(size * 2.5))
+    al2.load_sheet(paths[1], "成绩")
+    # 文件修改时间即最近使用时间，设为明确的先后顺序
+    for i, f in enumerate(sorted(cache_dir.glob("*.parquet"), key=lambda f: not f.name.startswith(digest0))):
+        os.utime(f, (1000 + i, 1000 + i))
+    al2.load_sheet(paths[2], "成绩")
+    files = sorted(f.name for f in cache_dir.glob("*.parquet"))
+    assert len(files) == 2
+    assert not any(f.startswith(digest0) for f in files)
+    al2.clear_ingest_cache()
+
+
+def test_merge_mult_dfs_key_dtype_mismatch_raises():
+    # 学号一个表为整数、另一个表为文本：与逐个pd.merge相同，报错而不是把同一学生分成两行
+    dfs = [pd.DataFrame({"学号": [1, 2], "语文": [90, 80]}),
+           pd.DataFrame({"学号": ["1", "2"], "数学": [70, 60]})]
+    with pytest.raises(ValueError):
+        al2.merge_mult_dfs(dfs, on="学号")
+
+
+def test_merge_mult_dfs_matches_pairwise_merge():
+    dfs = [pd.DataFrame({"学号": [3, 1, 2], "语文": [90, 80, 70]}),
+           pd.DataFrame({"学号": [2, 4], "数学": [60, 50]}),
+           pd.DataFrame({"学号": [1, 4], "语文": [85, 75]})]
+    expected = pd.merge(pd.merge(dfs[0].rename(columns={"语文": "语文_temp"}), dfs[1], how="outer", on="学号"),
+                        dfs[2], how="outer", on="学号")
+    # 两两合并的中间结果有空值，语文列变为浮点数；一次拼接合并后没有空值，仍为整数
+    expected["语文"] = expected["语文"].combine_first(expected.pop("语文_temp")).astype(np.int64)
+    result = al2.merge_mult_dfs(dfs, on="学号")
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected[result.columns].reset_index(drop=True))
+
+
+def test_merge_mult_dfs_keeps_integer_dtypes():
+    # 内连接没有空值：整数成绩列仍为整数（与两两合并相同）；外连接有空值的列为浮点数
+    dfs = [pd.DataFrame({"学号": [1, 2, 3], "语文": [90, 80, 70]}),
+           pd.DataFrame({"学号": [3, 2, 5], "数学": [60, 50, 40]}),
+           pd.DataFrame({"学号": [2, 3], "及格": [True, False]})]
+    inner = al2.merge_mult_dfs(dfs, on="学号", how="inner")
+    expected = pd.merge(pd.merge(dfs[0], dfs[1], how="inner", on="学号"), dfs[2], how="inner", on="学号")
+    pd.testing.assert_frame_equal(inner, expected)
+    assert inner.dtypes.tolist() == [np.int64, np.int64, np.int64, np.bool_]
+
+    outer = al2.merge_mult_dfs(dfs[:2], on="学号", how="outer")
+    pd.testing.assert_frame_equal(outer, pd.merge(dfs[0], dfs[1], how="outer", on="学号"))
+    assert outer["语文"].dtype == np.float64
+
+
+def test_rate_ladder_matches_engine_on_decimal_scores():
+    # 阶梯的平均分按班级分别累加，与rate_stats_by_group的差异只在舍入范围内；计数完全相同
+    df = make_grades(3000, 20, seed=2)
+    rng = np.random.default_rng(0)
+    cols = ["语文", "数学", "物理"]
+    for sbj in cols:
+        df[sbj] = df[sbj] + rng.random(len(df)).round(3) / 7
+    adf = al2.Andf(df)
+    dic = {sbj: np.array([0.6, 0.8, 1]) * 120 for sbj in cols}
+    for k in (10, 45, 1000):
+        got = adf._rate_stats(dic, cumu=True, include_count_valid=0, max_class_rank=k)
+        expected = al2.rate_stats_by_group(adf.get_df(["班级"] + cols, max_class_rank=k), "班级", dic, cumu=True)
+        assert got.columns.equals(expected.columns) and got.index.equals(expected.index)
+        means = [col for col in got.columns if col[1].startswith("mean")]
+        counts = [col for col in got.columns if col not in means]
+        assert means
+        pd.testing.assert_frame_equal(got[counts], expected[counts], check_dtype=False, check_exact=True)
+        np.testing.assert_allclose(got[means].to_numpy(float), expected[means].to_numpy(float), rtol=1e-14)
+
+
+def test_ladder_covers_slider_range_only():
+    # 阶梯只包含班次<=60的学生；超过上限的最大班次按筛选计算，两种结果都与计数引擎相同
+    df = make_grades(3000, 20, seed=4)
+    df.loc[df.index[::37], "数学"] = np.nan
+    adf = al2.Andf(df)
+    cols = ["语文", "数学", "物理"]
+    dic = {sbj: [0, 60, 90, 110, 120] for sbj in cols}
+    for k in (0, 15, 60, 61, 1000):
+        got = adf._count_bins(dic, cumu=0, mode=0, max_class_rank=k)
+        expected = al2.count_bins_by_group(adf.get_df(["班级"] + cols, max_class_rank=k), "班级", dic)
+        pd.testing.assert_frame_equal(got, expected)
+        got = adf._count_bins({"级次": [0, 100, 500, 3000]}, cumu=1, mode=1, max_class_rank=k)
+        expected = al2.count_bins_by_group(adf.get_df(["班级", "级次"], max_class_rank=k), "班级",
+                                           {"级次": [0, 100, 500, 3000]}, cumu=1, mode=1)
+        pd.testing.assert_frame_equal(got, expected)
+    ladder = adf._ladder()
+    assert len(ladder.rows) == (adf.get_all()["班次"] <= 60).sum() < len(df)
+    with pytest.raises(ValueError):
+        ladder.cut(61)
+
+
+def _legacy_all(df: pd.DataFrame, sbj_lst) -> pd.DataFrame:
+    # 改用计数引擎前Andf的全表：学科转为数值，总分求和，班次、级次用Series.rank排名
+    df = df.copy()
+    for sbj in sbj_lst:
+        df[sbj] = pd.to_numeric(df[sbj], errors='coerce')
+    df["总分"] = df[sbj_lst].sum(axis=1, min_count=1)
+    df["班次"] = df.groupby("班级")["总分"].rank(ascending=False, method="min")
+    df["级次"] = df["总分"].rank(ascending=False, method="min")
+    return df
+
+
+def _tuple_rank_table(df: pd.DataFrame, sbj_lst, max_class_rank=None) -> pd.DataFrame:
+    # 改用计数引擎前的名次表：学科名次与总分名次组合为元组（df_pair_cols）
+    df = _legacy_all(df, sbj_lst)
+    if max_class_rank is not None:
+        df = df[df["班次"] <= max_class_rank]
+    for col in sbj_lst + ["总分"]:
+        df[col] = df[col].rank(method="min", ascending=False)
+    return al2.df_pair_cols(df, sbj_lst, "总分")
+
+
+@pytest.mark.parametrize("marker", [None, "缺考"])
+def test_dual_cond_reports_match_tuple_path(marker):
+    # get_sdb、get_db与元组计数器（make_dual_cond_counters、count_dual_cond）的结果相同，包括"DC(a-b] T≤n"与"T>n"列
+    df = make_grades(1500, 12, nan_rate=0.05, absent_rate=0.02, absent_marker=marker, seed=5)
+    adf = al2.Andf(df)
+    sbj_lst = adf.get_sbj_lst()
+    thresh, score = [0, 100, 300, 600], [10, 9, 2, 1, 0]
+    for max_class_rank, max_total_rank in ((None, 200), (40, 500), (25, 0)):
+        df_mc = _tuple_rank_table(df, sbj_lst, max_class_rank)
+        counters = {sbj: al2.make_dual_cond_counters(thresh, sec_thresh=max_total_rank) for sbj in sbj_lst}
+        expected = al2.df_split_levels(df_mc.groupby("班级").agg(counters))
+
+        got = adf.get_sdb(thresh, thresh_score=0, max_class_rank=max_class_rank, max_total_rank=max_total_rank)
+        assert list(got) == sbj_lst
+        for sbj in sbj_lst:
+            assert got[sbj].columns.tolist()[-1] == f"DC(0-inf] T>{max_total_rank}"
+            pd.testing.assert_frame_equal(got[sbj], expected[sbj], check_names=False)
+
+        got = adf.get_sdb(thresh, thresh_score=score, max_class_rank=max_class_rank, max_total_rank=max_total_rank)
+        for sbj in sbj_lst:
+            ranked = al2.df_add_rank(expected[sbj], lst=score, sum_col_name="积分", dot_col_name="点积",
+                                     rank_col_name="排名")
+            pd.testing.assert_frame_equal(got[sbj], ranked, check_names=False)
+
+    df_mc = _tuple_rank_table(df, sbj_lst)[["班级"] + sbj_lst]
+    for a, b in ((40, 40), (100, 300)):
+        expected = df_mc.groupby("班级").agg(functools.partial(al2.count_dual_cond, a=a, b=b))
+        pd.testing.assert_frame_equal(adf.get_db(max_subject_rank=a, max_total_rank=b), expected)
+
+
+@pytest.mark.parametrize("step, counted", [(1, True), (0.5, True), (0.25, True), (0.1, False), (10 ** 6, False)])
+@pytest.mark.parametrize("ascending", [False, True])
+def test_rank_min_matches_pandas(step, counted, ascending):
+    # 整数、0.5分、0.25分使用计数排名；其他分数（或分数范围过大）使用pandas排名，结果都与pandas相同
+    rng = np.random.default_rng(7)
+    n = 2000
+    sr = pd.Series(rng.integers(0, 300, n) * step, index=rng.permutation(n) + 100, name="总分")
+    sr[rng.random(n) < 0.05] = np.nan
+    by = pd.Series(rng.integers(1, 9, n).astype(float), index=sr.index, name="班级")
+    by[rng.random(n) < 0.03] = np.nan
+
+    x = sr.to_numpy(dtype=float)
+    assert (al2._count_rank(x, ascending) is not None) == counted
+    pd.testing.assert_series_equal(al2.rank_min(sr, ascending=ascending),
+                                   sr.rank(method="min", ascending=ascending))
+    pd.testing.assert_series_equal(al2.rank_min(sr, ascending=ascending, by=by),
+                                   sr.groupby(by).rank(method="min", ascending=ascending))
+
+
+def test_rank_min_other_dtypes():
+    # 整数列、可空整数列、含无穷大的列与空列
+    sr = pd.Series([3, 1, 3, 2, 5, 1])
+    by = pd.Series(["a", "b", "a", None, "b", "a"])
+    for data in (sr, sr.astype("Int64"), sr.astype(float).replace(5, np.inf), sr.iloc[:0].astype(float)):
+        pd.testing.assert_series_equal(al2.rank_min(data), data.rank(method="min", ascending=False))
+        pd.testing.assert_series_equal(al2.rank_min(data, by=by.iloc[:len(data)]),
+                                       data.groupby(by.iloc[:len(data)]).rank(method="min", ascending=False))
+
+
+def _assert_reports_equal(got, expected):
+    assert list(got) == list(expected)
+    for key in expected:
+        pd.testing.assert_frame_equal(got[key], expected[key])
+
+
+@pytest.mark.parametrize("marker", [None, "缺考"])
+def test_score_cube_json_round_trip_matches_andf(marker):
+    # get_cube(k)与保存为json再读取的立方体，报表都与Andf同一最大班次的get_fsd、get_lv、get_cls相同
+    df = make_grades(1200, 10, nan_rate=0.04, absent_rate=0.02, absent_marker=marker, seed=6)
+    adf = al2.Andf(df)
+    sbj_lst = adf.get_sbj_lst()
+    k = 40
+    cube = adf.get_cube(k)
+    loaded = al2.ScoreCube.from_dict(json.loads(json.dumps(cube.to_dict())))
+    dic_fsd = {(0, 60, 72, 96, 108, 120): ["语文", "数学", "英语"], (0, 30, 42, 56, 63, 70): ["物理", "政治"]}
+    dic_lv = {120: ["语文", "数学", "英语"], 70: ["物理", "政治"], 50: ["化学", "生物", "历史", "地理"]}
+    cls_thresh = [0, 50, 100, 300, 600]
+    for c in (cube, loaded):
+        _assert_reports_equal(c.get_fsd(dic_fsd, thresh_score=[5, 4, 3, 2, 1]),
+                              adf.get_fsd(dic_fsd, thresh_score=[5, 4, 3, 2, 1], max_class_rank=k))
+        _assert_reports_equal(c.get_lv(dic_lv, thresh=[0.6, 0.8], include_count_valid=1),
+                              adf.get_lv(dic_lv, thresh=[0.6, 0.8], max_class_rank=k, include_count_valid=1))
+        _assert_reports_equal(c.get_lv(dic_lv, thresh=[0.6, 0.8], cumu=False),
+                              adf.get_lv(dic_lv, thresh=[0.6, 0.8], max_class_rank=k, cumu=False))
+        for cumu, mode in ((0, 1), (1, 0)):
+            pd.testing.assert_frame_equal(c.get_cls(cls_thresh, [4, 3, 2, 1], cumu=cumu, mode=mode),
+                                          adf.get_cls(cls_thresh, [4, 3, 2, 1], max_class_rank=k, cumu=cumu, mode=mode))
+    assert sbj_lst == loaded.sbj_lst and loaded.max_class_rank == k
+
+
+@pytest.mark.parametrize("marker", [None, "缺考"])
+def test_bin_reports_match_counter_path(marker):
+    # get_fsd、get_cls与逐组调用计数器（make_bin_counters）的结果相同，阶梯内外的最大班次都检查
+    df = make_grades(1500, 12, nan_rate=0.05, absent_rate=0.02, absent_marker=marker, seed=8)
+    adf = al2.Andf(df)
+    sbj_lst = adf.get_sbj_lst()
+    df_all = _legacy_all(df, sbj_lst)
+    dic_fsd = {(0, 60, 72, 96, 108, 120): ["语文", "数学", "英语"], (0, 30, 42, 56, 63, 70): ["物理", "政治"],
+               (0, 20, 30, 40, 45, 50): ["化学", "生物", "历史", "地理"]}
+    thresh_fsd = {sbj: thresh for thresh, sbjs in dic_fsd.items() for sbj in sbjs}
+    score = [5, 4, 3, 2, 1, 0]
+    for k in (40, 60, 1000):
+        df_k = df_all[df_all["班次"] <= k]
+        counters = {sbj: al2.make_bin_counters(list(thresh_fsd[sbj])) for sbj in sbj_lst}
+        expected = al2.df_split_levels(df_k.groupby("班级")[sbj_lst].agg(counters))
+        for sbj in sbj_lst:
+            expected[sbj] = al2.df_add_rank(expected[sbj], lst=score, sum_col_name="积分", dot_col_name="点积",
+                                            rank_col_name="点积排名")
+        got = adf.get_fsd(dic_fsd, thresh_score=score, max_class_rank=k)
+        assert list(got) == sbj_lst
+        for sbj in sbj_lst:
+            pd.testing.assert_frame_equal(got[sbj], expected[sbj], check_names=False)
+
+        for cumu, mode in ((0, 1), (1, 0), (1, 1)):
+            thresh = [0, 50, 100, 300, 600]
+            expected = df_k.groupby("班级")["级次"].agg(al2.make_bin_counters(thresh, cumu=cumu, mode=mode))
+            expected = al2.df_add_rank(expected, lst=[4, 3, 2, 1, 0], sum_col_name="总人数", dot_col_name="点积",
+                                       rank_col_name="排名")
+            got = adf.get_cls(thresh, [4, 3, 2, 1, 0], max_class_rank=k, cumu=cumu, mode=mode)
+            pd.testing.assert_frame_equal(got, expected, check_names=False)
+
+
+@pytest.mark.parametrize("marker", [None, "缺考"])
+def test_lv_matches_rate_counters(marker):
+    # get_lv与逐组调用两率一平统计函数（make_rate_counters）的结果相同：计数与比率完全相同，平均分在舍入范围内
+    df = make_grades(1500, 12, nan_rate=0.05, absent_rate=0.02, absent_marker=marker, seed=9)
+    adf = al2.Andf(df)
+    sbj_lst = adf.get_sbj_lst()
+    df_all = _legacy_all(df, sbj_lst)
+    dic_lv = {120: ["语文", "数学", "英语"], 70: ["物理", "政治"], 50: ["化学", "生物", "历史", "地理"]}
+    full = {sbj: total for total, sbjs in dic_lv.items() for sbj in sbjs}
+    for k in (40, 60, 1000):
+        df_k = df_all[df_all["班次"] <= k]
+        for cumu, include_count_valid in ((True, 0), (True, 1), (False, -1)):
+            funcs = {sbj: al2.make_rate_counters(np.array([0.6, 0.8, 1]) * full[sbj], cumu=cumu, include_mean=True,
+                                                 include_count_valid=include_count_valid) for sbj in sbj_lst}
+            expected = al2.df_split_levels(df_k.groupby("班级")[sbj_lst].agg(funcs))
+            got = adf.get_lv(dic_lv, thresh=[0.6, 0.8], max_class_rank=k, include_count_valid=include_count_valid,
+                             cumu=cumu)
+            assert list(got) == sbj_lst
+            for sbj in sbj_lst:
+                assert got[sbj].columns.equals(expected[sbj].columns)
+                pd.testing.assert_frame_equal(got[sbj], expected[sbj], check_names=False,
+                                              rtol=1e-12)
+
+
+def test_sdb_grid_matches_get_sdb():
+    # 阈值网格中每组(阈值, 最大校次)的积分与get_sdb()各学科表的"点积"列相同，双达标人数与区间人数之和相同
+    df = make_grades(1500, 12, nan_rate=0.05, absent_rate=0.02, absent_marker="缺考", seed=12)
+    adf = al2.Andf(df)
+    sbj_lst = adf.get_sbj_lst()
+    grid = [[0, 100, 300, 600], [0, 150, 250, 400, 800]]
+    totals = [0, 200, 450, 1500]
+    score = [10, 9, 2, 1, 0]
+    for max_class_rank in (None, 40):
+        got = adf.get_sdb_grid(grid, totals, thresh_score=score, max_class_rank=max_class_rank)
+        counts = adf.get_sdb_grid(grid, totals, thresh_score=None, max_class_rank=max_class_rank)
+        for thresh in grid:
+            label = "-".join(str(x) for x in thresh)
+            for b in totals:
+                sdb = adf.get_sdb(thresh, thresh_score=score, max_class_rank=max_class_rank, max_total_rank=b)
+                cells = got.loc[(label, b)]
+                raw = adf.get_sdb(thresh, thresh_score=0, max_class_rank=max_class_rank, max_total_rank=b)
+                for sbj in sbj_lst:
+                    np.testing.assert_array_equal(cells[sbj].to_numpy(), sdb[sbj]["点积"].to_numpy())
+                    # 双达标人数：区间(第一个阈值, 最后一个阈值]各列之和
+                    np.testing.assert_array_equal(counts.loc[(label, b), sbj].to_numpy(),
+                                                  raw[sbj].iloc[:, :len(thresh) - 1].sum(axis=1).to_numpy())
+
+
+def test_sdb_grid_unsorted_thresh_warns(capsys):
+    # 阈值未排序时发出警告（不打印到标准输出），结果与排序后的阈值相同
+    adf = al2.Andf(make_grades(300, 6, seed=14))
+    with pytest.warns(UserWarning, match="thresh 已自动排序"):
+        got = adf.get_sdb_grid([[0, 300, 100]], [0, 200])
+    assert capsys.readouterr().out == ""
+    expected = adf.get_sdb_grid([[0, 100, 300]], [0, 200])
+    np.testing.assert_array_equal(got.to_numpy(), expected.to_numpy())
+
+
+def test_add_rank_batch_matches_per_table():
+    # df_add_rank_batch()与逐表调用df_add_rank()相同：整数表批量计算，浮点、形状不同与点积有空值时逐表计算
+    rng = np.random.default_rng(13)
+    index = pd.Index([f"{i}班" for i in range(1, 9)], name="班级")
+
+    def table(kind):
+        data = rng.integers(0, 20, (len(index), 5))
+        if kind == "float":
+            data = data / 2
+        frame = pd.DataFrame(data, index=index, columns=list("abcde"))
+        if kind == "nan":
+            frame = frame.astype(float)
+            frame.iloc[2, 1] = np.nan
+        return frame
+
+    cases = {"int": {k: table("int") for k in "xyz"},
+             "float": {k: table("float") for k in "xyz"},
+             "mixed": {"x": table("int"), "y": table("float"), "z": table("int").iloc[:5]}}
+    for dfs in cases.values():
+        for lst, direction, position in (([10, 9, 2, 1, 0], 'first', 'left'), ([4, 3, 2], 'last', 'right'),
+                                         ([1, 1, 1, 1, 1, 1, 1], 'first', 'right')):
+            got = al2.df_add_rank_batch(dfs, lst=lst, direction=direction, position=position)
+            assert list(got) == list(dfs)
+            for key, frame in dfs.items():
+                expected = al2.df_add_rank(frame, lst=lst, direction=direction, position=position)
+                pd.testing.assert_frame_equal(got[key], expected)
+    # 点积有空值时与df_add_rank()一样报错
+    with pytest.raises(pd.errors.IntCastingNaNError):
+        al2.df_add_rank(table("nan"), lst=[1, 1, 1, 1, 1])
+    with pytest.raises(pd.errors.IntCastingNaNError):
+        al2.df_add_rank_batch({"x": table("int"), "y": table("nan")}, lst=[1, 1, 1, 1, 1])
+
+
+@pytest.mark.parametrize("na_rep", [None, "", "-"])
+def test_stream_sheet_matches_dfs_to_ws(na_rep):
+    # wb_to_bytesIO()流式写入的工作表与dfs_to_ws()写入后保存的单元格值、类型相同（含多级表头的空标签、空字符串）
+    import openpyxl
+
+    cols = pd.MultiIndex.from_tuples([("学号", ""), ("姓名", ""), ("语文", "分数"), ("语文", "名次"), ("总分", "")])
+    df = pd.DataFrame({cols[0]: [101, 102, 103], cols[1]: ["张三", "", None], cols[2]: [88.5, np.nan, 90.0],
+                       cols[3]: [2, 1, 3], cols[4]: [300, 280, 310]})
+
+    def readback(bio):
+        ws = openpyxl.load_workbook(bio)["名次表"]
+        return [[(c.value, c.data_type) for c in row] for row in ws.iter_rows()]
+
+    wb = openpyxl.Workbook()
+    al2.dfs_to_ws(wb.create_sheet("名次表"), 1, 1, df, hd=True, na_rep=na_rep)
+    expected = BytesIO()
+    wb.save(expected)
+    wb = openpyxl.Workbook()
+    wb.create_sheet("名次表")
+    got = al2.wb_to_bytesIO(wb, data_sheets={"名次表": df}, na_rep=na_rep)
+    assert readback(got) == readback(expected)
@@ -0,0 +1,21 @@
+"""longsea.batch 的回归测试。在仓库根目录运行：python -m pytest -q test"""
+
+import pytest
+
+from longsea import batch
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_bad_template_sheet_is_usage_error(tmp_path, capsys, jobs):
+    # 模板工作表不存在时在分发前报告为参数错误，与并行进程数无关
+    with pytest.raises(SystemExit) as exc:
+        batch.main([str(tmp_path), str(tmp_path / "out"), "--template-sheet", "没有这个表", "--jobs", jobs])
+    assert exc.value.code == 2
+    assert "没有这个表" in capsys.readouterr().err
+
+
+def test_missing_template_file_is_usage_error(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exc:
+        batch.main([str(tmp_path), str(tmp_path / "out"), "--template", str(tmp_path / "无.xlsx")])
+    assert exc.value.code == 2
+    assert "无法读取模板文件" in capsys.readouterr().err
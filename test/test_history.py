@@ -0,0 +1,56 @@
+"""longsea.history 的回归测试。在仓库根目录运行：python -m pytest -q test"""
+
+import warnings
+
+import pandas as pd
+import pytest
+
+from benchmarks.synth import make_grades
+from longsea import history
+
+warnings.simplefilter("ignore")
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def store(tmp_path) -> history.ExamStore:
+    store = history.ExamStore(str(tmp_path / "store"))
+    store.append("2026.09月考", make_grades(200, 6, seed=1))
+    store.append("2026.10月考", make_grades(200, 6, seed=2))
+    return store
+
+
+def test_trajectory_empty_ids(store):
+    # 空学号列表返回空表，行列与有学号时相同
+    wide = store.trajectory([])
+    assert wide.empty
+    assert wide.index.name == history.ID_COL
+    assert wide.columns.name == history.EXAM_COL
+    assert wide.columns.tolist() == ["2026.09月考", "2026.10月考"]
+    assert store.load(ids=[]).empty
+    assert store.student_exams([]) == {}
+
+    sid = store.load(columns=[history.ID_COL])[history.ID_COL].iloc[0]
+    assert store.trajectory([sid]).columns.equals(wide.columns)
+
+
+def test_append_mixed_type_columns(tmp_path):
+    # Excel中班级列混有数字与文本、姓名列混有数字时也能保存，读回为字符串
+    df = make_grades(120, 4, seed=3)
+    df["班级"] = df["班级"].astype(object)
+    df.loc[df.index[:5], "班级"] = "6班"
+    df["姓名"] = df["姓名"].astype(object)
+    df.loc[df.index[5], "姓名"] = 123
+    store = history.ExamStore(str(tmp_path / "store"))
+    assert store.append("2026.09月考", df) == len(df)
+    # 另一次考试的班级为整数列：与上一次考试的班级按同一个值分组
+    store.append("2026.10月考", make_grades(120, 4, seed=4))
+
+    loaded = store.load(exams=["2026.09月考"], columns=["学号", "姓名", "班级"])
+    assert loaded["班级"].map(type).eq(str).all()
+    assert set(loaded["班级"]) == {"1", "2", "3", "4", "6班"}
+    assert "123" in set(loaded["姓名"])
+
+    trend = store.class_trend("总分")
+    assert {"1", "2", "3", "4", "6班"} <= set(trend.index)
+    assert trend.loc["1"].notna().all()
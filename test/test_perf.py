@@ -0,0 +1,65 @@
+"""longsea.perf 的回归测试。在仓库根目录运行：python -m pytest -q test"""
+
+import threading
+import tracemalloc
+
+import pytest
+
+from longsea import perf
+
+
+@pytest.fixture(autouse=True)
+def no_tracing():
+    perf.disable()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    yield
+    perf.disable()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def test_session_disables_on_interrupt():
+    # streamlit以异常中断页面运行时，统计与tracemalloc也要关闭
+    class RerunException(Exception):
+        pass
+
+    with pytest.raises(RerunException):
+        with perf.session(memory=True):
+            assert perf.is_enabled() and tracemalloc.is_tracing()
+            raise RerunException()
+    assert not perf.is_enabled()
+    assert not tracemalloc.is_tracing()
+
+
+def test_session_disabled_is_noop():
+    with perf.session(False, memory=True):
+        assert not perf.is_enabled()
+        assert not tracemalloc.is_tracing()
+
+
+def test_disable_keeps_tracemalloc_started_elsewhere():
+    tracemalloc.start()
+    with perf.session(memory=True):
+        pass
+    assert tracemalloc.is_tracing()
+
+
+def test_disable_keeps_tracemalloc_used_by_other_thread():
+    entered, release = threading.Event(), threading.Event()
+
+    def other_session():
+        with perf.session(memory=True):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    entered.wait(5)
+    with perf.session(memory=True):
+        pass
+    # 另一个线程仍在统计内存峰值
+    assert tracemalloc.is_tracing()
+    release.set()
+    thread.join()
+    assert not tracemalloc.is_tracing()
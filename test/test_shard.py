@@ -0,0 +1,58 @@
+"""longsea.shard 的回归测试。在仓库根目录运行：python -m pytest -q test"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synth import make_grades
+from longsea import al2, shard
+
+warnings.simplefilter("ignore")
+
+
+@pytest.fixture
+def schools():
+    # 三个学校（班级不重复），第三个学校没有地理
+    df = make_grades(2400, 12, nan_rate=0.05, absent_rate=0.02, seed=11)
+    parts = {"一中": df[df["班级"] <= 4], "二中": df[df["班级"].between(5, 8)],
+             "三中": df[df["班级"] >= 9].drop(columns="地理")}
+    return df, parts
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sharded_ranks_match_concatenated(schools, jobs):
+    # 全区名次与把各校拼接成一个成绩表后排名相同（第三个学校缺少的学科为空值）
+    df, parts = schools
+    whole = al2.Andf(df.assign(地理=df["地理"].where(df["班级"] <= 8)))
+    sdf = shard.ShardedAndf(parts, jobs=jobs)
+    sdf.ranks((None, 45))
+    for name, part in parts.items():
+        adf = sdf.andf(name, (None, 45))
+        rows = part.index
+        got = adf.get_all()
+        pd.testing.assert_series_equal(got["级次"], whole.get_all().loc[rows, "级次"])
+        pd.testing.assert_series_equal(got["班次"], whole.get_all().loc[rows, "班次"])
+        for k in (None, 45):
+            expected = whole.get_mc(k, combine_ranks=0)
+            expected = expected[expected.index.isin(rows)]
+            got = adf.get_mc(k, combine_ranks=0)
+            cols = adf.get_sbj_lst() + ["总分"]
+            pd.testing.assert_frame_equal(got[cols], expected[cols])
+
+
+def test_single_shard_reports_match_andf(schools):
+    df, _ = schools
+    plan = [dict(name="mc", report="mc", max_class_rank=40),
+            dict(name="sdb", report="sdb", thresh=[0, 100, 300, 600], max_class_rank=40, max_total_rank=300),
+            dict(name="cls", report="cls", thresh=[0, 100, 300, 600], max_class_rank=40)]
+    got = shard.ShardedAndf({"全区": df}, jobs=1).build_reports(plan)["全区"]
+    expected = al2.Andf(df).build_reports(plan)
+    assert list(got) == list(expected)
+    for key in expected:
+        if isinstance(expected[key], dict):
+            for sub in expected[key]:
+                pd.testing.assert_frame_equal(got[key][sub], expected[key][sub])
+        else:
+            pd.testing.assert_frame_equal(got[key], expected[key])